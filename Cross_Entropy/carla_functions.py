@@ -9,8 +9,6 @@ import numpy as np
 import pandas as pd
 import time
 import csv
-from shapely.geometry import Polygon
-from shapely.affinity import rotate
 import pprint
 
 #sys.path.append("C:\\Users\\m.litton_local\\CARLA_Java\\")
@@ -19,6 +17,10 @@ sys.path.append("C:\\Users\\m.litton_local\\CARLA_Java\\carla")
 
 from agents.navigation.basic_agent import BasicAgent
 from agents.navigation.simple_agent import SimpleAgent
+from agents.tools.feature_store import FeatureStore
+from agents.tools.geometry import (bearing_angles, convex_polygons_distance, convex_polygons_intersect,
+                                   matched_polygons_distance, matched_polygons_intersect, oriented_boxes)
+from agents.tools.profiler import get_profiler
 from examples.Execute_scenario import read_csv
 
 # ==============================================================================
@@ -75,6 +77,8 @@ class CarlaScenario(object):
         adversary_target_speed = parameters[0]
         if self.adv_speed is None:
             self.adv_speed = adversary_target_speed
+        client = None
+        recorder_file = None
         try:
             client = carla.Client(args.host,args.port)
             client.set_timeout(4.0)
@@ -92,6 +96,10 @@ class CarlaScenario(object):
             spectator = world.get_spectator()
             spectator.set_transform(carla.Transform(carla.Location(x=-100,y=14,z=50),carla.Rotation(roll=0, pitch=-70,yaw=0)))
 
+            if getattr(args, 'recorder', None) is not None:
+                recorder_file = self.recorder_file_name(args, purpose)
+                client.start_recorder(recorder_file)
+
             blueprints = world.get_blueprint_library()
             ego_blueprint = blueprints.filter("vehicle.dodge.charger_police")[0]
             ego_blueprint.set_attribute('role_name','ego')
@@ -111,8 +119,10 @@ class CarlaScenario(object):
             adversary_sp_mod = carla.Transform(carla.Location(adversary_spawn_point.location-carla.Location(x=10)),adversary_spawn_point.rotation)
             self.adv = self.world.try_spawn_actor(adversary_blueprint,adversary_spawn_point)
 
+            profiler = get_profiler()
             for i in range(0,30):
-                world.tick()
+                with profiler.section('tick'):
+                    world.tick()
             
             ego_agent = BasicAgent(self.ego, target_speed = self.ego_speed,opt_dict={'ignore_traffic_lights':'True','base_vehicle_threshold':20.0})
             ego_destination = spawn_points[self.ego_dest].location
@@ -172,7 +182,8 @@ class CarlaScenario(object):
                 
             """ 
             while True:
-                world.tick()
+                with profiler.section('tick'):
+                    world.tick()
         except KeyboardInterrupt:
                 flag = -1
                 print("Execute_scenario cancelled by user!") 
@@ -184,6 +195,8 @@ class CarlaScenario(object):
                         world.debug.draw_box(box[0],box[1].rotation,0.1,carla.Color(0,255,0),1)
             if(bounding_boxes_closest is not None):
                 CarlaScenario.bb_final_code(bounding_boxes_closest)
+            if recorder_file is not None:
+                client.stop_recorder()
             if world is not None:
                 settings = world.get_settings()
                 settings.synchronous_mode = False
@@ -195,6 +208,12 @@ class CarlaScenario(object):
                     self.adv.destroy()
             return self.score, flag
     
+    def recorder_file_name(self, args, purpose):
+        #one recording of the simulator per sample, absolute so the simulator doesn't write it to its own directory
+        time_str = time.strftime("%Y%m%d-%H%M%S")
+        file_name = f"{time_str}_{purpose}_adv{self.adv_speed:.4f}.log"
+        return os.path.abspath(os.path.join(args.recorder, file_name))
+
     def assign_parameters(self, file):
         df = pd.read_csv(file)
         self.ego_start = df['ego_start'][0]
@@ -258,78 +277,106 @@ class CarlaScenario(object):
             writer = csv.writer(f)
             writer.writerow(['ego_start','ego_dest','ego_speed','adv_start','adv_dest','adv_vel'])
             writer.writerow([self.ego_start, self.ego_dest,self.ego_speed,self.adv_start,self.adv_dest,self.adv_speed])
+        with FeatureStore(data_path) as store:
+            store.add(full_path, label=0, score=self.score,
+                      parameters={'ego_start': self.ego_start, 'ego_dest': self.ego_dest, 'ego_speed': self.ego_speed,
+                                  'adv_start': self.adv_start, 'adv_dest': self.adv_dest, 'adv_speed': self.adv_speed})
 
     @abstractmethod
-    def bb_test_code(bounding_boxes):
-        polygons = {}
-        transforms = {}
-        for bb in bounding_boxes:
-            vertices = bb[0].get_local_vertices()
-            coords = []
-            for vert in vertices:
-                if(vert.z > 0):
-                    coords.append((vert.x,vert.y))
-            coords_copy = coords[:]
-            coords[-2] = coords_copy[-1]
-            coords[-1] = coords_copy[-2]
-            p = Polygon(coords)
-            carla_yaw = bb[1].rotation.yaw
-            if(carla_yaw > 0):
-                p = rotate(p,carla_yaw - 90)
-            elif(carla_yaw < 0):
-                p = rotate(p,abs(carla_yaw) + 90)
-            polygons[bb[2]] = p
-            transforms[bb[2]] = bb[1]
-            #print(bb[2],list(p.exterior.coords))
-        
-        ego_vec = (transforms['ego'].get_forward_vector().x,transforms['ego'].get_forward_vector().y)
-        diff_vec = transforms['adversary'].location - transforms['ego'].location 
-        angle = CarlaScenario.angle_between(ego_vec,(diff_vec.x,diff_vec.y))
-        dist = polygons['ego'].distance(polygons['adversary'])
-        accident = polygons['ego'].intersects(polygons['adversary'])
+    def bb_rotations(yaws, final=False):
+        #rotation of the footprints of the boxes: yaw - 90 for a positive yaw, abs(yaw) + 90 for a negative one
+        #(180 + yaw + 90 in bb_final_code), none for a null yaw
+        yaws = np.asarray(yaws, dtype=np.float64)
+        negative = (180 + yaws + 90) if final else (np.abs(yaws) + 90)
+        return np.where(yaws > 0, yaws - 90, np.where(yaws < 0, negative, 0.0))
+
+    @abstractmethod
+    def bb_footprints(locations, yaws, extents, final=False):
+        """
+        (..., 4, 2) corners of the polygons bb_test_code builds from carla.BoundingBoxes at
+        'locations' with 'extents' (the x and y of their extent) for actors with 'yaws', in
+        the order of their top vertices. The boxes are assumed to reach the ground, as the
+        z of their location is below their z extent.
+        """
+        locations = np.asarray(locations, dtype=np.float64)
+        shape = locations.shape[:-1]
+        extents = np.broadcast_to(np.asarray(extents, dtype=np.float64), shape + (2,))
+        rotations = np.broadcast_to(CarlaScenario.bb_rotations(yaws, final), shape)
+        corners = oriented_boxes(locations.reshape(-1, 2), rotations.reshape(-1), np.zeros((rotations.size, 2)),
+                                 extents.reshape(-1, 2))
+        #oriented_boxes starts at the (+x,+y) corner, the top vertices of the box at (-x,-y)
+        return np.roll(corners, -2, axis=1).reshape(shape + (4, 2))
+
+    @abstractmethod
+    def bb_trace_code(ego_locations, ego_yaws, ego_extents, adv_locations, adv_yaws, adv_extents, final=False):
+        """
+        bb_test_code for every frame of a trace at once, from the (T, 2) locations and (T,)
+        yaws of the ego and the adversary, and the extents of their boxes ((2,) or (T, 2)).
+
+            :return: (accident, dist, angle), three (T,) arrays
+        """
+        ego_locations = np.asarray(ego_locations, dtype=np.float64)
+        adv_locations = np.asarray(adv_locations, dtype=np.float64)
+        ego = CarlaScenario.bb_footprints(ego_locations, ego_yaws, ego_extents, final)
+        adv = CarlaScenario.bb_footprints(adv_locations, adv_yaws, adv_extents, final)
+        ego_yaws = np.radians(np.asarray(ego_yaws, dtype=np.float64))
+        ego_vec = np.stack((np.cos(ego_yaws), np.sin(ego_yaws)), axis=-1)
+        angle = bearing_angles(ego_vec, adv_locations - ego_locations)
+        return matched_polygons_intersect(ego, adv), matched_polygons_distance(ego, adv), angle
+
+    @abstractmethod
+    def bb_arrays(bounding_boxes, final=False):
+        """(roles, polygons, forward vectors, locations) of the (box, transform, role) tuples of a frame"""
+        roles = [bb[2] for bb in bounding_boxes]
+        polygons = CarlaScenario.bb_footprints(
+            np.array([(bb[0].location.x, bb[0].location.y) for bb in bounding_boxes]).reshape(-1, 2),
+            np.array([bb[1].rotation.yaw for bb in bounding_boxes]),
+            np.array([(bb[0].extent.x, bb[0].extent.y) for bb in bounding_boxes]).reshape(-1, 2), final)
+        forward = [bb[1].get_forward_vector() for bb in bounding_boxes]
+        forward = np.array([(v.x, v.y) for v in forward]).reshape(-1, 2)
+        locations = np.array([(bb[1].location.x, bb[1].location.y) for bb in bounding_boxes]).reshape(-1, 2)
+        return roles, polygons, forward, locations
+
+    @abstractmethod
+    def bb_pairs_code(bounding_boxes, final=False):
+        """
+        bb_test_code between all the actors of a frame: (roles, accident, dist, angle), with
+        (V, V) arrays, angle[i, j] being the angle from the forward vector of actor i to actor j
+        """
+        roles, polygons, forward, locations = CarlaScenario.bb_arrays(bounding_boxes, final)
+        angle = bearing_angles(forward[:, None], locations[None] - locations[:, None])
+        return roles, convex_polygons_intersect(polygons, polygons), convex_polygons_distance(polygons, polygons), angle
+
+    @abstractmethod
+    def bb_ego_adversary(roles, polygons, forward, locations):
+        #the last box of a role is the one used, as in a dict of the boxes by role
+        index = {role: k for k, role in enumerate(roles)}
+        i, j = index['ego'], index['adversary']
+        angle = float(bearing_angles(forward[i], locations[j] - locations[i]))
+        dist = float(matched_polygons_distance(polygons[i:i + 1], polygons[j:j + 1])[0])
+        accident = bool(matched_polygons_intersect(polygons[i:i + 1], polygons[j:j + 1])[0])
         return (accident, dist, angle)
 
+    @abstractmethod
+    def bb_test_code(bounding_boxes):
+        return CarlaScenario.bb_ego_adversary(*CarlaScenario.bb_arrays(bounding_boxes))
+
     @abstractmethod
     def bb_final_code(bounding_boxes):
-        polygons = {}
+        roles, polygons, forward, locations = CarlaScenario.bb_arrays(bounding_boxes, final=True)
         transforms = {}
-        for bb in bounding_boxes:
-            vertices = bb[0].get_local_vertices()
-            coords = []
-            for vert in vertices:
-                if(vert.z > 0):
-                    coords.append((vert.x,vert.y))
-            coords_copy = coords[:]
-            coords[-2] = coords_copy[-1]
-            coords[-1] = coords_copy[-2]
-            p = Polygon(coords)
-            #print(bb[2],list(p.exterior.coords))
-            carla_yaw = bb[1].rotation.yaw
-            if(carla_yaw > 0):
-                p = rotate(p,carla_yaw - 90)
-            elif(carla_yaw < 0):
-                #p = rotate(p,abs(carla_yaw) + 90)
-                p = rotate(p,(180+carla_yaw) + 90)
-            polygons[bb[2]] = p
+        for bb, corners in zip(bounding_boxes, polygons.tolist()):
             transforms[bb[2]] = bb[1]
-            print(bb[2],list(p.exterior.coords), carla_yaw)
-        
+            print(bb[2], [tuple(c) for c in corners + corners[:1]], bb[1].rotation.yaw)
+        accident, dist, angle = CarlaScenario.bb_ego_adversary(roles, polygons, forward, locations)
         ego_vec = (transforms['ego'].get_forward_vector().x,transforms['ego'].get_forward_vector().y)
-        diff_vec = transforms['adversary'].location - transforms['ego'].location 
-        angle = CarlaScenario.angle_between(ego_vec,(diff_vec.x,diff_vec.y))
-        dist = polygons['ego'].distance(polygons['adversary'])
-        accident = polygons['ego'].intersects(polygons['adversary'])
+        diff_vec = transforms['adversary'].location - transforms['ego'].location
         print(ego_vec, diff_vec, angle, dist, accident)
         
     @abstractmethod
     #pass the ego vector first
     def angle_between(v1,v2):
-        v1_u = v1/np.linalg.norm(v1)
-        v2_u = v2/np.linalg.norm(v2)
-        angle =  math.degrees(math.atan2(v1_u[0],v1_u[1]) - math.atan2(v2_u[0],v2_u[1]))
-        if(angle < 0 and abs(angle) > 180): angle +=360
-        if(angle > 180): angle = angle-360
-        return angle
+        return float(bearing_angles(v1, v2))
                 
     @abstractmethod
     def draw_location(world, location, draw_time = 10):
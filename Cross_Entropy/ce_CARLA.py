@@ -32,6 +32,7 @@ import random
 
 from cross_entropy import CrossEntropy
 from normal_distrib import NormalDistrib
+from agents.tools.profiler import get_profiler
 
 def main():
     program_start_time = time.time()
@@ -52,7 +53,24 @@ def main():
         '--no_render',
         action = 'store_true',
         help='Render graphics (default: False)')
+    argparser.add_argument(
+        '--profile',
+        action = 'store_true',
+        help='Time the sections of the scenarios and print a summary per episode and per round (default: False)')
+    argparser.add_argument(
+        '--profile_trace',
+        help='Also write a Chrome trace of the sections to this file, and folded stacks next to it (default: None)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--recorder',
+        help='Directory to record every sample to with the recorder of the simulator (default: None)',
+        default=None,
+        type=str)
     args = argparser.parse_args()
+    profiler = get_profiler()
+    if args.profile or args.profile_trace is not None:
+        profiler.enable(trace=args.profile_trace is not None)
 
     try:
         
@@ -146,6 +164,9 @@ def main():
             time.sleep(4)
         
     finally:
+        if args.profile_trace is not None:
+            profiler.write_chrome_trace(args.profile_trace)
+            profiler.write_folded(os.path.splitext(args.profile_trace)[0] + '.folded')
         print(f"TOTAL RUN TIME: {time.time()-program_start_time}")
 
 if __name__ == '__main__':
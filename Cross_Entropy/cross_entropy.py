@@ -4,6 +4,9 @@ from normal_distrib import NormalDistrib
 import numpy as np
 import time
 from carla_functions import CarlaScenario
+from agents.tools.episode_recording import EpisodeRecording
+from agents.tools.profiler import get_profiler
+from examples.Execute_scenario import visual_replay
 
 class CrossEntropy(object):
     def __init__(self, N, rho, gamma, distributions):
@@ -60,6 +63,7 @@ class CrossEntropy(object):
     def execute_ce_good(self, args):
         gamma = 0
         round = 0
+        profiler = get_profiler()
         #while(gamma > self.gamma): #use this for searching for "bad"
         while (gamma < self.gamma):
             print(f"*****Beginning Round {round}*****")
@@ -68,9 +72,11 @@ class CrossEntropy(object):
             scores = np.empty(y.shape)
             for i in range(np.shape(y)[0]):
                 cs = CarlaScenario()
-                ret = cs.execute_scenario(args, y[i,:],"search")
+                with profiler.section('episode'):
+                    ret = cs.execute_scenario(args, y[i,:],"search")
                 scores[i,0] = ret[0]
                 print(f"Completed\t{i+1}/{np.shape(y)[0]}")
+                if profiler.enabled: print(profiler.end_episode())
                 if ret[1]<0:
                     print("CE Loop cancelled by user!")
                     return
@@ -81,11 +87,13 @@ class CrossEntropy(object):
             self.print_distribution_parameters()
             print(f"Gamma:{gamma}")
             print(f"\n*****Round: {round} took {time.time()-round_start_time}*****")
+            if profiler.enabled: print(profiler.end_round())
             round += 1
     
     def execute_ce_bad(self, args):
         gamma = 100
         round = 0
+        profiler = get_profiler()
         while(gamma > self.gamma): #use this for searching for "bad"
             print(f"*****Beginning Round {round}*****")
             round_start_time = time.time()
@@ -93,9 +101,11 @@ class CrossEntropy(object):
             scores = np.empty(y.shape)
             for i in range(np.shape(y)[0]):
                 cs = CarlaScenario()
-                ret = cs.execute_scenario(args, y[i,:],"search")
+                with profiler.section('episode'):
+                    ret = cs.execute_scenario(args, y[i,:],"search")
                 scores[i,0] = ret[0]
                 print(f"Completed\t{i+1}/{np.shape(y)[0]}")
+                if profiler.enabled: print(profiler.end_episode())
                 if ret[1]<0:
                     print("CE Loop cancelled by user!")
                     return
@@ -106,6 +116,7 @@ class CrossEntropy(object):
             self.print_distribution_parameters()
             print(f"Gamma:{gamma}")
             print(f"\n*****Round: {round} took {time.time()-round_start_time}*****")
+            if profiler.enabled: print(profiler.end_round())
             round += 1
     
     def calculate_elite_bad(self, y, scores):
@@ -154,6 +165,13 @@ class CrossEntropy(object):
                     return
 
     def replay(self, args, file):
+        #a recording of Execute_scenario.py --record is played as it was recorded, without simulating the agents
+        if file.endswith('.npz'):
+            try:
+                visual_replay(args, EpisodeRecording(file))
+            except KeyboardInterrupt:
+                return -1
+            return 0
         cs = CarlaScenario()
         ret = cs.execute_scenario(args, [1.0], "replay", file)
         return ret[1]
@@ -0,0 +1,838 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Client side surrogate of the ego/adversary scenarios, used to pre-screen candidates.
+
+The vehicles are kinematic bicycle models driven by the same controllers as in the
+simulator: the adversary by a SimpleAgent following the points of its path, the ego by a
+VehiclePIDController following its route, with the LocalPlanner waypoint handling and an
+emergency stop when a vehicle is in front of it, as BasicAgent does. The routes come from
+a RoadGraph saved with RoadGraph.save, so no simulator is needed.
+
+Each episode returns an approximation of the minimum distance, the minimum time to
+collision and the STL robustness of the scoring specification of Execute_scenario.py.
+Only the candidates whose approximate robustness is low enough need a real episode.
+The episodes of all the candidates are stepped together on arrays by EpisodeBatch;
+--serial runs them one at a time with the agents instead, as a reference.
+
+    python surrogate.py --episodes 500
+    python surrogate.py --road_graph graphs/Town10HD --ego_start -41.7 50.9 --ego_end -114.6 -2.9 --files paths/
+"""
+
+import argparse
+import csv
+import glob
+import math
+import os
+import sys
+import time
+import types
+
+import numpy as np
+
+try:
+    sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
+        sys.version_info.major,
+        sys.version_info.minor,
+        'win-amd64' if os.name == 'nt' else 'linux-x86_64'))[0])
+except IndexError:
+    pass
+
+try:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+except IndexError:
+    pass
+
+import carla
+
+from agents.navigation.controller import PIDErrorBuffer, VehiclePIDController
+from agents.navigation.local_planner import RoadOption, WaypointPlan
+from agents.navigation.multi_agent_stepper import BatchErrorBuffer
+from agents.navigation.road_graph import RoadGraph
+from agents.navigation.simple_agent import SimpleAgent
+from agents.tools.path_catalog import PathCatalog
+from agents.tools.path_file import read_path
+
+
+# Half length and half width of the vehicles
+EGO_EXTENT = (2.5, 1.0)
+ADVERSARY_EXTENT = (0.9, 0.4)
+
+# PID parameters of the ego controllers, and the fixed ones of SimpleAgent
+EGO_LATERAL_PID = {'K_P': 1.95, 'K_I': 0.05, 'K_D': 0.2}
+EGO_LONGITUDINAL_PID = {'K_P': 1.0, 'K_I': 0.05, 'K_D': 0}
+ADVERSARY_PID = {'K_P': 1.0, 'K_I': 0.0, 'K_D': 0.0, 'dt': 0.03}
+
+
+# ==============================================================================
+# -- Kinematic vehicles ----------------------------------------------------------
+# ==============================================================================
+
+class SurrogateWorld(object):
+    """The agents only keep a reference to the map, the surrogate doesn't need one"""
+
+    def get_map(self):
+        return None
+
+
+class KinematicVehicle(object):
+    """
+    Kinematic bicycle model with the methods of carla.Vehicle used by the agents.
+    Throttle and brake are mapped linearly to an acceleration.
+    """
+
+    def __init__(self, actor_id, transform, extent=(2.4, 1.0), dt=0.05, wheelbase=2.9,
+                 max_accel=4.0, max_decel=8.0, max_steer_angle=70.0, world=None):
+        """
+        :param actor_id: id of the vehicle
+        :param transform: initial carla.Transform
+        :param extent: half length and half width of the bounding box
+        :param dt: time step, in seconds
+        """
+        self.id = actor_id
+        self.bounding_box = carla.BoundingBox(carla.Location(), carla.Vector3D(extent[0], extent[1], 0.8))
+        self._world = world if world is not None else SurrogateWorld()
+        self._x = transform.location.x
+        self._y = transform.location.y
+        self._z = transform.location.z
+        self._yaw = math.radians(transform.rotation.yaw)
+        self.speed = 0.0
+        self._transform = None
+        self._control = carla.VehicleControl()
+        self._dt = dt
+        self._wheelbase = wheelbase
+        self._max_accel = max_accel
+        self._max_decel = max_decel
+        self._max_steer_angle = math.radians(max_steer_angle)
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        # Built once per tick, the agents read it several times
+        if self._transform is None:
+            self._transform = carla.Transform(carla.Location(self._x, self._y, self._z),
+                                              carla.Rotation(yaw=math.degrees(self._yaw)))
+        return self._transform
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return carla.Vector3D(self.speed * math.cos(self._yaw), self.speed * math.sin(self._yaw), 0.0)
+
+    def get_control(self):
+        return self._control
+
+    def apply_control(self, control):
+        self._control = control
+
+    @property
+    def state(self):
+        """(x, y, yaw in radians, speed in m/s)"""
+        return self._x, self._y, self._yaw, self.speed
+
+    def tick(self):
+        """Moves the vehicle one time step with its last control"""
+        control = self._control
+        accel = self._max_accel * control.throttle - self._max_decel * control.brake
+        self.speed = max(0.0, self.speed + accel * self._dt)
+        steer_angle = control.steer * self._max_steer_angle
+        self._x += self.speed * math.cos(self._yaw) * self._dt
+        self._y += self.speed * math.sin(self._yaw) * self._dt
+        self._yaw += self.speed / self._wheelbase * math.tan(steer_angle) * self._dt
+        self._transform = None
+
+
+class SurrogateWaypoint(object):
+    """Minimal carla.Waypoint stand-in, the controllers only read its transform"""
+
+    __slots__ = ('transform',)
+
+    def __init__(self, transform):
+        self.transform = transform
+
+
+# ==============================================================================
+# -- Ego driver ------------------------------------------------------------------
+# ==============================================================================
+
+class RouteFollower(object):
+    """
+    Ego driver of the surrogate: the route following of LocalPlanner and the vehicle
+    obstacle check of BasicAgent, without the map queries.
+    """
+
+    def __init__(self, vehicle, route, target_speed=9.0, base_vehicle_threshold=10.0, dt=0.05,
+                 base_min_distance=3.0, max_brake=0.5, lane_half_width=1.75):
+        """
+        :param vehicle: KinematicVehicle
+        :param route: list of carla.Transform to follow
+        :param target_speed: speed in Km/h
+        :param base_vehicle_threshold: distance at which vehicles in front make it stop, in meters
+        """
+        self._vehicle = vehicle
+        self._target_speed = target_speed
+        self._base_vehicle_threshold = base_vehicle_threshold
+        self._base_min_distance = base_min_distance
+        self._max_brake = max_brake
+        self._lane_half_width = lane_half_width
+        self._plan = WaypointPlan(maxlen=max(10000, len(route)))
+        self._plan.extend([(SurrogateWaypoint(t), RoadOption.LANEFOLLOW) for t in route])
+        self._controller = VehiclePIDController(
+            vehicle,
+            args_lateral=dict(EGO_LATERAL_PID, dt=dt),
+            args_longitudinal=dict(EGO_LONGITUDINAL_PID, dt=dt),
+            max_throttle=0.75, max_brake=0.3, max_steering=0.8)
+
+    def done(self):
+        return len(self._plan) == 0
+
+    def obstacle_ahead(self, others):
+        """Whether a vehicle is in the lane ahead, closer than the threshold (front to rear)"""
+        x, y, yaw, speed = self._vehicle.state
+        max_distance = self._base_vehicle_threshold + speed
+        cos_yaw, sin_yaw = math.cos(yaw), math.sin(yaw)
+        front = self._vehicle.bounding_box.extent.x
+        for other in others:
+            ox, oy, _, _ = other.state
+            dx, dy = ox - x, oy - y
+            ahead = dx * cos_yaw + dy * sin_yaw - front - other.bounding_box.extent.x
+            lateral = abs(-dx * sin_yaw + dy * cos_yaw)
+            if 0.0 <= ahead <= max_distance and lateral <= self._lane_half_width + other.bounding_box.extent.y:
+                return True
+        return False
+
+    def run_step(self, others=()):
+        self._plan.purge(self._vehicle.get_location(), self._base_min_distance + 0.5 * self._vehicle.speed,
+                         last_min_distance=1)
+        if len(self._plan) == 0:
+            control = carla.VehicleControl()
+            control.brake = 1.0
+            return control
+
+        control = self._controller.run_step(self._target_speed, self._plan[0][0])
+        if self.obstacle_ahead(others):
+            control.throttle = 0.0
+            control.brake = self._max_brake
+        return control
+
+
+# ==============================================================================
+# -- Metrics ---------------------------------------------------------------------
+# ==============================================================================
+
+def stl_robustness(distance, ego_speed, near_distance=5.0, stop_speed=0.1, horizon=10, never_near=2.0):
+    """
+    Robustness of 'always((distance < near_distance) implies (eventually[0:horizon](ego_speed < stop_speed)))'
+    over sampled signals, as Execute_scenario.score_log computes it with the output robustness
+    semantics of rtamt: distance is an input, so its predicate is +inf or -inf, and only the
+    margin of the ego speed is measured, on the samples where the ego is near. The time unit
+    is the sample and the windows of the last samples are cut at the end of the signals.
+
+    When the ego is never near, the robustness is +inf and 'never_near' is returned instead,
+    as score_log does.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    ego_speed = np.asarray(ego_speed, dtype=np.float64)
+    if not len(distance):
+        return never_near
+    stopped = stop_speed - ego_speed
+    # eventually[0:horizon]: maximum over the window of the following samples
+    eventually = stopped.copy()
+    for k in range(1, horizon + 1):
+        eventually[:-k] = np.maximum(eventually[:-k], stopped[k:])
+    implies = np.where(distance < near_distance, eventually, np.inf)
+    robustness = float(implies.min())
+    return never_near if math.isinf(robustness) else robustness
+
+
+def rtamt_robustness(distance, ego_speed):
+    """
+    Score of the same signals given by Execute_scenario.score_log, with rtamt and the
+    specification of Execute_scenario.score_specification, to check stl_robustness.
+    rtamt needs at least 11 samples.
+    """
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples'))
+    from Execute_scenario import score_log
+
+    scenario = types.SimpleNamespace(score=0, frame=0)
+    rows = [[t, float(d), float(v)] for t, (d, v) in enumerate(zip(distance, ego_speed))]
+    score_log(scenario, ['time', 'distance', 'ego_speed'], rows)
+    return scenario.score
+
+
+def time_to_collision(distance, dt):
+    """Time to collision of every sample, from the rate of change of the distance (inf if not closing)"""
+    distance = np.asarray(distance, dtype=np.float64)
+    ttc = np.full(len(distance), np.inf)
+    if len(distance) > 1:
+        closing = (distance[:-1] - distance[1:]) / dt
+        with np.errstate(divide='ignore'):
+            ttc[1:] = np.where(closing > 0.0, distance[1:] / closing, np.inf)
+    return ttc
+
+
+class EpisodeResult(object):
+    """Outcome of a surrogate episode"""
+
+    __slots__ = ('min_distance', 'min_ttc', 'robustness', 'accident', 'ticks', 'end_reason')
+
+    def __init__(self, min_distance, min_ttc, robustness, accident, ticks, end_reason):
+        self.min_distance = min_distance
+        self.min_ttc = min_ttc
+        self.robustness = robustness
+        self.accident = accident
+        self.ticks = ticks
+        self.end_reason = end_reason
+
+    def as_row(self):
+        return [self.min_distance, self.min_ttc, self.robustness, int(self.accident), self.ticks, self.end_reason]
+
+
+# ==============================================================================
+# -- Episodes --------------------------------------------------------------------
+# ==============================================================================
+
+def run_episode(ego_route, adversary_destinations, adversary_accels, ego_speed=9.0,
+                ego_vehicle_threshold=10.0, dt=0.05, max_ticks=3000, accident_distance=3.0, traces=None):
+    """
+    Runs one scenario as Execute_scenario.execute_scenario does: the adversary starts at its
+    first destination and goes through the others, with the target speed of every leg given
+    by its acceleration, while the ego follows its route.
+
+        :param ego_route: list of carla.Transform, the first one is the ego spawn point
+        :param adversary_destinations: list of carla.Location
+        :param adversary_accels: acceleration of every leg of the adversary path
+        :param traces: if given, list the (distances, ego speeds in Km/h) of the episode are appended to
+        :return: EpisodeResult
+    """
+    world = SurrogateWorld()
+    ego = KinematicVehicle(0, ego_route[0], extent=EGO_EXTENT, dt=dt, world=world)
+    adversary_start = carla.Transform(adversary_destinations[0], carla.Rotation())
+    adversary = KinematicVehicle(1, adversary_start, extent=ADVERSARY_EXTENT, dt=dt, world=world)
+
+    dest_index = 1
+    destination = adversary_destinations[dest_index]
+    leg_distance = math.hypot(destination.x - adversary_start.location.x, destination.y - adversary_start.location.y)
+    target_speed = adversary_accels[dest_index - 1] * (leg_distance / 1 * 3.6)
+    adversary_agent = SimpleAgent(adversary, destination, target_speed=target_speed)
+    ego_agent = RouteFollower(ego, ego_route[1:], target_speed=ego_speed,
+                              base_vehicle_threshold=ego_vehicle_threshold, dt=dt)
+
+    distances, ego_speeds = [], []
+    accident = False
+    end_reason = 'max_ticks'
+    ticks = 0
+    for ticks in range(1, max_ticks + 1):
+        ego.tick()
+        adversary.tick()
+
+        ex, ey, _, ego_v = ego.state
+        ax, ay, _, adversary_v = adversary.state
+        distance = math.hypot(ex - ax, ey - ay)
+        distances.append(distance)
+        ego_speeds.append(3.6 * ego_v)
+
+        if ticks % 200 == 0 and 3.6 * adversary_v < 0.1:
+            end_reason = 'stuck'
+            break
+        if distance < accident_distance:
+            accident = True
+            end_reason = 'accident'
+            break
+
+        if adversary_agent.done():
+            if dest_index >= len(adversary_destinations) - 1:
+                end_reason = 'adversary_done'
+                break
+            dest_index += 1
+            destination = adversary_destinations[dest_index]
+            current_speed = max(3.6 * adversary_v, 0.1)
+            leg_distance = math.hypot(destination.x - ax, destination.y - ay)
+            target_speed = current_speed + adversary_accels[dest_index - 1] * (leg_distance / current_speed * 3.6)
+            adversary_agent.set_destination(destination)
+            adversary_agent.set_target_speed(target_speed)
+
+        if ego_agent.done():
+            end_reason = 'ego_done'
+            break
+
+        control = adversary_agent.run_step()
+        adversary.apply_control(control)
+        ego.apply_control(ego_agent.run_step((adversary,)))
+
+    if traces is not None:
+        traces.append((distances, ego_speeds))
+    return EpisodeResult(
+        min_distance=float(min(distances)) if distances else float('inf'),
+        min_ttc=float(time_to_collision(distances, dt).min()) if distances else float('inf'),
+        robustness=stl_robustness(distances, ego_speeds),
+        accident=accident,
+        ticks=ticks,
+        end_reason=end_reason)
+
+
+def _steering_errors(wx, wy, vx, vy):
+    """Vectorized controller.steering_error, from the vectors to the targets and the forward vectors"""
+    wv_linalg = np.sqrt(wx * wx + wy * wy) * np.sqrt(vx * vx + vy * vy)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        _dot = np.arccos(np.clip((wx * vx + wy * vy) / wv_linalg, -1.0, 1.0))
+    _dot = np.where(wv_linalg == 0, 1.0, _dot)
+    return np.where(vx * wy - vy * wx < 0, -_dot, _dot)
+
+
+def _pid(buffer, rows, errors, args, dt):
+    """Vectorized PID of the rows of a BatchErrorBuffer, with the K_P, K_I and K_D of 'args'"""
+    buffer.append(rows, errors)
+    _de, _ie = buffer.derivative_and_integral(rows, dt)
+    return np.clip(args['K_P'] * errors + args['K_D'] * _de + args['K_I'] * _ie, -1.0, 1.0)
+
+
+class EpisodeBatch(object):
+    """
+    Runs many episodes together, with the same rules as run_episode. The vehicles, the
+    controllers and the plans of every episode are rows of arrays (row 0 of the vehicle
+    arrays is the ego, row 1 the adversary), and each tick steps all the running episodes
+    with NumPy, as MultiAgentStepper does for the agents of a simulation. The episodes that
+    end are dropped from the rows stepped at the next tick.
+    """
+
+    def __init__(self, candidates, ego_speed=9.0, ego_vehicle_threshold=10.0, dt=0.05, max_ticks=3000,
+                 accident_distance=3.0, wheelbase=2.9, max_accel=4.0, max_decel=8.0, max_steer_angle=70.0):
+        """
+        :param candidates: list of (ego_route, adversary_destinations, adversary_accels), see run_episode
+        """
+        n = len(candidates)
+        self._n = n
+        self._ego_speed = ego_speed
+        self._ego_vehicle_threshold = ego_vehicle_threshold
+        self._dt = dt
+        self._max_ticks = max_ticks
+        self._accident_distance = accident_distance
+        self._wheelbase = wheelbase
+        self._max_accel = max_accel
+        self._max_decel = max_decel
+        self._max_steer_angle = math.radians(max_steer_angle)
+
+        # Routes, stored once for the candidates sharing the same one
+        route_ids, routes = {}, []
+        self._route_id = np.zeros(n, dtype=np.int64)
+        for i, (route, _, _) in enumerate(candidates):
+            if id(route) not in route_ids:
+                route_ids[id(route)] = len(routes)
+                routes.append(route)
+            self._route_id[i] = route_ids[id(route)]
+        self._route_len = np.array([len(route) - 1 for route in routes], dtype=np.int64)
+        self._route = np.zeros((len(routes), max(1, int(self._route_len.max(initial=0))), 3))
+        for r, route in enumerate(routes):
+            for k, transform in enumerate(route[1:]):
+                location = transform.location
+                self._route[r, k] = (location.x, location.y, location.z)
+        self._route_len = self._route_len[self._route_id]
+        self._head = np.zeros(n, dtype=np.int64)
+
+        # Adversary paths
+        num_points = max([len(destinations) for _, destinations, _ in candidates] + [2])
+        self._destinations = np.zeros((n, num_points, 2))
+        self._accels = np.zeros((n, num_points - 1))
+        self._num_destinations = np.zeros(n, dtype=np.int64)
+        for i, (_, destinations, accels) in enumerate(candidates):
+            self._destinations[i, :len(destinations)] = [(d.x, d.y) for d in destinations]
+            accels = accels[:num_points - 1]
+            self._accels[i, :len(accels)] = accels
+            self._num_destinations[i] = len(destinations)
+        self._dest_index = np.ones(n, dtype=np.int64)
+
+        # Vehicles
+        self._x = np.zeros((2, n))
+        self._y = np.zeros((2, n))
+        self._yaw = np.zeros((2, n))
+        self._speed = np.zeros((2, n))
+        self._throttle = np.zeros((2, n))
+        self._steer = np.zeros((2, n))
+        self._brake = np.zeros((2, n))
+        self._ego_z = np.zeros(n)
+        for i, (route, _, _) in enumerate(candidates):
+            self._x[0, i], self._y[0, i], self._ego_z[i] = route[0].location.x, route[0].location.y, route[0].location.z
+            self._yaw[0, i] = math.radians(route[0].rotation.yaw)
+        self._x[1], self._y[1] = self._destinations[:, 0, 0], self._destinations[:, 0, 1]
+
+        # Controllers
+        self._adversary_target = self._accels[:, 0] * (np.hypot(
+            self._destinations[:, 1, 0] - self._x[1], self._destinations[:, 1, 1] - self._y[1]) / 1 * 3.6)
+        self._past_steering = np.zeros(n)
+        self._buffers = [BatchErrorBuffer(size=10) for _ in range(4)]
+        for buffer in self._buffers:
+            for _ in range(n):
+                buffer.add(PIDErrorBuffer(size=10).get_state())
+        self._ego_lon_errors, self._ego_lat_errors, self._adversary_lon_errors, self._adversary_lat_errors = self._buffers
+
+        # Outcomes
+        self.distances = np.zeros((n, max_ticks))
+        self.ego_speeds = np.zeros((n, max_ticks))
+        self.ticks = np.full(n, max_ticks, dtype=np.int64)
+        self.end_reasons = ['max_ticks'] * n
+
+    def run(self):
+        """Runs the episodes to their end, returns their EpisodeResult"""
+        rows = np.arange(self._n)
+        for ticks in range(1, self._max_ticks + 1):
+            if not len(rows):
+                break
+            self._tick_vehicles(rows)
+            rows = self._check_ends(rows, ticks)
+            self._adversary_controls(rows)
+            self._ego_controls(rows)
+        return [self.result(i) for i in range(self._n)]
+
+    def result(self, i):
+        """EpisodeResult of the i-th episode"""
+        distances, ego_speeds = self.trace(i)
+        return EpisodeResult(
+            min_distance=float(distances.min()) if len(distances) else float('inf'),
+            min_ttc=float(time_to_collision(distances, self._dt).min()) if len(distances) else float('inf'),
+            robustness=stl_robustness(distances, ego_speeds),
+            accident=self.end_reasons[i] == 'accident',
+            ticks=int(self.ticks[i]),
+            end_reason=self.end_reasons[i])
+
+    def trace(self, i):
+        """(distances, ego speeds in Km/h) of the i-th episode"""
+        return self.distances[i, :self.ticks[i]], self.ego_speeds[i, :self.ticks[i]]
+
+    def _tick_vehicles(self, rows):
+        """Vectorized KinematicVehicle.tick, for the ego and the adversary of the rows"""
+        dt = self._dt
+        yaw = self._yaw[:, rows]
+        accel = self._max_accel * self._throttle[:, rows] - self._max_decel * self._brake[:, rows]
+        speed = np.maximum(0.0, self._speed[:, rows] + accel * dt)
+        self._speed[:, rows] = speed
+        self._x[:, rows] += speed * np.cos(yaw) * dt
+        self._y[:, rows] += speed * np.sin(yaw) * dt
+        self._yaw[:, rows] = yaw + speed / self._wheelbase * np.tan(self._steer[:, rows] * self._max_steer_angle) * dt
+
+    def _check_ends(self, rows, ticks):
+        """Records the tick of the rows, ends their episodes as run_episode does and returns the running rows"""
+        ex, ax = self._x[0, rows], self._x[1, rows]
+        ey, ay = self._y[0, rows], self._y[1, rows]
+        distance = np.hypot(ex - ax, ey - ay)
+        self.distances[rows, ticks - 1] = distance
+        self.ego_speeds[rows, ticks - 1] = 3.6 * self._speed[0, rows]
+
+        stuck = (3.6 * self._speed[1, rows] < 0.1) if ticks % 200 == 0 else np.zeros(len(rows), dtype=bool)
+        accident = ~stuck & (distance < self._accident_distance)
+        running = ~stuck & ~accident
+
+        dest_index = self._dest_index[rows]
+        destination = self._destinations[rows, dest_index]
+        arrived = running & (np.hypot(ax - destination[:, 0], ay - destination[:, 1]) < 1)
+        adversary_done = arrived & (dest_index >= self._num_destinations[rows] - 1)
+        next_leg = arrived & ~adversary_done
+        if np.any(next_leg):
+            leg_rows = rows[next_leg]
+            dest_index = dest_index[next_leg] + 1
+            self._dest_index[leg_rows] = dest_index
+            destination = self._destinations[leg_rows, dest_index]
+            current_speed = np.maximum(3.6 * self._speed[1, leg_rows], 0.1)
+            leg_distance = np.hypot(destination[:, 0] - self._x[1, leg_rows], destination[:, 1] - self._y[1, leg_rows])
+            self._adversary_target[leg_rows] = current_speed + self._accels[leg_rows, dest_index - 1] * (
+                leg_distance / current_speed * 3.6)
+        ego_done = running & ~adversary_done & (self._head[rows] >= self._route_len[rows])
+
+        ended = ~running | adversary_done | ego_done
+        for reason, mask in (('stuck', stuck), ('accident', accident), ('adversary_done', adversary_done),
+                             ('ego_done', ego_done)):
+            for i in rows[mask]:
+                self.end_reasons[i] = reason
+        self.ticks[rows[ended]] = ticks
+        return rows[~ended]
+
+    def _adversary_controls(self, rows):
+        """Vectorized SimpleAgent.run_step"""
+        error = self._adversary_target[rows] - 3.6 * self._speed[1, rows]
+        acceleration = _pid(self._adversary_lon_errors, rows, error, ADVERSARY_PID, ADVERSARY_PID['dt'])
+        self._throttle[1, rows] = np.where(acceleration >= 0.0, np.minimum(acceleration, 1.0), 0.0)
+        self._brake[1, rows] = np.where(acceleration >= 0.0, 0.0, np.minimum(np.abs(acceleration), 0.3))
+
+        destination = self._destinations[rows, self._dest_index[rows]]
+        yaw = self._yaw[1, rows]
+        _dot = _steering_errors(destination[:, 0] - self._x[1, rows], destination[:, 1] - self._y[1, rows],
+                                np.cos(yaw), np.sin(yaw))
+        self._steer[1, rows] = _pid(self._adversary_lat_errors, rows, _dot, ADVERSARY_PID, ADVERSARY_PID['dt'])
+
+    def _ego_controls(self, rows):
+        """Vectorized RouteFollower.run_step"""
+        self._purge(rows)
+        empty = self._head[rows] >= self._route_len[rows]
+        stopped_rows = rows[empty]
+        self._throttle[0, stopped_rows] = 0.0
+        self._steer[0, stopped_rows] = 0.0
+        self._brake[0, stopped_rows] = 1.0
+        rows = rows[~empty]
+        if not len(rows):
+            return
+
+        # VehiclePIDController.run_step
+        error = self._ego_speed - 3.6 * self._speed[0, rows]
+        acceleration = _pid(self._ego_lon_errors, rows, error, EGO_LONGITUDINAL_PID, self._dt)
+
+        target = self._route[self._route_id[rows], self._head[rows]]
+        x, y, yaw = self._x[0, rows], self._y[0, rows], self._yaw[0, rows]
+        cos_yaw, sin_yaw = np.cos(yaw), np.sin(yaw)
+        _dot = _steering_errors(target[:, 0] - x, target[:, 1] - y, cos_yaw, sin_yaw)
+        steering = _pid(self._ego_lat_errors, rows, _dot, EGO_LATERAL_PID, self._dt)
+        past = self._past_steering[rows]
+        steering = np.clip(np.clip(steering, past - 0.1, past + 0.1), -0.8, 0.8)
+        self._past_steering[rows] = steering
+
+        throttle = np.where(acceleration >= 0.0, np.minimum(acceleration, 0.75), 0.0)
+        brake = np.where(acceleration >= 0.0, 0.0, np.minimum(np.abs(acceleration), 0.3))
+
+        # RouteFollower.obstacle_ahead, with the adversary as the only other vehicle
+        dx, dy = self._x[1, rows] - x, self._y[1, rows] - y
+        ahead = dx * cos_yaw + dy * sin_yaw - EGO_EXTENT[0] - ADVERSARY_EXTENT[0]
+        lateral = np.abs(-dx * sin_yaw + dy * cos_yaw)
+        obstacle = ((ahead >= 0.0) & (ahead <= self._ego_vehicle_threshold + self._speed[0, rows]) &
+                    (lateral <= 1.75 + ADVERSARY_EXTENT[1]))
+        self._throttle[0, rows] = np.where(obstacle, 0.0, throttle)
+        self._steer[0, rows] = steering
+        self._brake[0, rows] = np.where(obstacle, 0.5, brake)
+
+    def _purge(self, rows, base_min_distance=3.0, last_min_distance=1.0, window=32):
+        """Vectorized WaypointPlan.purge of the ego plans of the rows, which are not empty"""
+        offsets = np.arange(window)
+        while len(rows):
+            head, length = self._head[rows], self._route_len[rows]
+            index = head[:, None] + offsets
+            valid = index < length[:, None]
+            index = np.minimum(index, length[:, None] - 1)
+            diff = self._route[self._route_id[rows][:, None], index]
+            diff[:, :, 0] -= self._x[0, rows][:, None]
+            diff[:, :, 1] -= self._y[0, rows][:, None]
+            diff[:, :, 2] -= self._ego_z[rows][:, None]
+            distance = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+            threshold = np.where(index == length[:, None] - 1, last_min_distance,
+                                 (base_min_distance + 0.5 * self._speed[0, rows])[:, None])
+            kept = valid & (distance >= threshold)
+            found = kept.any(axis=1)
+            self._head[rows] = np.where(found, head + np.argmax(kept, axis=1), np.minimum(head + window, length))
+            rows = rows[~found & (head + window < length)]
+
+
+def run_episodes(candidates, traces=None, **kwargs):
+    """
+    Runs the episodes of many candidates together, see EpisodeBatch.
+
+        :param candidates: list of (ego_route, adversary_destinations, adversary_accels), see run_episode
+        :param traces: if given, list the (distances, ego speeds in Km/h) of every episode are appended to
+        :return: list of EpisodeResult, in the order of the candidates
+    """
+    batch = EpisodeBatch(candidates, **kwargs)
+    results = batch.run()
+    if traces is not None:
+        traces.extend(batch.trace(i) for i in range(len(candidates)))
+    return results
+
+
+def prescreen(results, max_robustness=1.0, max_distance=None):
+    """
+    Indices of the candidates worth a real episode: the ones whose approximate robustness is
+    below 'max_robustness', or that come closer than 'max_distance' when given.
+    """
+    selected = []
+    for i, result in enumerate(results):
+        if result.robustness < max_robustness or (max_distance is not None and result.min_distance < max_distance):
+            selected.append(i)
+    return selected
+
+
+def prescreen_path_files(entries, road_graph, ego_start, ego_end, max_robustness=1.0, dt=0.05):
+    """
+    PathCatalog entries worth running in the simulator, in their order: the ones whose
+    surrogate robustness is below 'max_robustness', with the ego following the route between
+    the (x, y) locations 'ego_start' and 'ego_end'. The bad paths (negative first acceleration,
+    NaN values or negative speeds) are always kept, Execute_scenario.py scores them without
+    the simulator.
+    """
+    ego_route = road_graph_route(road_graph, (ego_start[0], ego_start[1], 0.0), (ego_end[0], ego_end[1], 0.0))
+    kept, candidates, indices = [], [], []
+    for i, entry in enumerate(entries):
+        records = read_path(entry.path)
+        if len(records) < 2 or records['accel'][0] < 0 or np.any(np.isnan(records['accel'])) or \
+                np.any(np.isnan(records['speed'])) or np.any(records['speed'] < 0):
+            kept.append(i)
+            continue
+        candidates.append((ego_route, [grid_point_location(p) for p in records['point'].tolist()],
+                           records['accel'].tolist()))
+        indices.append(i)
+    kept.extend(indices[k] for k in prescreen(run_episodes(candidates, dt=dt), max_robustness))
+    return [entries[i] for i in sorted(kept)]
+
+
+# ==============================================================================
+# -- Inputs ----------------------------------------------------------------------
+# ==============================================================================
+
+def grid_point_location(point, top=-65.0, bottom=-100.0, left=-10.0, right=30.0, size=20):
+    """Center of a cell of the 20x20 grid of Execute_scenario.py, as a carla.Location"""
+    i, j = int(point) // size, int(point) % size
+    box_width = abs(right - left) / size
+    box_height = abs(top - bottom) / size
+    return carla.Location(x=top - box_height * i - box_height / 2, y=left + box_width * j + box_width / 2, z=1)
+
+
+def read_path_file(file_name):
+    """Reads the points and accelerations of an adversary path file, CSV or binary"""
+    records = read_path(file_name)
+    return [str(p) for p in records['point'].tolist()], records['accel'].tolist()
+
+
+def road_graph_route(road_graph, start, end, max_distance=5.0):
+    """
+    Route between two (x, y, z) locations computed on a RoadGraph, as a list of carla.Transform
+    starting at 'start'.
+    """
+    start_index = road_graph.nearest_waypoint(start, max_distance)
+    end_index = road_graph.nearest_waypoint(end, max_distance)
+    if start_index is None or end_index is None:
+        raise ValueError('the route ends are not on the road graph')
+    origin = road_graph.waypoint_entry(start_index)
+    end_pose, end_key = road_graph.waypoint_entry(end_index)
+    route_trace = road_graph.trace_route(origin, (end_pose, end_key, tuple(end)))
+    start_transform = carla.Transform(carla.Location(*start), RoadGraph.to_transforms([route_trace[0]])[0][0].rotation)
+    return [start_transform] + [transform for transform, _ in RoadGraph.to_transforms(route_trace)]
+
+
+def synthetic_candidates(num_episodes, rng, length=120.0, spacing=2.0):
+    """
+    Straight road scenarios, used when no road graph is given: the ego drives along the X axis
+    and the adversary crosses its road at a random point and speed.
+    """
+    ego_route = [carla.Transform(carla.Location(x=x), carla.Rotation()) for x in np.arange(0.0, length, spacing)]
+    candidates = []
+    for _ in range(num_episodes):
+        crossing = rng.uniform(10.0, 40.0)
+        destinations = [carla.Location(x=crossing, y=-rng.uniform(20.0, 60.0)), carla.Location(x=crossing, y=0.0),
+                        carla.Location(x=crossing, y=30.0)]
+        accels = [rng.uniform(0.02, 0.3), rng.uniform(-0.1, 0.1)]
+        candidates.append((ego_route, destinations, accels))
+    return candidates
+
+
+# ==============================================================================
+# -- main() ----------------------------------------------------------------------
+# ==============================================================================
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--road_graph',
+        help='directory of a saved RoadGraph, for the ego route (default: synthetic straight road)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--ego_start',
+        nargs=2,
+        type=float,
+        help='x y of the ego spawn point')
+    argparser.add_argument(
+        '--ego_end',
+        nargs=2,
+        type=float,
+        help='x y of the ego destination')
+    argparser.add_argument(
+        '--files',
+        help='directory of adversary path files to screen',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--episodes',
+        help='number of synthetic episodes, when no path files are given (default: 200)',
+        default=200,
+        type=int)
+    argparser.add_argument(
+        '--threshold',
+        help='robustness under which a candidate is kept (default: 1.0)',
+        default=1.0,
+        type=float)
+    argparser.add_argument(
+        '--dt',
+        help='time step (default: 0.05)',
+        default=0.05,
+        type=float)
+    argparser.add_argument(
+        '--seed',
+        help='seed of the synthetic candidates (default: 0)',
+        default=0,
+        type=int)
+    argparser.add_argument(
+        '--out',
+        help='csv file to write the results to',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--serial',
+        action='store_true',
+        help='run the episodes one at a time with the agents, instead of in a batch')
+    argparser.add_argument(
+        '--check_rtamt',
+        help='number of episodes whose robustness is checked against rtamt (default: 0)',
+        default=0,
+        type=int)
+    args = argparser.parse_args()
+
+    names = []
+    if args.files is not None:
+        if args.road_graph is None or args.ego_start is None or args.ego_end is None:
+            argparser.error('--files needs --road_graph, --ego_start and --ego_end')
+        road_graph = RoadGraph.load(args.road_graph)
+        ego_route = road_graph_route(road_graph, (args.ego_start[0], args.ego_start[1], 0.0),
+                                     (args.ego_end[0], args.ego_end[1], 0.0))
+        candidates = []
+        for entry in PathCatalog(args.files, recursive=False):
+            points, accels = read_path_file(entry.path)
+            candidates.append((ego_route, [grid_point_location(p) for p in points], accels))
+            names.append(entry.name)
+    else:
+        candidates = synthetic_candidates(args.episodes, np.random.RandomState(args.seed))
+        names = [str(i) for i in range(len(candidates))]
+
+    traces = []
+    start = time.perf_counter()
+    if args.serial:
+        results = [run_episode(route, destinations, accels, dt=args.dt, traces=traces)
+                   for route, destinations, accels in candidates]
+    else:
+        results = run_episodes(candidates, traces=traces, dt=args.dt)
+    elapsed = time.perf_counter() - start
+    selected = prescreen(results, args.threshold)
+    kept = set(selected)
+
+    print(f"{len(results)} episodes in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):.1f} episodes/s)")
+    print(f"{len(selected)} candidates kept for the simulator (robustness < {args.threshold})")
+
+    if args.check_rtamt > 0:
+        #rtamt needs a full window of the eventually operator
+        checked = [i for i, (distances, _) in enumerate(traces) if len(distances) > 10][:args.check_rtamt]
+        mismatches = 0
+        for i in checked:
+            expected = rtamt_robustness(*traces[i])
+            if not math.isclose(results[i].robustness, expected, rel_tol=1e-9, abs_tol=1e-9):
+                mismatches += 1
+                print(f"candidate {names[i]}: robustness {results[i].robustness}, rtamt {expected}")
+        print(f"{len(checked)} robustness values checked against rtamt, {mismatches} mismatches")
+
+    if args.out is not None:
+        with open(args.out, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['candidate', 'min_distance', 'min_ttc', 'robustness', 'accident', 'ticks', 'end_reason', 'kept'])
+            for i, (name, result) in enumerate(zip(names, results)):
+                writer.writerow([name] + result.as_row() + [int(i in kept)])
+
+
+if __name__ == '__main__':
+    main()
@@ -12,11 +12,15 @@ It can also make use of the global route planner to follow a specifed route
 import carla
 import math
 from enum import Enum
-from shapely.geometry import Polygon
+import numpy as np
 
 from agents.navigation.local_planner import LocalPlanner
 from agents.navigation.global_route_planner import GlobalRoutePlanner
-from agents.tools.misc import get_speed, is_within_distance, get_trafficlight_trigger_location, compute_distance
+from agents.tools.actor_cache import ActorCache, ActorState
+from agents.tools.geometry import corridor_quads, oriented_boxes, convex_polygons_intersect
+from agents.tools.profiler import get_profiler
+from agents.tools.traffic_light_table import TrafficLightTable
+from agents.tools.misc import get_speed, is_within_distance, compute_distance
 
 
 class BasicAgent(object):
@@ -50,6 +54,7 @@ class BasicAgent(object):
         self._base_tlight_threshold = 5.0  # meters
         self._base_vehicle_threshold = 5.0  # meters
         self._max_brake = 0.5
+        self._road_graph = None
 
         # Change parameters according to the dictionary
         opt_dict['target_speed'] = target_speed
@@ -67,10 +72,14 @@ class BasicAgent(object):
             self._base_vehicle_threshold = opt_dict['base_vehicle_threshold']
         if 'max_brake' in opt_dict:
             self._max_steering = opt_dict['max_brake']
+        if 'road_graph' in opt_dict:
+            self._road_graph = opt_dict['road_graph']
 
         # Initialize the planners
         self._local_planner = LocalPlanner(self._vehicle, opt_dict=opt_dict)
-        self._global_planner = GlobalRoutePlanner(self._map, self._sampling_resolution)
+        self._rng = self._local_planner.get_rng()
+        self._profiler = get_profiler()
+        self._global_planner = GlobalRoutePlanner(self._map, self._sampling_resolution, self._road_graph)
 
     def add_emergency_stop(self, control):
         """
@@ -159,27 +168,25 @@ class BasicAgent(object):
         """Execute one step of navigation."""
         hazard_detected = False
 
-        # Retrieve all relevant actors
-        actor_list = self._world.get_actors()
-        vehicle_list = actor_list.filter("*vehicle*")
-        lights_list = actor_list.filter("*traffic_light*")
-
         vehicle_speed = get_speed(self._vehicle) / 3.6
 
-        # Check for possible vehicle obstacles
+        # Check for possible vehicle obstacles (the vehicles nearby are taken from the cache)
         max_vehicle_distance = self._base_vehicle_threshold + vehicle_speed
-        affected_by_vehicle, _, _ = self._vehicle_obstacle_detected(vehicle_list, max_vehicle_distance)
+        with self._profiler.section('agent.vehicle_obstacles'):
+            affected_by_vehicle, _, _ = self._vehicle_obstacle_detected(None, max_vehicle_distance)
         if affected_by_vehicle:
             #print("****I see an obstacle!!!")
             hazard_detected = True
 
         # Check if the vehicle is affected by a red traffic light
         max_tlight_distance = self._base_tlight_threshold + vehicle_speed
-        affected_by_tlight, _ = self._affected_by_traffic_light(lights_list, max_tlight_distance)
+        with self._profiler.section('agent.traffic_lights'):
+            affected_by_tlight, _ = self._affected_by_traffic_light(None, max_tlight_distance)
         if affected_by_tlight:
             hazard_detected = True
 
-        control = self._local_planner.run_step()
+        with self._profiler.section('agent.local_planner'):
+            control = self._local_planner.run_step()
         if hazard_detected:
             control = self.add_emergency_stop(control)
 
@@ -211,16 +218,13 @@ class BasicAgent(object):
         Method to check if there is a red light affecting the vehicle.
 
             :param lights_list (list of carla.TrafficLight): list containing TrafficLight objects.
-                If None, all traffic lights in the scene are used
+                If None, the traffic lights of the TrafficLightTable on the road of the agent are used
             :param max_distance (float): max distance for traffic lights to be considered relevant.
                 If None, the base threshold value is used
         """
         if self._ignore_traffic_lights:
             return (False, None)
 
-        if not lights_list:
-            lights_list = self._world.get_actors().filter("*traffic_light*")
-
         if not max_distance:
             max_distance = self._base_tlight_threshold
 
@@ -233,24 +237,31 @@ class BasicAgent(object):
         ego_vehicle_location = self._vehicle.get_location()
         ego_vehicle_waypoint = self._map.get_waypoint(ego_vehicle_location)
 
-        for traffic_light in lights_list:
-            object_location = get_trafficlight_trigger_location(traffic_light)
-            object_waypoint = self._map.get_waypoint(object_location)
+        # The trigger waypoints never change, only the state of the lights is read
+        light_table = TrafficLightTable.for_world(self._world, self._map)
+        if not lights_list:
+            light_entries = light_table.lights_on_road(ego_vehicle_waypoint.road_id)
+        else:
+            light_entries = [light_table.entry(traffic_light) for traffic_light in lights_list]
+
+        ve_dir = ego_vehicle_waypoint.transform.get_forward_vector()
+        ego_transform = self._vehicle.get_transform()
 
-            if object_waypoint.road_id != ego_vehicle_waypoint.road_id:
+        for light_entry in light_entries:
+            if light_entry.road_id != ego_vehicle_waypoint.road_id:
                 continue
 
-            ve_dir = ego_vehicle_waypoint.transform.get_forward_vector()
-            wp_dir = object_waypoint.transform.get_forward_vector()
-            dot_ve_wp = ve_dir.x * wp_dir.x + ve_dir.y * wp_dir.y + ve_dir.z * wp_dir.z
+            wp_dir = light_entry.direction
+            dot_ve_wp = ve_dir.x * wp_dir[0] + ve_dir.y * wp_dir[1] + ve_dir.z * wp_dir[2]
 
             if dot_ve_wp < 0:
                 continue
 
+            traffic_light = light_entry.actor
             if traffic_light.state != carla.TrafficLightState.Red:
                 continue
 
-            if is_within_distance(object_waypoint.transform, self._vehicle.get_transform(), max_distance, [0, 90]):
+            if is_within_distance(light_entry.transform, ego_transform, max_distance, [0, 90]):
                 self._last_traffic_light = traffic_light
                 return (True, traffic_light)
 
@@ -260,17 +271,14 @@ class BasicAgent(object):
         """
         Method to check if there is a vehicle in front of the agent blocking its path.
 
-            :param vehicle_list (list of carla.Vehicle): list contatining vehicle objects.
-                If None, all vehicle in the scene are used
+            :param vehicle_list (list of carla.Vehicle or ActorState): list contatining vehicle objects.
+                If None, the vehicles of the ActorCache close enough to matter are used
             :param max_distance: max freespace to check for obstacles.
                 If None, the base threshold value is used
         """
         if self._ignore_vehicles:
             return (False, None, -1)
 
-        if not vehicle_list:
-            vehicle_list = self._world.get_actors().filter("*vehicle*")
-
         if not max_distance:
             max_distance = self._base_vehicle_threshold
 
@@ -284,15 +292,24 @@ class BasicAgent(object):
         # Get the transform of the front of the ego
         ego_forward_vector = ego_transform.get_forward_vector()
         ego_extent = self._vehicle.bounding_box.extent.x
-        ego_front_transform = ego_transform
-        ego_front_transform.location += carla.Location(
-            x=ego_extent * ego_forward_vector.x,
-            y=ego_extent * ego_forward_vector.y,
-        )
+        ego_front_transform = carla.Transform(
+            ego_transform.location + carla.Location(
+                x=ego_extent * ego_forward_vector.x,
+                y=ego_extent * ego_forward_vector.y,
+            ), ego_transform.rotation)
 
-        for target_vehicle in vehicle_list:
-            target_transform = target_vehicle.get_transform()
-            target_wpt = self._map.get_waypoint(target_transform.location, lane_type=carla.LaneType.Any)
+        if not vehicle_list:
+            # Only the vehicles whose bounding circle can be within max_distance of the front of the ego
+            actor_cache = ActorCache.for_world(self._world)
+            radius = max_distance + ego_extent + actor_cache.max_radius
+            target_list = actor_cache.vehicles_near(ego_transform.location, radius)
+        else:
+            target_list = [target_vehicle if isinstance(target_vehicle, ActorState) else
+                           ActorState.from_actor(target_vehicle) for target_vehicle in vehicle_list]
+
+        for target in target_list:
+            target_transform = target.transform
+            target_wpt = target.get_waypoint(self._map)
 
             # Simplified version for outside junctions
             if not ego_wpt.is_junction or not target_wpt.is_junction:
@@ -305,58 +322,63 @@ class BasicAgent(object):
                         continue
 
                 target_forward_vector = target_transform.get_forward_vector()
-                target_extent = target_vehicle.bounding_box.extent.x
-                target_rear_transform = target_transform
-                target_rear_transform.location -= carla.Location(
-                    x=target_extent * target_forward_vector.x,
-                    y=target_extent * target_forward_vector.y,
-                )
+                target_extent = target.bounding_box.extent.x
+                target_rear_transform = carla.Transform(
+                    target_transform.location - carla.Location(
+                        x=target_extent * target_forward_vector.x,
+                        y=target_extent * target_forward_vector.y,
+                    ), target_transform.rotation)
 
                 if is_within_distance(target_rear_transform, ego_front_transform, max_distance, [low_angle_th, up_angle_th]):
-                    return (True, target_vehicle, compute_distance(target_transform.location, ego_transform.location))
+                    return (True, target.actor, compute_distance(target_rear_transform.location, ego_front_transform.location))
 
             # Waypoints aren't reliable, check the proximity of the vehicle to the route
             else:
-                route_bb = []
-                ego_location = ego_transform.location
-                extent_y = self._vehicle.bounding_box.extent.y
-                r_vec = ego_transform.get_right_vector()
-                p1 = ego_location + carla.Location(extent_y * r_vec.x, extent_y * r_vec.y)
-                p2 = ego_location + carla.Location(-extent_y * r_vec.x, -extent_y * r_vec.y)
-                route_bb.append([p1.x, p1.y, p1.z])
-                route_bb.append([p2.x, p2.y, p2.z])
-
-                for wp, _ in self._local_planner.get_plan():
-                    if ego_location.distance(wp.transform.location) > max_distance:
-                        break
-
-                    r_vec = wp.transform.get_right_vector()
-                    p1 = wp.transform.location + carla.Location(extent_y * r_vec.x, extent_y * r_vec.y)
-                    p2 = wp.transform.location + carla.Location(-extent_y * r_vec.x, -extent_y * r_vec.y)
-                    route_bb.append([p1.x, p1.y, p1.z])
-                    route_bb.append([p2.x, p2.y, p2.z])
-
-                if len(route_bb) < 3:
-                    # 2 points don't create a polygon, nothing to check
-                    return (False, None, -1)
-                ego_polygon = Polygon(route_bb)
-
-                # Compare the two polygons
-                for target_vehicle in vehicle_list:
-                    target_extent = target_vehicle.bounding_box.extent.x
-                    if target_vehicle.id == self._vehicle.id:
-                        continue
-                    if ego_location.distance(target_vehicle.get_location()) > max_distance:
-                        continue
+                return self._route_obstacle_detected(target_list, ego_transform, ego_front_transform.location, max_distance)
+
+        return (False, None, -1)
+
+    def _route_obstacle_detected(self, target_list, ego_transform, ego_location, max_distance):
+        """
+        Checks if a vehicle intersects the corridor covered by the route ahead of the agent.
+        Used inside junctions, where the waypoints of the vehicles aren't reliable.
 
-                    target_bb = target_vehicle.bounding_box
-                    target_vertices = target_bb.get_world_vertices(target_vehicle.get_transform())
-                    target_list = [[v.x, v.y, v.z] for v in target_vertices]
-                    target_polygon = Polygon(target_list)
+            :param target_list (list of ActorState): vehicles to check
+            :param ego_transform: transform of the agent
+            :param ego_location: location of the front of the agent
+            :param max_distance: max freespace to check for obstacles
+        """
+        # Route points up to max_distance, starting at the front of the ego
+        plan = self._local_planner.get_plan()
+        plan_xyz = plan.locations()
+        ego_xyz = np.array([ego_location.x, ego_location.y, ego_location.z])
+        diff = plan_xyz - ego_xyz
+        too_far = np.nonzero(np.einsum('ij,ij->i', diff, diff) > max_distance * max_distance)[0]
+        num_points = too_far[0] if len(too_far) else len(plan_xyz)
+        if not num_points:
+            # No route ahead, nothing to check
+            return (False, None, -1)
+
+        r_vec = ego_transform.get_right_vector()
+        centers = np.vstack((ego_xyz[None, :2], plan_xyz[:num_points, :2]))
+        right_vectors = np.vstack(([[r_vec.x, r_vec.y]], plan.right_vectors()[:num_points]))
+        route_quads = corridor_quads(centers, right_vectors, self._vehicle.bounding_box.extent.y)
+
+        candidates = [target for target in target_list if target.id != self._vehicle.id
+                      and ego_location.distance(target.location) <= max_distance]
+        if not candidates:
+            return (False, None, -1)
 
-                    if ego_polygon.intersects(target_polygon):
-                        return (True, target_vehicle, compute_distance(target_vehicle.get_location(), ego_location))
+        target_boxes = oriented_boxes(
+            [(target.location.x, target.location.y) for target in candidates],
+            [target.transform.rotation.yaw for target in candidates],
+            [(target.bounding_box.location.x, target.bounding_box.location.y) for target in candidates],
+            [(target.bounding_box.extent.x, target.bounding_box.extent.y) for target in candidates])
 
-                return (False, None, -1)
+        # Compare the route corridor with every vehicle at once
+        hits = np.nonzero(convex_polygons_intersect(route_quads, target_boxes).any(axis=0))[0]
+        if len(hits):
+            target = candidates[hits[0]]
+            return (True, target.actor, compute_distance(target.location, ego_location))
 
-        return (False, None, -1)
\ No newline at end of file
+        return (False, None, -1)
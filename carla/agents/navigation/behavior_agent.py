@@ -8,14 +8,14 @@
 waypoints and avoiding other vehicles. The agent also responds to traffic lights,
 traffic signs, and has different possible configurations. """
 
-import random
 import numpy as np
 import carla
 from agents.navigation.basic_agent import BasicAgent
 from agents.navigation.local_planner import RoadOption
 from agents.navigation.behavior_types import Cautious, Aggressive, Normal
 
-from agents.tools.misc import get_speed, positive, is_within_distance, compute_distance
+from agents.tools.misc import positive, is_within_distance, compute_distance
+from agents.tools.perception import PerceptionContext
 
 class BehaviorAgent(BasicAgent):
     """
@@ -52,6 +52,7 @@ class BehaviorAgent(BasicAgent):
         self._min_speed = 5
         self._behavior = None
         self._sampling_resolution = 4.5
+        self._perception = None
 
         # Parameters for agent behavior
         if behavior == 'cautious':
@@ -67,13 +68,23 @@ class BehaviorAgent(BasicAgent):
         return super().get_local_planner()._waypoints_queue
         
 
+    def _perception_context(self):
+        """
+        Returns the PerceptionContext of the current tick, shared by every manager.
+        It is only built again once the world has moved to a new frame.
+        """
+        if self._perception is None or self._perception.frame != self._world.get_snapshot().frame:
+            self._perception = PerceptionContext(self._world, self._vehicle, self._map)
+        return self._perception
+
     def _update_information(self):
         """
         This method updates the information regarding the ego
         vehicle based on the surrounding world.
         """
-        self._speed = get_speed(self._vehicle)
-        self._speed_limit = self._vehicle.get_speed_limit()
+        perception = self._perception_context()
+        self._speed = perception.speed
+        self._speed_limit = perception.speed_limit
         self._local_planner.set_speed(self._speed_limit)
         self._direction = self._local_planner.target_road_option
         if self._direction is None:
@@ -90,9 +101,7 @@ class BehaviorAgent(BasicAgent):
         """
         This method is in charge of behaviors for red lights.
         """
-        actor_list = self._world.get_actors()
-        lights_list = actor_list.filter("*traffic_light*")
-        affected, _ = self._affected_by_traffic_light(lights_list)
+        affected, _ = self._affected_by_traffic_light()
 
         return affected
 
@@ -113,7 +122,7 @@ class BehaviorAgent(BasicAgent):
 
         behind_vehicle_state, behind_vehicle, _ = self._vehicle_obstacle_detected(vehicle_list, max(
             self._behavior.min_proximity_threshold, self._speed_limit / 2), up_angle_th=180, low_angle_th=160)
-        if behind_vehicle_state and self._speed < get_speed(behind_vehicle):
+        if behind_vehicle_state and self._speed < self._perception_context().speed_of(behind_vehicle):
             if (right_turn == carla.LaneChange.Right or right_turn ==
                     carla.LaneChange.Both) and waypoint.lane_id * right_wpt.lane_id > 0 and right_wpt.lane_type == carla.LaneType.Driving:
                 new_vehicle_state, _, _ = self._vehicle_obstacle_detected(vehicle_list, max(
@@ -146,9 +155,8 @@ class BehaviorAgent(BasicAgent):
             :return distance: distance to nearby vehicle
         """
 
-        vehicle_list = self._world.get_actors().filter("*vehicle*")
-        def dist(v): return v.get_location().distance(waypoint.transform.location)
-        vehicle_list = [v for v in vehicle_list if dist(v) < 45 and v.id != self._vehicle.id]
+        perception = self._perception_context()
+        vehicle_list = perception.vehicles
 
         if self._direction == RoadOption.CHANGELANELEFT:
             vehicle_state, vehicle, distance = self._vehicle_obstacle_detected(
@@ -171,15 +179,15 @@ class BehaviorAgent(BasicAgent):
         
         
         #if it's foggy, 50% chance
-        if(self._world.get_weather().fog_density > 50.0 and vehicle_state):
-            accurate_detect = random.choice([True,False])
+        if(vehicle_state and perception.fog_density > 50.0):
+            accurate_detect = self._rng.choice([True,False])
             if not accurate_detect:
-                print(f"It's foggy!! {self._world.get_weather().fog_density}")
+                print(f"It's foggy!! {perception.fog_density}")
                 print(f"Ground truth: {(vehicle_state,vehicle,distance)}")
                 print(f"Returning {(False, None, -1)}")
                 return False, None, -1
             else:
-                print(f"It's foggy!! {self._world.get_weather().fog_density}")
+                print(f"It's foggy!! {perception.fog_density}")
                 print(f"Ground truth: {(vehicle_state,vehicle,distance)}")
                 print(f"Returning {(vehicle_state,vehicle,distance)}")
                 return vehicle_state, vehicle, distance
@@ -197,9 +205,7 @@ class BehaviorAgent(BasicAgent):
             :return distance: distance to nearby walker
         """
 
-        walker_list = self._world.get_actors().filter("*walker.pedestrian*")
-        def dist(w): return w.get_location().distance(waypoint.transform.location)
-        walker_list = [w for w in walker_list if dist(w) < 10]
+        walker_list = self._perception_context().walkers
 
         if self._direction == RoadOption.CHANGELANELEFT:
             walker_state, walker, distance = self._vehicle_obstacle_detected(walker_list, max(
@@ -224,7 +230,7 @@ class BehaviorAgent(BasicAgent):
             :return control: carla.VehicleControl
         """
 
-        vehicle_speed = get_speed(vehicle)
+        vehicle_speed = self._perception_context().speed_of(vehicle)
         delta_v = max(1, (self._speed - vehicle_speed) / 3.6)
         ttc = distance / delta_v if delta_v != 0 else distance / np.nextafter(0., 1.)
 
@@ -263,21 +269,24 @@ class BehaviorAgent(BasicAgent):
             :param debug: boolean for debugging
             :return control: carla.VehicleControl
         """
-        self._update_information()
+        with self._profiler.section('agent.perception'):
+            self._update_information()
 
         control = None
         if self._behavior.tailgate_counter > 0:
             self._behavior.tailgate_counter -= 1
 
-        ego_vehicle_loc = self._vehicle.get_location()
-        ego_vehicle_wp = self._map.get_waypoint(ego_vehicle_loc)
+        ego_vehicle_wp = self._perception_context().waypoint
 
         # 1: Red lights and stops behavior
-        if self.traffic_light_manager():
+        with self._profiler.section('agent.traffic_lights'):
+            affected_by_tlight = self.traffic_light_manager()
+        if affected_by_tlight:
             return self.emergency_stop()
 
         # 2.1: Pedestrian avoidance behaviors
-        walker_state, walker, w_distance = self.pedestrian_avoid_manager(ego_vehicle_wp)
+        with self._profiler.section('agent.walkers'):
+            walker_state, walker, w_distance = self.pedestrian_avoid_manager(ego_vehicle_wp)
 
         if walker_state:
             # Distance is computed from the center of the two cars,
@@ -291,7 +300,8 @@ class BehaviorAgent(BasicAgent):
                 return self.emergency_stop()
 
         # 2.2: Car following behaviors
-        vehicle_state, vehicle, distance = self.collision_and_car_avoid_manager(ego_vehicle_wp)
+        with self._profiler.section('agent.vehicle_obstacles'):
+            vehicle_state, vehicle, distance = self.collision_and_car_avoid_manager(ego_vehicle_wp)
         #print(vehicle_state, vehicle)
 
         if vehicle_state:
@@ -321,7 +331,8 @@ class BehaviorAgent(BasicAgent):
                 self._behavior.max_speed,
                 self._speed_limit - self._behavior.speed_lim_dist])
             self._local_planner.set_speed(target_speed)
-        control = self._local_planner.run_step(debug=debug)
+        with self._profiler.section('agent.local_planner'):
+            control = self._local_planner.run_step(debug=debug)
 
         return control
 
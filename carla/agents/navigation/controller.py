@@ -5,14 +5,106 @@
 
 """ This module contains PID controllers to perform lateral and longitudinal control. """
 
-from collections import deque
 import math
-import numpy as np
 import carla
 from agents.tools.misc import get_speed
 import random
 
 
+def clip(value, min_value=-1.0, max_value=1.0):
+    """Scalar version of np.clip (NaN values are returned unchanged, as numpy does)"""
+    if value < min_value:
+        return min_value
+    if value > max_value:
+        return max_value
+    return value
+
+
+def steering_error(vehicle_transform, target_location):
+    """
+    Signed angle (in radians) between the forward vector of the vehicle and the vector
+    from the vehicle to the target, on the XY plane. Positive angles are to the right.
+
+        :param vehicle_transform: current transform of the vehicle
+        :param target_location: carla.Location the vehicle is steering to
+    """
+    ego_loc = vehicle_transform.location
+    v_vec = vehicle_transform.get_forward_vector()
+    vx, vy = v_vec.x, v_vec.y
+    wx, wy = target_location.x - ego_loc.x, target_location.y - ego_loc.y
+
+    wv_linalg = math.sqrt(wx * wx + wy * wy) * math.sqrt(vx * vx + vy * vy)
+    if wv_linalg == 0:
+        _dot = 1
+    else:
+        _dot = math.acos(clip((wx * vx + wy * vy) / wv_linalg))
+    if vx * wy - vy * wx < 0:
+        _dot *= -1.0
+    return _dot
+
+
+class PIDErrorBuffer(object):
+    """
+    Last errors of a PID controller, kept in a fixed size ring buffer together
+    with their running sum, so that no container is built at each step.
+    """
+
+    __slots__ = ('_values', '_size', '_count', '_next', '_sum', '_last', '_previous')
+
+    def __init__(self, size=10):
+        """
+        :param size: number of errors used for the integral term
+        """
+        self._values = [0.0] * size
+        self._size = size
+        self.clear()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        """Forgets every stored error"""
+        for i in range(self._size):
+            self._values[i] = 0.0
+        self._count = 0
+        self._next = 0
+        self._sum = 0.0
+        self._last = 0.0
+        self._previous = 0.0
+
+    def append(self, error):
+        """Adds a new error, dropping the oldest one if the buffer is full"""
+        if self._count == self._size:
+            self._sum -= self._values[self._next]
+        else:
+            self._count += 1
+        self._values[self._next] = error
+        self._sum += error
+        self._previous = self._last
+        self._last = error
+        self._next += 1
+        if self._next == self._size:
+            # The buffer is now ordered, re-sum it so that rounding errors don't pile up
+            self._next = 0
+            self._sum = sum(self._values)
+
+    def get_state(self):
+        """Returns the content of the buffer, see set_state"""
+        return (list(self._values), self._count, self._next, self._sum, self._last, self._previous)
+
+    def set_state(self, state):
+        """Restores a content returned by get_state"""
+        values, self._count, self._next, self._sum, self._last, self._previous = state
+        self._values = list(values)
+        self._size = len(self._values)
+
+    def derivative_and_integral(self, dt):
+        """Returns the (derivative, integral) terms of the stored errors"""
+        if self._count >= 2:
+            return (self._last - self._previous) / dt, self._sum * dt
+        return 0.0, 0.0
+
+
 class VehiclePIDController():
     """
     VehiclePIDController is the combination of two PID controllers
@@ -52,6 +144,9 @@ class VehiclePIDController():
         self._lon_controller = PIDLongitudinalController(self._vehicle, **args_longitudinal)
         self._lat_controller = PIDLateralController(self._vehicle, offset, **args_lateral)
 
+        # If set, the controls are computed by a MultiAgentStepper (see multi_agent_stepper.py)
+        self.control_requests = None
+
     def run_step(self, target_speed, waypoint):
         """
         Execute one step of control invoking both lateral and longitudinal
@@ -62,6 +157,8 @@ class VehiclePIDController():
             :param waypoint: target location encoded as a waypoint
             :return: distance (in meters) to the waypoint
         """
+        if self.control_requests is not None:
+            return self.control_requests.request(target_speed, self._lat_controller.target_location(waypoint))
 
         acceleration = self._lon_controller.run_step(target_speed)
         current_steering = self._lat_controller.run_step(waypoint)
@@ -122,7 +219,7 @@ class PIDLongitudinalController():
         self._k_i = K_I
         self._k_d = K_D
         self._dt = dt
-        self._error_buffer = deque(maxlen=10)
+        self._error_buffer = PIDErrorBuffer(size=10)
 
     def run_step(self, target_speed, debug=False):
         """
@@ -150,15 +247,9 @@ class PIDLongitudinalController():
 
         error = target_speed - current_speed
         self._error_buffer.append(error)
+        _de, _ie = self._error_buffer.derivative_and_integral(self._dt)
 
-        if len(self._error_buffer) >= 2:
-            _de = (self._error_buffer[-1] - self._error_buffer[-2]) / self._dt
-            _ie = sum(self._error_buffer) * self._dt
-        else:
-            _de = 0.0
-            _ie = 0.0
-
-        return np.clip((self._k_p * error) + (self._k_d * _de) + (self._k_i * _ie), -1.0, 1.0)
+        return clip((self._k_p * error) + (self._k_d * _de) + (self._k_i * _ie))
 
     def change_parameters(self, K_P, K_I, K_D, dt):
         """Changes the PID parameters"""
@@ -191,7 +282,7 @@ class PIDLateralController():
         self._k_d = K_D
         self._dt = dt
         self._offset = offset
-        self._e_buffer = deque(maxlen=10)
+        self._e_buffer = PIDErrorBuffer(size=10)
 
     def run_step(self, waypoint):
         """
@@ -205,6 +296,20 @@ class PIDLateralController():
         """
         return self._pid_control(waypoint, self._vehicle.get_transform())
 
+    def target_location(self, waypoint):
+        """
+        Returns the location the vehicle steers to, displaced to the side of the waypoint by the offset
+
+            :param waypoint: target waypoint
+        """
+        if self._offset != 0:
+            # Displace the wp to the side
+            w_tran = waypoint.transform
+            r_vec = w_tran.get_right_vector()
+            return w_tran.location + carla.Location(x=self._offset*r_vec.x,
+                                                    y=self._offset*r_vec.y)
+        return waypoint.transform.location
+
     def _pid_control(self, waypoint, vehicle_transform):
         """
         Estimate the steering angle of the vehicle based on the PID equations
@@ -216,43 +321,12 @@ class PIDLateralController():
 
         #self._offset = random.uniform(-1.5,1.5)
 
-        # Get the ego's location and forward vector
-        ego_loc = vehicle_transform.location
-        v_vec = vehicle_transform.get_forward_vector()
-        v_vec = np.array([v_vec.x, v_vec.y, 0.0])
-
-        # Get the vector vehicle-target_wp
-        if self._offset != 0:
-            # Displace the wp to the side
-            w_tran = waypoint.transform
-            r_vec = w_tran.get_right_vector()
-            w_loc = w_tran.location + carla.Location(x=self._offset*r_vec.x,
-                                                         y=self._offset*r_vec.y)
-        else:
-            w_loc = waypoint.transform.location
-
-        w_vec = np.array([w_loc.x - ego_loc.x,
-                          w_loc.y - ego_loc.y,
-                          0.0])
-
-        wv_linalg = np.linalg.norm(w_vec) * np.linalg.norm(v_vec)
-        if wv_linalg == 0:
-            _dot = 1
-        else:
-            _dot = math.acos(np.clip(np.dot(w_vec, v_vec) / (wv_linalg), -1.0, 1.0))
-        _cross = np.cross(v_vec, w_vec)
-        if _cross[2] < 0:
-            _dot *= -1.0
+        _dot = steering_error(vehicle_transform, self.target_location(waypoint))
 
         self._e_buffer.append(_dot)
-        if len(self._e_buffer) >= 2:
-            _de = (self._e_buffer[-1] - self._e_buffer[-2]) / self._dt
-            _ie = sum(self._e_buffer) * self._dt
-        else:
-            _de = 0.0
-            _ie = 0.0
+        _de, _ie = self._e_buffer.derivative_and_integral(self._dt)
 
-        return np.clip((self._k_p * _dot) + (self._k_d * _de) + (self._k_i * _ie), -1.0, 1.0)
+        return clip((self._k_p * _dot) + (self._k_d * _de) + (self._k_i * _ie))
 
     def change_parameters(self, K_P, K_I, K_D, dt):
         """Changes the PID parameters"""
@@ -14,6 +14,7 @@ import networkx as nx
 
 import carla
 from agents.navigation.local_planner import RoadOption
+from agents.navigation.road_graph import RoadGraph, closest_pose_index, waypoint_entry
 from agents.tools.misc import vector
 
 class GlobalRoutePlanner(object):
@@ -21,33 +22,53 @@ class GlobalRoutePlanner(object):
     This class provides a very high level route plan.
     """
 
-    def __init__(self, wmap, sampling_resolution):
+    def __init__(self, wmap, sampling_resolution, road_graph=None):
+        """
+        :param wmap: carla.Map object
+        :param sampling_resolution: distance between the waypoints of the route
+        :param road_graph: prebuilt RoadGraph of the same map (see RoadGraph.save / RoadGraph.load).
+            If given, the topology isn't retrieved from the map and routes are traced on the arrays.
+        """
         self._sampling_resolution = sampling_resolution
         self._wmap = wmap
         self._topology = None
         self._graph = None
         self._id_map = None
         self._road_id_to_edge = None
+        self._road_graph = road_graph
 
         self._intersection_end_node = -1
         self._previous_decision = RoadOption.VOID
 
         # Build the graph
-        self._build_topology()
-        self._build_graph()
-        self._find_loose_ends()
-        self._lane_change_link()
+        if self._road_graph is None:
+            self._build_topology()
+            self._build_graph()
+            self._find_loose_ends()
+            self._lane_change_link()
+
+    def get_road_graph(self):
+        """Returns the RoadGraph of this planner, packing the networkx graph if needed"""
+        if self._road_graph is None:
+            self._road_graph = RoadGraph.from_planner(self)
+        return self._road_graph
 
     def trace_route(self, origin, destination):
         """
         This method returns list of (carla.Waypoint, RoadOption)
         from origin to destination
         """
+        if self._graph is None:
+            return self._trace_road_graph_route(origin, destination)
+
         route_trace = []
         route = self._path_search(origin, destination)
         current_waypoint = self._wmap.get_waypoint(origin)
         destination_waypoint = self._wmap.get_waypoint(destination)
 
+        # Waypoint locations of the edges, packed by _path_search
+        road_graph = self.get_road_graph()
+
         for i in range(len(route) - 1):
             road_option = self._turn_decision(i, route)
             edge = self._graph.edges[route[i], route[i+1]]
@@ -59,7 +80,8 @@ class GlobalRoutePlanner(object):
                 n1, n2 = self._road_id_to_edge[exit_wp.road_id][exit_wp.section_id][exit_wp.lane_id]
                 next_edge = self._graph.edges[n1, n2]
                 if next_edge['path']:
-                    closest_index = self._find_closest_in_list(current_waypoint, next_edge['path'])
+                    next_poses = road_graph.edge_poses(self._edge_index(n1, n2))[1:-1]
+                    closest_index = closest_pose_index(_location_array(current_waypoint), next_poses)
                     closest_index = min(len(next_edge['path'])-1, closest_index+5)
                     current_waypoint = next_edge['path'][closest_index]
                 else:
@@ -68,19 +90,78 @@ class GlobalRoutePlanner(object):
 
             else:
                 path = path + [edge['entry_waypoint']] + edge['path'] + [edge['exit_waypoint']]
-                closest_index = self._find_closest_in_list(current_waypoint, path)
+                poses = road_graph.edge_poses(self._edge_index(route[i], route[i+1]))
+                closest_index = closest_pose_index(_location_array(current_waypoint), poses)
                 for waypoint in path[closest_index:]:
                     current_waypoint = waypoint
                     route_trace.append((current_waypoint, road_option))
                     if len(route)-i <= 2 and waypoint.transform.location.distance(destination) < 2*self._sampling_resolution:
                         break
                     elif len(route)-i <= 2 and current_waypoint.road_id == destination_waypoint.road_id and current_waypoint.section_id == destination_waypoint.section_id and current_waypoint.lane_id == destination_waypoint.lane_id:
-                        destination_index = self._find_closest_in_list(destination_waypoint, path)
+                        destination_index = closest_pose_index(_location_array(destination_waypoint), poses)
                         if closest_index > destination_index:
                             break
 
         return route_trace
 
+    def trace_routes(self, origins, destinations):
+        """
+        Many-to-many version of trace_route, for example to precompute the routes
+        between every pair of spawn points. The path searches are batched, running
+        a single search per distinct origin.
+
+            :param origins: list of carla.Location where the routes start
+            :param destinations: list of carla.Location where the routes end
+            :return: dictionary {(i, j): route} with the route from origins[i] to destinations[j],
+                as returned by trace_route. Unreachable pairs are left out
+        """
+        road_graph = self.get_road_graph()
+        origin_entries = self._waypoint_entries(origins)
+        destination_entries = [(pose, key, (location.x, location.y, location.z))
+                               for (pose, key), location in zip(self._waypoint_entries(destinations), destinations)]
+
+        _, routes = road_graph.path_search_many(
+            [key for _, key in origin_entries], [key for _, key, _ in destination_entries])
+
+        route_traces = {}
+        for i, origin in enumerate(origin_entries):
+            for j, destination in enumerate(destination_entries):
+                if routes[i][j] is None:
+                    continue
+                route_trace = road_graph.trace_route(origin, destination, routes[i][j])
+                route_traces[(i, j)] = RoadGraph.to_waypoints(route_trace, self._wmap)
+        return route_traces
+
+    def _trace_road_graph_route(self, origin, destination):
+        """
+        Same as trace_route, but using the arrays of the RoadGraph. The waypoints
+        are only recreated from the map once the route has been found.
+        """
+        origin_entry, (destination_pose, destination_key) = self._waypoint_entries([origin, destination])
+        route_trace = self._road_graph.trace_route(
+            origin_entry, (destination_pose, destination_key, (destination.x, destination.y, destination.z)))
+        return RoadGraph.to_waypoints(route_trace, self._wmap)
+
+    def _waypoint_entries(self, locations):
+        """
+        Returns the (pose, lane_key) of the waypoint of each location, looking them up in
+        the RoadGraph index and only asking the server for the ones it can't resolve.
+        """
+        road_graph = self.get_road_graph()
+        xyz = np.array([(location.x, location.y, location.z) for location in locations]).reshape(-1, 3)
+        entries = []
+        for location, index in zip(locations, road_graph.nearest_waypoints(xyz)):
+            if index >= 0:
+                entries.append(road_graph.waypoint_entry(index))
+            else:
+                entries.append(waypoint_entry(self._wmap.get_waypoint(location)))
+        return entries
+
+    def _edge_index(self, n1, n2):
+        """Returns the RoadGraph edge of the networkx edge (n1, n2)"""
+        road_graph = self.get_road_graph()
+        return road_graph.edge_index(road_graph.node_index(n1), road_graph.node_index(n2))
+
     def _build_topology(self):
         """
         This function retrieves topology from the server as a list of
@@ -233,7 +314,7 @@ class GlobalRoutePlanner(object):
                                 and next_waypoint.lane_type == carla.LaneType.Driving \
                                 and waypoint.road_id == next_waypoint.road_id:
                             next_road_option = RoadOption.CHANGELANERIGHT
-                            next_segment = self._localize(next_waypoint.transform.location)
+                            next_segment = self._localize_waypoint(next_waypoint)
                             if next_segment is not None:
                                 self._graph.add_edge(
                                     self._id_map[segment['entryxyz']], next_segment[0], entry_waypoint=waypoint,
@@ -246,7 +327,7 @@ class GlobalRoutePlanner(object):
                                 and next_waypoint.lane_type == carla.LaneType.Driving \
                                 and waypoint.road_id == next_waypoint.road_id:
                             next_road_option = RoadOption.CHANGELANELEFT
-                            next_segment = self._localize(next_waypoint.transform.location)
+                            next_segment = self._localize_waypoint(next_waypoint)
                             if next_segment is not None:
                                 self._graph.add_edge(
                                     self._id_map[segment['entryxyz']], next_segment[0], entry_waypoint=waypoint,
@@ -259,9 +340,22 @@ class GlobalRoutePlanner(object):
     def _localize(self, location):
         """
         This function finds the road segment that a given location
-        is part of, returning the edge it belongs to
+        is part of, returning the edge it belongs to.
+        Once the RoadGraph exists, its index is used before asking the server.
         """
-        waypoint = self._wmap.get_waypoint(location)
+        if self._road_graph is not None:
+            edge = self._road_graph.localize((location.x, location.y, location.z))
+            if edge is not None:
+                return self._road_graph.edge_nodes(edge)
+        return self._localize_waypoint(self._wmap.get_waypoint(location))
+
+    def _localize_waypoint(self, waypoint):
+        """
+        Returns the edge of the road segment a waypoint is part of
+        """
+        if self._road_id_to_edge is None:
+            edge = self._road_graph.lane_edge_index(waypoint.road_id, waypoint.section_id, waypoint.lane_id)
+            return None if edge is None else self._road_graph.edge_nodes(edge)
         edge = None
         try:
             edge = self._road_id_to_edge[waypoint.road_id][waypoint.section_id][waypoint.lane_id]
@@ -274,9 +368,9 @@ class GlobalRoutePlanner(object):
         Distance heuristic calculator for path searching
         in self._graph
         """
-        l1 = np.array(self._graph.nodes[n1]['vertex'])
-        l2 = np.array(self._graph.nodes[n2]['vertex'])
-        return np.linalg.norm(l1-l2)
+        x1, y1, z1 = self._graph.nodes[n1]['vertex']
+        x2, y2, z2 = self._graph.nodes[n2]['vertex']
+        return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2 + (z1 - z2) ** 2)
 
     def _path_search(self, origin, destination):
         """
@@ -289,9 +383,12 @@ class GlobalRoutePlanner(object):
         """
         start, end = self._localize(origin), self._localize(destination)
 
-        route = nx.astar_path(
-            self._graph, source=start[0], target=end[0],
-            heuristic=self._distance_heuristic, weight='length')
+        # The search runs on the integer arrays of the RoadGraph
+        road_graph = self.get_road_graph()
+        route = road_graph.shortest_path(road_graph.node_index(start[0]), road_graph.node_index(end[0]))
+        if route is None:
+            raise nx.NetworkXNoPath('Node {} not reachable from {}'.format(end[0], start[0]))
+        route = [int(road_graph.node_ids[n]) for n in route]
         route.append(end[1])
         return route
 
@@ -380,13 +477,10 @@ class GlobalRoutePlanner(object):
         return decision
 
     def _find_closest_in_list(self, current_waypoint, waypoint_list):
-        min_distance = float('inf')
-        closest_index = -1
-        for i, waypoint in enumerate(waypoint_list):
-            distance = waypoint.transform.location.distance(
-                current_waypoint.transform.location)
-            if distance < min_distance:
-                min_distance = distance
-                closest_index = i
-
-        return closest_index
+        poses = np.array([_location_array(waypoint) for waypoint in waypoint_list]).reshape(-1, 3)
+        return closest_pose_index(_location_array(current_waypoint), poses)
+
+
+def _location_array(waypoint):
+    location = waypoint.transform.location
+    return np.array([location.x, location.y, location.z])
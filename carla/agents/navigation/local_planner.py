@@ -6,9 +6,11 @@
 """ This module contains a local planner to perform low-level waypoint following based on PID controllers. """
 
 from enum import Enum
-from collections import deque
+from itertools import islice
 import random
 
+import numpy as np
+
 import carla
 from agents.navigation.controller import VehiclePIDController
 from agents.tools.misc import draw_waypoints, get_speed
@@ -28,6 +30,133 @@ class RoadOption(Enum):
     CHANGELANERIGHT = 6
 
 
+class WaypointPlan(object):
+    """
+    Plan of the LocalPlanner, as (carla.Waypoint, RoadOption) pairs. The pairs are kept in a list
+    and the locations and right vectors of their waypoints in contiguous arrays, so that the waypoints
+    reached by the vehicle can be found with a vectorized distance test, and the corridor covered by
+    the route is known without going through the waypoints again. Reached waypoints are skipped by moving
+    a head index instead of popping them one by one.
+
+    Iterating, indexing and len() behave as with the deque it replaces, starting at the head.
+    """
+
+    def __init__(self, maxlen=10000):
+        """
+        :param maxlen: maximum number of waypoints of the plan, the oldest ones are dropped
+            when it is exceeded. None for no limit
+        """
+        self.maxlen = maxlen
+        self._items = []
+        self._xyz = np.empty((64, 3))
+        self._right = np.empty((64, 2))
+        self._head = 0
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __iter__(self):
+        return islice(self._items, self._head, None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[self._head + i] for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('plan index out of range')
+        return self._items[self._head + index]
+
+    def append(self, elem):
+        """Adds a (carla.Waypoint, RoadOption) pair at the end of the plan"""
+        self.extend([elem])
+
+    def extend(self, elems):
+        """Adds a list of (carla.Waypoint, RoadOption) pairs at the end of the plan"""
+        elems = list(elems)
+        if not elems:
+            return
+        if self.maxlen is not None:
+            if len(elems) >= self.maxlen:
+                elems = elems[len(elems) - self.maxlen:]
+                self._head = len(self._items)
+            else:
+                self._head += max(0, len(self) + len(elems) - self.maxlen)
+        xyz = np.empty((len(elems), 3))
+        right = np.empty((len(elems), 2))
+        for i, (wp, _) in enumerate(elems):
+            location = wp.transform.location
+            right_vector = wp.transform.get_right_vector()
+            xyz[i] = (location.x, location.y, location.z)
+            right[i] = (right_vector.x, right_vector.y)
+        self._compact()
+        start, end = len(self._items), len(self._items) + len(elems)
+        if end > len(self._xyz):
+            size = max(end, 2 * len(self._xyz))
+            grown_xyz, grown_right = np.empty((size, 3)), np.empty((size, 2))
+            grown_xyz[:start] = self._xyz[:start]
+            grown_right[:start] = self._right[:start]
+            self._xyz, self._right = grown_xyz, grown_right
+        self._xyz[start:end] = xyz
+        self._right[start:end] = right
+        self._items.extend(elems)
+
+    def clear(self):
+        """Removes every waypoint of the plan"""
+        self._items = []
+        self._head = 0
+
+    def popleft(self):
+        """Removes and returns the first (carla.Waypoint, RoadOption) pair of the plan"""
+        elem = self[0]
+        self._head += 1
+        return elem
+
+    def locations(self):
+        """Returns the (N, 3) array with the locations of the waypoints of the plan"""
+        return self._xyz[self._head:len(self._items)]
+
+    def right_vectors(self):
+        """Returns the (N, 2) array with the XY right vectors of the waypoints of the plan"""
+        return self._right[self._head:len(self._items)]
+
+    def purge(self, location, min_distance, last_min_distance=1.0, window=32):
+        """
+        Removes the waypoints at the start of the plan that are closer than 'min_distance' to
+        'location'. The last waypoint is only removed when closer than 'last_min_distance'.
+        The distances are computed for 'window' waypoints at a time.
+
+            :param location: carla.Location of the vehicle
+            :return: number of removed waypoints
+        """
+        point = (location.x, location.y, location.z)
+        removed = 0
+        while self._head < len(self._items):
+            start, end = self._head, min(len(self._items), self._head + window)
+            diff = self._xyz[start:end] - point
+            distance = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            threshold = np.full(end - start, float(min_distance))
+            if end == len(self._items):
+                threshold[-1] = last_min_distance
+            kept = np.nonzero(distance >= threshold)[0]
+            if len(kept):
+                removed += int(kept[0])
+                self._head += int(kept[0])
+                break
+            removed += end - start
+            self._head = end
+        return removed
+
+    def _compact(self):
+        """Drops the skipped waypoints once they are half of the stored ones"""
+        if self._head and self._head >= len(self._items) // 2:
+            remaining = len(self._items) - self._head
+            self._xyz[:remaining] = self._xyz[self._head:len(self._items)]
+            self._right[:remaining] = self._right[self._head:len(self._items)]
+            del self._items[:self._head]
+            self._head = 0
+
+
 class LocalPlanner(object):
     """
     LocalPlanner implements the basic behavior of following a
@@ -53,6 +182,8 @@ class LocalPlanner(object):
             max_brake: maximum brake applied to the vehicle
             max_steering: maximum steering applied to the vehicle
             offset: distance between the route waypoints and the center of the lane
+            seed: seed of the random choices at intersections
+            rng: random.Random used for the random choices at intersections, overrides 'seed'
         """
         self._vehicle = vehicle
         self._world = self._vehicle.get_world()
@@ -62,7 +193,7 @@ class LocalPlanner(object):
         self.target_waypoint = None
         self.target_road_option = None
 
-        self._waypoints_queue = deque(maxlen=10000)
+        self._waypoints_queue = WaypointPlan(maxlen=10000)
         self._min_waypoint_queue_length = 100
         self._stop_waypoint_creation = False
 
@@ -78,6 +209,7 @@ class LocalPlanner(object):
         self._offset = 0
         self._base_min_distance = 3.0
         self._follow_speed_limits = False
+        self._rng = None
 
         # Overload parameters
         if opt_dict:
@@ -103,6 +235,13 @@ class LocalPlanner(object):
                 self._base_min_distance = opt_dict['base_min_distance']
             if 'follow_speed_limits' in opt_dict:
                 self._follow_speed_limits = opt_dict['follow_speed_limits']
+            if 'rng' in opt_dict:
+                self._rng = opt_dict['rng']
+            elif 'seed' in opt_dict:
+                self._rng = random.Random(opt_dict['seed'])
+
+        if self._rng is None:
+            self._rng = random.Random()
 
         # initializing controller
         self._init_controller()
@@ -158,8 +297,9 @@ class LocalPlanner(object):
         available_entries = self._waypoints_queue.maxlen - len(self._waypoints_queue)
         k = min(available_entries, k)
 
+        new_waypoints = []
+        last_waypoint = self._waypoints_queue[-1][0]
         for _ in range(k):
-            last_waypoint = self._waypoints_queue[-1][0]
             next_waypoints = list(last_waypoint.next(self._sampling_radius))
 
             if len(next_waypoints) == 0:
@@ -172,11 +312,14 @@ class LocalPlanner(object):
                 # random choice between the possible options
                 road_options_list = _retrieve_options(
                     next_waypoints, last_waypoint)
-                road_option = random.choice(road_options_list)
+                road_option = self._rng.choice(road_options_list)
                 next_waypoint = next_waypoints[road_options_list.index(
                     road_option)]
 
-            self._waypoints_queue.append((next_waypoint, road_option))
+            new_waypoints.append((next_waypoint, road_option))
+            last_waypoint = next_waypoint
+
+        self._waypoints_queue.extend(new_waypoints)
 
     def set_global_plan(self, current_plan, stop_waypoint_creation=True, clean_queue=True):
         """
@@ -192,16 +335,12 @@ class LocalPlanner(object):
         if clean_queue:
             self._waypoints_queue.clear()
 
-        # Remake the waypoints queue if the new plan has a higher length than the queue
+        # Make room for the new plan if it has a higher length than the queue
         new_plan_length = len(current_plan) + len(self._waypoints_queue)
         if new_plan_length > self._waypoints_queue.maxlen:
-            new_waypoint_queue = deque(maxlen=new_plan_length)
-            for wp in self._waypoints_queue:
-                new_waypoint_queue.append(wp)
-            self._waypoints_queue = new_waypoint_queue
+            self._waypoints_queue.maxlen = new_plan_length
 
-        for elem in current_plan:
-            self._waypoints_queue.append(elem)
+        self._waypoints_queue.extend(current_plan)
 
         self._stop_waypoint_creation = stop_waypoint_creation
 
@@ -225,22 +364,8 @@ class LocalPlanner(object):
         vehicle_speed = get_speed(self._vehicle) / 3.6
         self._min_distance = self._base_min_distance + 0.5 *vehicle_speed
 
-        num_waypoint_removed = 0
-        for waypoint, _ in self._waypoints_queue:
-
-            if len(self._waypoints_queue) - num_waypoint_removed == 1:
-                min_distance = 1  # Don't remove the last waypoint until very close by
-            else:
-                min_distance = self._min_distance
-
-            if veh_location.distance(waypoint.transform.location) < min_distance:
-                num_waypoint_removed += 1
-            else:
-                break
-
-        if num_waypoint_removed > 0:
-            for _ in range(num_waypoint_removed):
-                self._waypoints_queue.popleft()
+        # Don't remove the last waypoint until very close by
+        self._waypoints_queue.purge(veh_location, self._min_distance, last_min_distance=1)
 
         # Get the target waypoint and move using the PID controllers. Stop if no target waypoint
         if len(self._waypoints_queue) == 0:
@@ -275,6 +400,10 @@ class LocalPlanner(object):
             except IndexError as i:
                 return None, RoadOption.VOID
 
+    def get_rng(self):
+        """Returns the random.Random of the local planner, shared with its agent"""
+        return self._rng
+
     def get_plan(self):
         """Returns the current plan of the local planner"""
         return self._waypoints_queue
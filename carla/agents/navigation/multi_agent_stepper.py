@@ -0,0 +1,307 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides MultiAgentStepper, which steps many agents at once.
+
+The agents keep running their own navigation logic, but instead of running their PID
+controllers one at a time, they hand their (target speed, target location) to the stepper.
+The controls of every agent are then computed together with NumPy and sent to the
+simulator in a single batch of carla.command.ApplyVehicleControl.
+"""
+
+import math
+
+import numpy as np
+
+import carla
+from agents.navigation.simple_agent import SimpleAgent
+
+
+class ControlRequests(object):
+    """
+    Collects the control requests of one agent during a step. Each request returns a
+    placeholder carla.VehicleControl with NaN values, which the agent can still modify
+    (for example, the emergency stops set the throttle and brake). The values left to
+    NaN are filled by the stepper.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def request(self, target_speed, target_location):
+        """
+        :param target_speed: target speed, in Km/h
+        :param target_location: carla.Location the vehicle steers to
+        :return: placeholder carla.VehicleControl
+        """
+        control = carla.VehicleControl()
+        control.throttle = float('nan')
+        control.steer = float('nan')
+        control.brake = float('nan')
+        self.items.append((target_speed, target_location.x, target_location.y, control))
+        return control
+
+
+class BatchErrorBuffer(object):
+    """
+    Vectorized PIDErrorBuffer: row i holds the ring buffer of the i-th agent,
+    with the same update rules as the scalar version.
+    """
+
+    def __init__(self, size=10):
+        self.size = size
+        self.values = np.zeros((0, size))
+        self.count = np.zeros(0, dtype=np.int64)
+        self.next = np.zeros(0, dtype=np.int64)
+        self.sum = np.zeros(0)
+        self.last = np.zeros(0)
+        self.previous = np.zeros(0)
+
+    def add(self, state):
+        """Adds a row, initialized with the state of a PIDErrorBuffer (see PIDErrorBuffer.get_state)"""
+        values, count, next_index, total, last, previous = state
+        self.values = np.vstack((self.values, np.asarray(values, dtype=np.float64)[None, :self.size]))
+        self.count = np.append(self.count, count)
+        self.next = np.append(self.next, next_index)
+        self.sum = np.append(self.sum, total)
+        self.last = np.append(self.last, last)
+        self.previous = np.append(self.previous, previous)
+
+    def remove(self, row):
+        """Removes a row, returning its state"""
+        state = self.get_state(row)
+        for name in ('values', 'count', 'next', 'sum', 'last', 'previous'):
+            setattr(self, name, np.delete(getattr(self, name), row, axis=0))
+        return state
+
+    def get_state(self, row):
+        return ([float(v) for v in self.values[row]], int(self.count[row]), int(self.next[row]),
+                float(self.sum[row]), float(self.last[row]), float(self.previous[row]))
+
+    def append(self, rows, errors):
+        """Appends one error to each of the given rows"""
+        slot = self.next[rows]
+        full = self.count[rows] == self.size
+        self.sum[rows] -= np.where(full, self.values[rows, slot], 0.0)
+        self.count[rows] += ~full
+        self.values[rows, slot] = errors
+        self.sum[rows] += errors
+        self.previous[rows] = self.last[rows]
+        self.last[rows] = errors
+
+        slot = slot + 1
+        wrapped = slot == self.size
+        slot[wrapped] = 0
+        self.next[rows] = slot
+        if np.any(wrapped):
+            # Ordered buffers are re-summed, in the same order as the builtin sum()
+            wrapped_rows = rows[wrapped]
+            total = np.zeros(len(wrapped_rows))
+            for k in range(self.size):
+                total = total + self.values[wrapped_rows, k]
+            self.sum[wrapped_rows] = total
+
+    def derivative_and_integral(self, rows, dt):
+        valid = self.count[rows] >= 2
+        derivative = np.where(valid, (self.last[rows] - self.previous[rows]) / dt, 0.0)
+        integral = np.where(valid, self.sum[rows] * dt, 0.0)
+        return derivative, integral
+
+
+class MultiAgentStepper(object):
+    """
+    MultiAgentStepper owns the controllers of several agents (BasicAgent, BehaviorAgent and their
+    subclasses, or SimpleAgent) and steps all of them with a single call to run_step.
+
+    While an agent belongs to the stepper, the state of its PID controllers lives in the stepper.
+    It is written back to the agent by remove_agent, so the agent can be used on its own again.
+    """
+
+    def __init__(self, client, agents=None):
+        """
+        :param client: carla.Client used to send the batch of commands
+        :param agents: optional list of agents to add
+        """
+        self._client = client
+        self._agents = []
+        self._requests = []
+
+        # Parameters of the controllers, one entry per agent
+        self._lon_k = np.zeros((0, 3))
+        self._lat_k = np.zeros((0, 3))
+        self._lon_dt = np.zeros(0)
+        self._lat_dt = np.zeros(0)
+        self._max_throttle = np.zeros(0)
+        self._max_brake = np.zeros(0)
+        self._max_steer = np.zeros(0)
+        self._steer_rate = np.zeros(0)
+        self._past_steering = np.zeros(0)
+
+        self._lon_errors = BatchErrorBuffer()
+        self._lat_errors = BatchErrorBuffer()
+
+        for agent in agents or []:
+            self.add_agent(agent)
+
+    def __len__(self):
+        return len(self._agents)
+
+    @staticmethod
+    def _controller_of(agent):
+        """Returns the object doing the control of an agent: the agent itself or its VehiclePIDController"""
+        if isinstance(agent, SimpleAgent):
+            return agent
+        return agent.get_local_planner()._vehicle_controller
+
+    def add_agent(self, agent):
+        """Adds an agent to the stepper"""
+        controller = self._controller_of(agent)
+        requests = ControlRequests()
+        controller.control_requests = requests
+
+        if isinstance(agent, SimpleAgent):
+            lon_k = lat_k = (agent._k_p, agent._k_i, agent._k_d)
+            lon_dt = lat_dt = agent._dt
+            lon_state, lat_state = agent._error_buffer.get_state(), agent._e_buffer.get_state()
+            limits = (agent._max_throt, agent._max_brake, 1.0, np.inf, 0.0)
+        else:
+            lon, lat = controller._lon_controller, controller._lat_controller
+            lon_k, lat_k = (lon._k_p, lon._k_i, lon._k_d), (lat._k_p, lat._k_i, lat._k_d)
+            lon_dt, lat_dt = lon._dt, lat._dt
+            lon_state, lat_state = lon._error_buffer.get_state(), lat._e_buffer.get_state()
+            limits = (controller.max_throt, controller.max_brake, controller.max_steer, 0.1,
+                      controller.past_steering)
+
+        self._agents.append(agent)
+        self._requests.append(requests)
+        self._lon_k = np.vstack((self._lon_k, [lon_k]))
+        self._lat_k = np.vstack((self._lat_k, [lat_k]))
+        self._lon_dt = np.append(self._lon_dt, lon_dt)
+        self._lat_dt = np.append(self._lat_dt, lat_dt)
+        max_throttle, max_brake, max_steer, steer_rate, past_steering = limits
+        self._max_throttle = np.append(self._max_throttle, max_throttle)
+        self._max_brake = np.append(self._max_brake, max_brake)
+        self._max_steer = np.append(self._max_steer, max_steer)
+        self._steer_rate = np.append(self._steer_rate, steer_rate)
+        self._past_steering = np.append(self._past_steering, past_steering)
+        self._lon_errors.add(lon_state)
+        self._lat_errors.add(lat_state)
+
+    def remove_agent(self, agent):
+        """Removes an agent, giving it back the state of its controllers"""
+        row = self._agents.index(agent)
+        controller = self._controller_of(agent)
+        controller.control_requests = None
+
+        lon_state, lat_state = self._lon_errors.remove(row), self._lat_errors.remove(row)
+        if isinstance(agent, SimpleAgent):
+            agent._error_buffer.set_state(lon_state)
+            agent._e_buffer.set_state(lat_state)
+        else:
+            controller._lon_controller._error_buffer.set_state(lon_state)
+            controller._lat_controller._e_buffer.set_state(lat_state)
+            controller.past_steering = float(self._past_steering[row])
+
+        del self._agents[row]
+        del self._requests[row]
+        for name in ('_lon_k', '_lat_k', '_lon_dt', '_lat_dt', '_max_throttle', '_max_brake',
+                     '_max_steer', '_steer_rate', '_past_steering'):
+            setattr(self, name, np.delete(getattr(self, name), row, axis=0))
+
+    def run_step(self, apply=True, tick=False):
+        """
+        Runs one step of every agent.
+
+            :param apply: send the controls to the simulator, in a single batch
+            :param tick: also tick the world in the same batch (synchronous mode only)
+            :return: list with the carla.VehicleControl of every agent, in the order they were added
+        """
+        controls = []
+        for agent, requests in zip(self._agents, self._requests):
+            del requests.items[:]
+            controls.append(agent.run_step())
+
+        if self._agents:
+            self._compute_controls()
+
+        if apply:
+            self.apply_controls(controls, tick)
+        return controls
+
+    def apply_controls(self, controls, tick=False):
+        """Sends the controls of the agents to the simulator with one apply_batch_sync call"""
+        batch = [carla.command.ApplyVehicleControl(agent._vehicle.id, control)
+                 for agent, control in zip(self._agents, controls)]
+        return self._client.apply_batch_sync(batch, tick)
+
+    def _read_states(self):
+        """Reads the speed (Km/h) and forward vector of every vehicle from one world snapshot"""
+        snapshot = self._agents[0]._vehicle.get_world().get_snapshot()
+        num_agents = len(self._agents)
+        speed = np.empty(num_agents)
+        state = np.empty((num_agents, 4))
+        for i, agent in enumerate(self._agents):
+            actor_snapshot = snapshot.find(agent._vehicle.id)
+            velocity = actor_snapshot.get_velocity()
+            transform = actor_snapshot.get_transform()
+            forward = transform.get_forward_vector()
+            location = transform.location
+            speed[i] = 3.6 * math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2)
+            state[i] = (location.x, location.y, forward.x, forward.y)
+        return speed, state
+
+    def _compute_controls(self):
+        """Runs the PID controllers of every pending request, as (N,) array operations"""
+        speed, state = self._read_states()
+
+        # Agents can request several controls in a step, they are processed in order
+        num_rounds = max(len(requests.items) for requests in self._requests)
+        for r in range(num_rounds):
+            rows = np.array([i for i, requests in enumerate(self._requests) if len(requests.items) > r],
+                            dtype=np.int64)
+            items = [self._requests[i].items[r] for i in rows]
+            target = np.array([item[:3] for item in items], dtype=np.float64)
+
+            throttle, steer, brake = self._pid_step(rows, target, speed[rows], state[rows])
+            for k, (_, _, _, control) in enumerate(items):
+                if math.isnan(control.throttle):
+                    control.throttle = float(throttle[k])
+                if math.isnan(control.steer):
+                    control.steer = float(steer[k])
+                if math.isnan(control.brake):
+                    control.brake = float(brake[k])
+
+    def _pid_step(self, rows, target, speed, state):
+        """Vectorized version of VehiclePIDController.run_step"""
+        # Longitudinal control
+        error = target[:, 0] - speed
+        self._lon_errors.append(rows, error)
+        _de, _ie = self._lon_errors.derivative_and_integral(rows, self._lon_dt[rows])
+        k = self._lon_k[rows]
+        acceleration = np.clip(k[:, 0] * error + k[:, 2] * _de + k[:, 1] * _ie, -1.0, 1.0)
+
+        # Lateral control, same as controller.steering_error
+        wx, wy = target[:, 1] - state[:, 0], target[:, 2] - state[:, 1]
+        vx, vy = state[:, 2], state[:, 3]
+        wv_linalg = np.sqrt(wx * wx + wy * wy) * np.sqrt(vx * vx + vy * vy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cosine = np.clip((wx * vx + wy * vy) / wv_linalg, -1.0, 1.0)
+        _dot = np.where(wv_linalg == 0, 1.0, np.arccos(cosine))
+        _dot = np.where(vx * wy - vy * wx < 0, -_dot, _dot)
+        self._lat_errors.append(rows, _dot)
+        _de, _ie = self._lat_errors.derivative_and_integral(rows, self._lat_dt[rows])
+        k = self._lat_k[rows]
+        steering = np.clip(k[:, 0] * _dot + k[:, 2] * _de + k[:, 1] * _ie, -1.0, 1.0)
+
+        # Steering regulation: changes cannot happen abruptly, can't steer too much.
+        past = self._past_steering[rows]
+        rate = self._steer_rate[rows]
+        steering = np.clip(steering, past - rate, past + rate)
+        max_steer = self._max_steer[rows]
+        steering = np.clip(steering, -max_steer, max_steer)
+        self._past_steering[rows] = steering
+
+        throttle = np.where(acceleration >= 0.0, np.minimum(acceleration, self._max_throttle[rows]), 0.0)
+        brake = np.where(acceleration >= 0.0, 0.0, np.minimum(np.abs(acceleration), self._max_brake[rows]))
+        return throttle, steering, brake
@@ -0,0 +1,674 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a compact, serializable version of the road graph
+built by the GlobalRoutePlanner.
+
+The graph is stored in plain NumPy arrays (node coordinates, CSR adjacency and
+per-edge packed waypoint poses) so it can be pickled, built offline from an
+OpenDRIVE file and memory-mapped by several worker processes. Waypoints are only
+recreated when a route is handed to the LocalPlanner.
+"""
+
+import heapq
+import json
+import math
+import os
+
+import numpy as np
+
+import carla
+from agents.navigation.local_planner import RoadOption
+from agents.tools.spatial_index import GridIndex
+
+# Columns of the packed pose array
+POSE_FIELDS = ('x', 'y', 'z', 'pitch', 'yaw', 'roll', 's')
+_X, _Y, _Z, _PITCH, _YAW, _ROLL, _S = range(len(POSE_FIELDS))
+
+
+class RoadGraph(object):
+    """
+    RoadGraph stores the GlobalRoutePlanner topology as NumPy arrays:
+
+        - node_ids (N,): id of the node in the networkx graph
+        - node_xyz (N, 3): (x,y,z) position of every node
+        - indptr (N+1,), indices (E,): CSR adjacency, edge e goes from its row to indices[e]
+        - edge_src (E,): source node of every edge
+        - edge_length (E,): cost of the edge, as used by the path search
+        - edge_type (E,): RoadOption value of the edge
+        - edge_intersection (E,): whether the edge belongs to a junction
+        - edge_entry_vector, edge_exit_vector, edge_net_vector (E, 3): NaN if not defined
+        - edge_ptr (E+1,): slice of the packed arrays holding the waypoints of the edge,
+            entry waypoint first and exit waypoint last
+        - poses (P, 7): x, y, z, pitch, yaw, roll and s of every packed waypoint
+        - lane_keys (P, 3): road_id, section_id and lane_id of every packed waypoint
+        - lane_table (L, 3), lane_edge (L,): map from (road_id, section_id, lane_id) to edge
+    """
+
+    _ARRAYS = ('node_ids', 'node_xyz', 'indptr', 'indices', 'edge_src', 'edge_length', 'edge_type',
+               'edge_intersection', 'edge_entry_vector', 'edge_exit_vector', 'edge_net_vector',
+               'edge_ptr', 'poses', 'lane_keys', 'lane_table', 'lane_edge')
+
+    def __init__(self, arrays, sampling_resolution, map_name=None):
+        """
+        :param arrays: dictionary with one entry for each name in RoadGraph._ARRAYS
+        :param sampling_resolution: distance between the packed waypoints
+        :param map_name: name of the map the graph was built from
+        """
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        self.sampling_resolution = sampling_resolution
+        self.map_name = map_name
+        self._build_lookups()
+
+    def _build_lookups(self):
+        """Builds the small in-memory dictionaries used to query the arrays"""
+        self._node_index = {int(n): i for i, n in enumerate(self.node_ids)}
+        self._lane_to_edge = {
+            tuple(int(v) for v in key): int(e) for key, e in zip(self.lane_table, self.lane_edge)}
+        self._index = None
+        self._index_poses = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_node_index', '_lane_to_edge', '_index', '_index_poses'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_lookups()
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    # ------------------------------------------------------------------------
+    # Construction and serialization
+    # ------------------------------------------------------------------------
+
+    @classmethod
+    def from_planner(cls, planner):
+        """
+        Packs the networkx graph of an already built GlobalRoutePlanner.
+
+            :param planner: GlobalRoutePlanner instance
+        """
+        graph = planner._graph
+        node_ids = np.array(list(graph.nodes), dtype=np.int64)
+        node_index = {int(n): i for i, n in enumerate(node_ids)}
+        node_xyz = np.array([graph.nodes[n]['vertex'] for n in graph.nodes], dtype=np.float64).reshape(-1, 3)
+
+        # Edges sorted by source node, keeping the networkx insertion order of the neighbors
+        edges = sorted(graph.edges(data=True), key=lambda e: node_index[e[0]])
+        num_edges = len(edges)
+
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        indices = np.empty(num_edges, dtype=np.int64)
+        edge_src = np.empty(num_edges, dtype=np.int64)
+        edge_length = np.empty(num_edges, dtype=np.float64)
+        edge_type = np.empty(num_edges, dtype=np.int8)
+        edge_intersection = np.empty(num_edges, dtype=bool)
+        vectors = {name: np.full((num_edges, 3), np.nan) for name in ('entry_vector', 'exit_vector', 'net_vector')}
+        edge_ptr = np.zeros(num_edges + 1, dtype=np.int64)
+        poses = []
+        lane_keys = []
+
+        for e, (n1, n2, data) in enumerate(edges):
+            src, dst = node_index[n1], node_index[n2]
+            indptr[src + 1] += 1
+            indices[e] = dst
+            edge_src[e] = src
+            edge_length[e] = data['length']
+            edge_type[e] = data['type'].value
+            edge_intersection[e] = bool(data['intersection'])
+            for name in vectors:
+                if data.get(name) is not None:
+                    vectors[name][e] = data[name]
+
+            waypoints = [data['entry_waypoint']] + list(data['path']) + [data['exit_waypoint']]
+            for waypoint in waypoints:
+                poses.append(_waypoint_pose(waypoint))
+                lane_keys.append((waypoint.road_id, waypoint.section_id, waypoint.lane_id))
+            edge_ptr[e + 1] = edge_ptr[e] + len(waypoints)
+
+        indptr = np.cumsum(indptr)
+
+        lane_table = []
+        lane_edge = []
+        edge_lookup = {(int(edge_src[e]), int(indices[e])): e for e in range(num_edges)}
+        for road_id, sections in planner._road_id_to_edge.items():
+            for section_id, lanes in sections.items():
+                for lane_id, (n1, n2) in lanes.items():
+                    edge = edge_lookup.get((node_index.get(n1), node_index.get(n2)))
+                    if edge is not None:
+                        lane_table.append((road_id, section_id, lane_id))
+                        lane_edge.append(edge)
+
+        arrays = {
+            'node_ids': node_ids,
+            'node_xyz': node_xyz,
+            'indptr': indptr,
+            'indices': indices,
+            'edge_src': edge_src,
+            'edge_length': edge_length,
+            'edge_type': edge_type,
+            'edge_intersection': edge_intersection,
+            'edge_entry_vector': vectors['entry_vector'],
+            'edge_exit_vector': vectors['exit_vector'],
+            'edge_net_vector': vectors['net_vector'],
+            'edge_ptr': edge_ptr,
+            'poses': np.array(poses, dtype=np.float64).reshape(-1, len(POSE_FIELDS)),
+            'lane_keys': np.array(lane_keys, dtype=np.int32).reshape(-1, 3),
+            'lane_table': np.array(lane_table, dtype=np.int32).reshape(-1, 3),
+            'lane_edge': np.array(lane_edge, dtype=np.int64),
+        }
+        return cls(arrays, planner._sampling_resolution, planner._wmap.name)
+
+    @classmethod
+    def from_map(cls, wmap, sampling_resolution):
+        """
+        Builds the graph from a carla.Map.
+
+            :param wmap: carla.Map object
+            :param sampling_resolution: distance between the packed waypoints
+        """
+        # Imported here as the planner imports this module
+        from agents.navigation.global_route_planner import GlobalRoutePlanner
+        return cls.from_planner(GlobalRoutePlanner(wmap, sampling_resolution))
+
+    @classmethod
+    def from_xodr(cls, xodr_file, sampling_resolution):
+        """
+        Builds the graph offline, without a running simulator.
+
+            :param xodr_file: path to an OpenDRIVE (.xodr) file
+            :param sampling_resolution: distance between the packed waypoints
+        """
+        with open(xodr_file, 'r') as f:
+            xodr = f.read()
+        name = os.path.splitext(os.path.basename(xodr_file))[0]
+        return cls.from_map(carla.Map(name, xodr), sampling_resolution)
+
+    def save(self, directory):
+        """
+        Writes the graph to a directory, one .npy file per array,
+        so that it can later be memory-mapped.
+
+            :param directory: output directory, created if needed
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'sampling_resolution': self.sampling_resolution, 'map_name': self.map_name}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Loads a graph written by RoadGraph.save.
+
+            :param directory: directory the graph was saved to
+            :param mmap_mode: passed to numpy.load. The default ('r') shares the
+                pages of the arrays between every process that loads them
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in cls._ARRAYS}
+        return cls(arrays, meta['sampling_resolution'], meta['map_name'])
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    def node_index(self, node_id):
+        """Returns the array index of a networkx node id"""
+        return self._node_index[node_id]
+
+    def lane_edge_index(self, road_id, section_id, lane_id):
+        """Returns the edge a lane belongs to, or None if it isn't part of the graph"""
+        return self._lane_to_edge.get((road_id, section_id, lane_id))
+
+    def edge_index(self, src, dst):
+        """Returns the index of the edge going from node src to node dst"""
+        for e in range(self.indptr[src], self.indptr[src + 1]):
+            if self.indices[e] == dst:
+                return e
+        raise KeyError((src, dst))
+
+    def edge_poses(self, edge):
+        """Returns the poses of the waypoints of an edge, from entry to exit"""
+        return self.poses[self.edge_ptr[edge]:self.edge_ptr[edge + 1]]
+
+    def edge_lane_keys(self, edge):
+        """Returns the (road_id, section_id, lane_id) of the waypoints of an edge"""
+        return self.lane_keys[self.edge_ptr[edge]:self.edge_ptr[edge + 1]]
+
+    def edge_nodes(self, edge):
+        """Returns the networkx node ids (n1, n2) of an edge"""
+        return int(self.node_ids[self.edge_src[edge]]), int(self.node_ids[self.indices[edge]])
+
+    def get_index(self):
+        """
+        Returns the GridIndex of the packed waypoints used by localize, built on first use.
+        Only the waypoints strictly inside lane follow edges outside of junctions are indexed,
+        which are the ones that belong to a single lane without ambiguity.
+        """
+        if self._index is None:
+            lanefollow = self.edge_type == RoadOption.LANEFOLLOW.value
+            counts = np.diff(self.edge_ptr)
+            pose_edge = np.repeat(np.arange(self.num_edges), counts)
+            first = np.zeros(len(self.poses), dtype=bool)
+            last = np.zeros(len(self.poses), dtype=bool)
+            first[self.edge_ptr[:-1][counts > 0]] = True
+            last[self.edge_ptr[1:][counts > 0] - 1] = True
+            mask = lanefollow[pose_edge] & ~self.edge_intersection[pose_edge] & ~first & ~last
+            self._index_poses = np.nonzero(mask)[0]
+            self._index = GridIndex(self.poses[self._index_poses, :3], cell_size=max(self.sampling_resolution, 1.0))
+        return self._index
+
+    def _max_localize_distance(self, max_distance):
+        if max_distance is None:
+            # Closer than half the resolution to an indexed waypoint, the location can't
+            # be on another lane nor past the end of the lane of that waypoint
+            max_distance = min(0.5 * self.sampling_resolution, 1.0)
+        return max_distance
+
+    def nearest_waypoint(self, xyz, max_distance=None):
+        """
+        Client side replacement of carla.Map.get_waypoint.
+
+            :param xyz: (x, y, z) of the location
+            :param max_distance: maximum distance to the waypoint, defaults to half the resolution
+            :return: index of the closest packed waypoint, or None if there is none close enough
+                (junctions, lane ends or locations outside of the roads)
+        """
+        distance, index = self.get_index().nearest(*xyz)
+        if index < 0 or distance > self._max_localize_distance(max_distance):
+            return None
+        return int(self._index_poses[index])
+
+    def nearest_waypoints(self, xyz, max_distance=None):
+        """
+        Batch version of nearest_waypoint.
+
+            :param xyz: (Q, 3) array of locations
+            :return: array with the packed waypoint index of each location, -1 where unknown
+        """
+        distances, indices = self.get_index().nearest_many(xyz)
+        valid = (indices >= 0) & (distances <= self._max_localize_distance(max_distance))
+        return np.where(valid, self._index_poses[np.maximum(indices, 0)], -1)
+
+    def localize(self, xyz, max_distance=None):
+        """
+        Client side version of GlobalRoutePlanner._localize.
+
+            :return: index of the edge the location belongs to, or None if unknown
+        """
+        index = self.nearest_waypoint(xyz, max_distance)
+        if index is None:
+            return None
+        return self._lane_to_edge.get(tuple(int(v) for v in self.lane_keys[index]))
+
+    def localize_many(self, xyz, max_distance=None):
+        """
+        Batch version of localize.
+
+            :return: array with the edge of each location, -1 where unknown
+        """
+        edges = np.full(len(xyz), -1, dtype=np.int64)
+        for q, index in enumerate(self.nearest_waypoints(xyz, max_distance)):
+            if index >= 0:
+                edges[q] = self._lane_to_edge.get(tuple(int(v) for v in self.lane_keys[index]), -1)
+        return edges
+
+    def waypoint_entry(self, index):
+        """Returns the (pose, lane_key) of a packed waypoint, as used by trace_route"""
+        return self.poses[index], tuple(int(v) for v in self.lane_keys[index])
+
+    def path_search(self, origin_key, destination_key):
+        """
+        Finds the shortest path between two lanes using A* search with distance heuristic.
+
+            :param origin_key: (road_id, section_id, lane_id) of the start position
+            :param destination_key: (road_id, section_id, lane_id) of the end position
+            :return: list of node indices connecting origin and destination
+        """
+        start = self._lane_to_edge[tuple(origin_key)]
+        end = self._lane_to_edge[tuple(destination_key)]
+        route = self.shortest_path(int(self.edge_src[start]), int(self.edge_src[end]))
+        if route is None:
+            raise ValueError('No route between lanes {} and {}'.format(origin_key, destination_key))
+        route.append(int(self.indices[end]))
+        return route
+
+    def path_search_many(self, origin_keys, destination_keys):
+        """
+        Many-to-many version of path_search, running a single Dijkstra search
+        per distinct origin node instead of one A* search per pair.
+
+            :param origin_keys: list of (road_id, section_id, lane_id) of the start positions
+            :param destination_keys: list of (road_id, section_id, lane_id) of the end positions
+            :return: (costs, routes) where costs[i, j] is the length of the route from origin i
+                to destination j (inf if unreachable) and routes[i][j] the route as returned
+                by path_search (None if unreachable)
+        """
+        starts = [self._lane_to_edge[tuple(key)] for key in origin_keys]
+        ends = [self._lane_to_edge[tuple(key)] for key in destination_keys]
+        costs = np.full((len(starts), len(ends)), np.inf)
+        routes = [[None] * len(ends) for _ in starts]
+
+        trees = {}
+        for i, start in enumerate(starts):
+            source = int(self.edge_src[start])
+            if source not in trees:
+                trees[source] = self.shortest_path_tree(source)
+            distance, parent = trees[source]
+            for j, end in enumerate(ends):
+                target = int(self.edge_src[end])
+                if np.isinf(distance[target]):
+                    continue
+                route = [target]
+                while route[-1] != source:
+                    route.append(int(parent[route[-1]]))
+                route.reverse()
+                route.append(int(self.indices[end]))
+                costs[i, j] = distance[target]
+                routes[i][j] = route
+        return costs, routes
+
+    def shortest_path(self, source, target):
+        """
+        A* search between two node indices, using the euclidean distance
+        to the target as heuristic. Returns None if there is no path.
+
+        The edge costs count waypoints, sampling_resolution meters apart, so the
+        distance is divided by sampling_resolution to never overestimate the cost
+        left, and the route found costs the same as the one of the Dijkstra
+        search of shortest_path_tree. Lane changes are the exception: they cost nothing while
+        moving sideways, so routes with lane changes can still differ between both.
+        """
+        xyz = self.node_xyz
+        tx, ty, tz = (float(v) for v in xyz[target])
+        indptr, indices, length = self.indptr, self.indices, self.edge_length
+        scale = 1.0 / self.sampling_resolution
+
+        def heuristic(n):
+            x, y, z = xyz[n]
+            return scale * math.sqrt((x - tx) ** 2 + (y - ty) ** 2 + (z - tz) ** 2)
+
+        counter = 0
+        queue = [(0.0, counter, source, 0.0, -1)]
+        enqueued = {}
+        explored = {}
+        while queue:
+            _, _, node, cost, parent = heapq.heappop(queue)
+            if node == target:
+                route = [node]
+                node = parent
+                while node != -1:
+                    route.append(node)
+                    node = explored[node]
+                route.reverse()
+                return route
+            if node in explored:
+                if explored[node] == -1:
+                    continue
+                if enqueued[node][0] < cost:
+                    continue
+            explored[node] = parent
+            for e in range(indptr[node], indptr[node + 1]):
+                neighbor = int(indices[e])
+                new_cost = cost + length[e]
+                if neighbor in enqueued:
+                    queued_cost, h = enqueued[neighbor]
+                    if queued_cost <= new_cost:
+                        continue
+                else:
+                    h = heuristic(neighbor)
+                enqueued[neighbor] = new_cost, h
+                counter += 1
+                heapq.heappush(queue, (new_cost + h, counter, neighbor, new_cost, node))
+        return None
+
+    def shortest_path_tree(self, source):
+        """
+        Dijkstra search from a node index to every other node.
+
+            :return: (distance, parent) arrays, distance being inf and parent -1
+                for the nodes that can't be reached
+        """
+        indptr, indices, length = self.indptr, self.indices, self.edge_length
+        distance = np.full(self.num_nodes, np.inf)
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        done = np.zeros(self.num_nodes, dtype=bool)
+        distance[source] = 0.0
+        queue = [(0.0, source)]
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if done[node]:
+                continue
+            done[node] = True
+            for e in range(indptr[node], indptr[node + 1]):
+                neighbor = int(indices[e])
+                new_cost = cost + length[e]
+                if new_cost < distance[neighbor]:
+                    distance[neighbor] = new_cost
+                    parent[neighbor] = node
+                    heapq.heappush(queue, (new_cost, neighbor))
+        return distance, parent
+
+    def trace_route(self, origin, destination, route=None):
+        """
+        Array version of GlobalRoutePlanner.trace_route.
+
+            :param origin: (pose, lane_key) of the waypoint at the start of the route
+            :param destination: (pose, lane_key, location) of the waypoint at the end of the route,
+                location being the (x, y, z) requested by the user
+            :param route: node indices of the route, as returned by path_search.
+                If not given, the path search is done here
+            :return: list of (pose, lane_key, RoadOption), see RoadGraph.to_waypoints
+        """
+        current_pose, current_key = origin
+        destination_pose, destination_key, destination_xyz = destination
+        destination_key = tuple(destination_key)
+        state = {'previous_decision': RoadOption.VOID, 'intersection_end_node': -1}
+
+        route_trace = []
+        if route is None:
+            route = self.path_search(current_key, destination_key)
+
+        for i in range(len(route) - 1):
+            road_option = self._turn_decision(i, route, state)
+            edge = self.edge_index(route[i], route[i + 1])
+            edge_type = RoadOption(int(self.edge_type[edge]))
+
+            if edge_type != RoadOption.LANEFOLLOW and edge_type != RoadOption.VOID:
+                route_trace.append((current_pose, current_key, road_option))
+                exit_key = tuple(int(v) for v in self.edge_lane_keys(edge)[-1])
+                next_edge = self._lane_to_edge[exit_key]
+                next_poses = self.edge_poses(next_edge)
+                if len(next_poses) > 2:
+                    path = next_poses[1:-1]
+                    closest_index = closest_pose_index(current_pose, path)
+                    closest_index = min(len(path) - 1, closest_index + 5)
+                    index = self.edge_ptr[next_edge] + 1 + closest_index
+                else:
+                    index = self.edge_ptr[next_edge + 1] - 1
+                current_pose, current_key = self.poses[index], self.lane_keys[index]
+                route_trace.append((current_pose, current_key, road_option))
+
+            else:
+                path = self.edge_poses(edge)
+                keys = self.edge_lane_keys(edge)
+                closest_index = closest_pose_index(current_pose, path)
+                for j in range(closest_index, len(path)):
+                    current_pose, current_key = path[j], keys[j]
+                    route_trace.append((current_pose, current_key, road_option))
+                    if len(route) - i <= 2 and _distance(current_pose, destination_xyz) < 2 * self.sampling_resolution:
+                        break
+                    elif len(route) - i <= 2 and tuple(int(v) for v in current_key) == destination_key:
+                        destination_index = closest_pose_index(destination_pose, path)
+                        if closest_index > destination_index:
+                            break
+
+        return route_trace
+
+    def _successive_last_intersection_edge(self, index, route):
+        """
+        Returns the last successive intersection edge from a starting index on the route.
+        """
+        last_intersection_edge = None
+        last_node = None
+        for i in range(index, len(route) - 1):
+            candidate_edge = self.edge_index(route[i], route[i + 1])
+            if route[i] == route[index]:
+                last_intersection_edge = candidate_edge
+            if self.edge_type[candidate_edge] == RoadOption.LANEFOLLOW.value \
+                    and self.edge_intersection[candidate_edge]:
+                last_intersection_edge = candidate_edge
+                last_node = route[i + 1]
+            else:
+                break
+
+        return last_node, last_intersection_edge
+
+    def _turn_decision(self, index, route, state, threshold=math.radians(35)):
+        """
+        Returns the turn decision (RoadOption) for pair of edges around current index of route list.
+        'state' holds the decision memory of GlobalRoutePlanner._turn_decision for the current route.
+        """
+        lanefollow = RoadOption.LANEFOLLOW.value
+        decision = None
+        previous_node = route[index - 1]
+        current_node = route[index]
+        next_node = route[index + 1]
+        next_edge = self.edge_index(current_node, next_node)
+        end_node = state['intersection_end_node']
+        if index > 0:
+            if state['previous_decision'] != RoadOption.VOID \
+                    and end_node is not None and end_node >= 0 and self.node_ids[end_node] > 0 \
+                    and end_node != previous_node \
+                    and self.edge_type[next_edge] == lanefollow \
+                    and self.edge_intersection[next_edge]:
+                decision = state['previous_decision']
+            else:
+                state['intersection_end_node'] = -1
+                current_edge = self.edge_index(previous_node, current_node)
+                calculate_turn = self.edge_type[current_edge] == lanefollow \
+                    and not self.edge_intersection[current_edge] \
+                    and self.edge_type[next_edge] == lanefollow \
+                    and self.edge_intersection[next_edge]
+                if calculate_turn:
+                    last_node, tail_edge = self._successive_last_intersection_edge(index, route)
+                    state['intersection_end_node'] = last_node
+                    if tail_edge is not None:
+                        next_edge = tail_edge
+                    cv, nv = self.edge_exit_vector[current_edge], self.edge_exit_vector[next_edge]
+                    if np.isnan(cv[0]) or np.isnan(nv[0]):
+                        return RoadOption(int(self.edge_type[next_edge]))
+                    cross_list = []
+                    for e in range(self.indptr[current_node], self.indptr[current_node + 1]):
+                        if self.edge_type[e] == lanefollow and self.indices[e] != route[index + 1]:
+                            sv = self.edge_net_vector[e]
+                            cross_list.append(cv[0] * sv[1] - cv[1] * sv[0])
+                    next_cross = cv[0] * nv[1] - cv[1] * nv[0]
+                    norm = math.sqrt(cv[0] ** 2 + cv[1] ** 2 + cv[2] ** 2) * math.sqrt(nv[0] ** 2 + nv[1] ** 2 + nv[2] ** 2)
+                    cosine = (cv[0] * nv[0] + cv[1] * nv[1] + cv[2] * nv[2]) / norm
+                    deviation = math.acos(min(1.0, max(-1.0, cosine)))
+                    if not cross_list:
+                        cross_list.append(0)
+                    if deviation < threshold:
+                        decision = RoadOption.STRAIGHT
+                    elif cross_list and next_cross < min(cross_list):
+                        decision = RoadOption.LEFT
+                    elif cross_list and next_cross > max(cross_list):
+                        decision = RoadOption.RIGHT
+                    elif next_cross < 0:
+                        decision = RoadOption.LEFT
+                    elif next_cross > 0:
+                        decision = RoadOption.RIGHT
+                else:
+                    decision = RoadOption(int(self.edge_type[next_edge]))
+
+        else:
+            decision = RoadOption(int(self.edge_type[next_edge]))
+
+        state['previous_decision'] = decision
+        return decision
+
+    # ------------------------------------------------------------------------
+    # Conversion back to CARLA objects
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def to_transforms(route_trace):
+        """
+        Converts a route returned by trace_route to a list of (carla.Transform, RoadOption),
+        without needing a carla.Map.
+        """
+        return [(pose_to_transform(pose), road_option) for pose, _, road_option in route_trace]
+
+    @staticmethod
+    def to_waypoints(route_trace, wmap):
+        """
+        Converts a route returned by trace_route to the list of (carla.Waypoint, RoadOption)
+        expected by LocalPlanner.set_global_plan.
+
+            :param route_trace: list of (pose, lane_key, RoadOption)
+            :param wmap: carla.Map used to recreate the waypoints
+        """
+        plan = []
+        for pose, lane_key, road_option in route_trace:
+            plan.append((pose_to_waypoint(pose, lane_key, wmap), road_option))
+        return plan
+
+
+def pose_to_transform(pose):
+    """Converts a packed pose to a carla.Transform"""
+    return carla.Transform(
+        carla.Location(x=float(pose[_X]), y=float(pose[_Y]), z=float(pose[_Z])),
+        carla.Rotation(pitch=float(pose[_PITCH]), yaw=float(pose[_YAW]), roll=float(pose[_ROLL])))
+
+
+def pose_to_waypoint(pose, lane_key, wmap):
+    """
+    Recreates the carla.Waypoint of a packed pose. The OpenDRIVE coordinates are used
+    when available, falling back to the closest waypoint to the pose location.
+    """
+    waypoint = wmap.get_waypoint_xodr(int(lane_key[0]), int(lane_key[2]), float(pose[_S]))
+    if waypoint is None:
+        waypoint = wmap.get_waypoint(
+            carla.Location(x=float(pose[_X]), y=float(pose[_Y]), z=float(pose[_Z])))
+    return waypoint
+
+
+def waypoint_entry(waypoint):
+    """Returns the (pose, lane_key) of a carla.Waypoint, as used by RoadGraph.trace_route"""
+    return (np.array(_waypoint_pose(waypoint)),
+            (waypoint.road_id, waypoint.section_id, waypoint.lane_id))
+
+
+def _waypoint_pose(waypoint):
+    transform = waypoint.transform
+    location, rotation = transform.location, transform.rotation
+    return (location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll, waypoint.s)
+
+
+def _distance(pose, xyz):
+    return math.sqrt((pose[_X] - xyz[0]) ** 2 + (pose[_Y] - xyz[1]) ** 2 + (pose[_Z] - xyz[2]) ** 2)
+
+
+def closest_pose_index(pose, poses):
+    """Index of the pose closest to 'pose', same as GlobalRoutePlanner._find_closest_in_list"""
+    if len(poses) == 0:
+        return -1
+    diff = poses[:, :3] - pose[:3]
+    return int(np.argmin(np.einsum('ij,ij->i', diff, diff)))
@@ -3,12 +3,11 @@
 import carla
 from enum import Enum
 from shapely.geometry import Polygon
-import numpy as np
 import math
-from collections import deque
 
 from agents.navigation.local_planner import LocalPlanner
 from agents.navigation.global_route_planner import GlobalRoutePlanner
+from agents.navigation.controller import PIDErrorBuffer, clip, steering_error
 from agents.tools.misc import get_speed
 
 
@@ -30,6 +29,13 @@ class SimpleAgent(object):
         self._max_throt = 1.0
         self._max_brake = 0.3
 
+        # Errors of the longitudinal and lateral controllers, kept between steps
+        self._error_buffer = PIDErrorBuffer(size=10)
+        self._e_buffer = PIDErrorBuffer(size=10)
+
+        # If set, the controls are computed by a MultiAgentStepper (see multi_agent_stepper.py)
+        self.control_requests = None
+
         self._vehicle = vehicle
         self._world = self._vehicle.get_world()
         self._map = self._world.get_map()
@@ -45,6 +51,8 @@ class SimpleAgent(object):
     def run_step(self):
         """Execute one step of navigation."""
         #vehicle_speed = get_speed(self._vehicle) / 3.6
+        if self.control_requests is not None:
+            return self.control_requests.request(self._target_speed, self._end)
 
         throttle, brake = self.pedal(self._target_speed)        
         waypoint = self._end
@@ -59,19 +67,12 @@ class SimpleAgent(object):
         self._end = end_location
 
     def pedal(self,target_speed):
-        self._error_buffer = deque(maxlen=10)
         current_speed = get_speed(self._vehicle)
         error = target_speed - current_speed
         self._error_buffer.append(error)
+        _de, _ie = self._error_buffer.derivative_and_integral(self._dt)
 
-        if len(self._error_buffer) >= 2:
-            _de = (self._error_buffer[-1] - self._error_buffer[-2]) / self._dt
-            _ie = sum(self._error_buffer) * self._dt
-        else:
-            _de = 0.0
-            _ie = 0.0
-
-        acceleration = np.clip((self._k_p * error) + (self._k_d * _de) + (self._k_i * _ie), -1.0, 1.0)
+        acceleration = clip((self._k_p * error) + (self._k_d * _de) + (self._k_i * _ie))
 
         if acceleration >= 0.0:
             throttle = min(acceleration, self._max_throt)
@@ -83,44 +84,19 @@ class SimpleAgent(object):
         return (throttle, brake)
 
     def steer(self, waypoint, vehicle_transform):
-        
-        e_buffer = deque(maxlen=10)
         """
         Estimate the steering angle of the vehicle based on the PID equations
 
-            :param waypoint: target waypoint
+            :param waypoint: target location
             :param vehicle_transform: current transform of the vehicle
             :return: steering control in the range [-1, 1]
         """
-        # Get the ego's location and forward vector
-        ego_loc = vehicle_transform.location
-        v_vec = vehicle_transform.get_forward_vector()
-        v_vec = np.array([v_vec.x, v_vec.y, 0.0])
+        _dot = steering_error(vehicle_transform, waypoint)
 
-        w_loc = waypoint
-
-        w_vec = np.array([w_loc.x - ego_loc.x,
-                          w_loc.y - ego_loc.y,
-                          0.0])
-
-        wv_linalg = np.linalg.norm(w_vec) * np.linalg.norm(v_vec)
-        if wv_linalg == 0:
-            _dot = 1
-        else:
-            _dot = math.acos(np.clip(np.dot(w_vec, v_vec) / (wv_linalg), -1.0, 1.0))
-        _cross = np.cross(v_vec, w_vec)
-        if _cross[2] < 0:
-            _dot *= -1.0
-
-        e_buffer.append(_dot)
-        if len(e_buffer) >= 2:
-            _de = (e_buffer[-1] - e_buffer[-2]) / self._dt
-            _ie = sum(e_buffer) * self._dt
-        else:
-            _de = 0.0
-            _ie = 0.0
+        self._e_buffer.append(_dot)
+        _de, _ie = self._e_buffer.derivative_and_integral(self._dt)
 
-        return np.clip((self._k_p * _dot) + (self._k_d * _de) + (self._k_i * _ie), -1.0, 1.0)
+        return clip((self._k_p * _dot) + (self._k_d * _de) + (self._k_i * _ie))
 
     def done(self):
         """Check whether the agent has reached its destination."""
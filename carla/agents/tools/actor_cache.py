@@ -0,0 +1,134 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Per tick cache of the actors of a world, shared by every agent of the client. """
+
+import math
+
+import numpy as np
+
+import carla
+from agents.tools.spatial_index import GridIndex
+
+
+class ActorState(object):
+    """
+    State of an actor at the current tick. The transform is shared by every agent
+    reading the cache, so it must not be modified.
+    """
+
+    __slots__ = ('actor', 'id', 'transform', 'location', 'velocity', 'speed', 'bounding_box', 'radius', '_waypoint')
+
+    def __init__(self, actor, transform, velocity, bounding_box):
+        self.actor = actor
+        self.id = actor.id
+        self.transform = transform
+        self.location = transform.location
+        self.velocity = velocity
+        # Speed in Km/h, as agents.tools.misc.get_speed
+        self.speed = 3.6 * math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2)
+        self.bounding_box = bounding_box
+        # Radius of the circle around the actor location containing its bounding box, on the XY plane
+        self.radius = math.hypot(bounding_box.extent.x, bounding_box.extent.y) + \
+            math.hypot(bounding_box.location.x, bounding_box.location.y)
+        self._waypoint = None
+
+    @classmethod
+    def from_actor(cls, actor):
+        """State of an actor that isn't part of a cache, read from the actor itself"""
+        return cls(actor, actor.get_transform(), actor.get_velocity(), actor.bounding_box)
+
+    def get_waypoint(self, wmap):
+        """Waypoint of the actor of any lane type, computed once per tick"""
+        if self._waypoint is None:
+            self._waypoint = wmap.get_waypoint(self.location, lane_type=carla.LaneType.Any)
+        return self._waypoint
+
+
+class ActorCache(object):
+    """
+    ActorCache reads the vehicles, walkers and traffic lights of a world once per tick, from a
+    single world snapshot, and bins the vehicles and the walkers in uniform grids. Every agent of the same world
+    shares the cache, see ActorCache.for_world.
+    """
+
+    _caches = {}
+
+    def __init__(self, world, cell_size=10.0):
+        """
+        :param world: carla.World object
+        :param cell_size: side of the cells of the vehicle grid, in meters
+        """
+        self._world = world
+        self._cell_size = cell_size
+        self._bounding_boxes = {}
+        self.frame = None
+        self.vehicles = []
+        self.walkers = []
+        self.traffic_lights = []
+        self.max_radius = 0.0
+        self._states = {}
+        self._grid = GridIndex(np.zeros((0, 3)), cell_size)
+        self._walker_grid = GridIndex(np.zeros((0, 3)), cell_size)
+
+    @classmethod
+    def for_world(cls, world):
+        """Returns the up to date cache of a world, creating it if needed"""
+        cache = cls._caches.get(world.id)
+        if cache is None:
+            cache = cls(world)
+            cls._caches[world.id] = cache
+        cache.update()
+        return cache
+
+    def update(self):
+        """Reads the actors again if the world has moved to a new frame"""
+        snapshot = self._world.get_snapshot()
+        if snapshot.frame == self.frame:
+            return
+        self.frame = snapshot.frame
+
+        actors = self._world.get_actors()
+        self.vehicles = self._read_states(actors.filter('*vehicle*'), snapshot)
+        self.walkers = self._read_states(actors.filter('*walker.pedestrian*'), snapshot)
+        self.traffic_lights = list(actors.filter('*traffic_light*'))
+        self._states = {state.id: state for state in self.vehicles + self.walkers}
+
+        self._grid = self._build_grid(self.vehicles)
+        self._walker_grid = self._build_grid(self.walkers)
+        self.max_radius = max([v.radius for v in self.vehicles] + [0.0])
+
+    def _read_states(self, actors, snapshot):
+        """States of a list of actors, read from the world snapshot when possible"""
+        states = []
+        for actor in actors:
+            actor_snapshot = snapshot.find(actor.id)
+            if actor_snapshot:
+                transform, velocity = actor_snapshot.get_transform(), actor_snapshot.get_velocity()
+            else:
+                transform, velocity = actor.get_transform(), actor.get_velocity()
+            bounding_box = self._bounding_boxes.get(actor.id)
+            if bounding_box is None:
+                bounding_box = actor.bounding_box
+                self._bounding_boxes[actor.id] = bounding_box
+            states.append(ActorState(actor, transform, velocity, bounding_box))
+        return states
+
+    def _build_grid(self, states):
+        xyz = np.array([(s.location.x, s.location.y, s.location.z) for s in states]).reshape(-1, 3)
+        return GridIndex(xyz, self._cell_size)
+
+    def get(self, actor_id):
+        """Returns the state of a vehicle or walker, None if it isn't part of the cache"""
+        return self._states.get(actor_id)
+
+    def vehicles_near(self, location, radius):
+        """
+        Returns the states of the vehicles closer than 'radius' to a location on the XY plane,
+        in the same order as world.get_actors()
+        """
+        return [self.vehicles[i] for i in self._grid.within(location.x, location.y, radius)]
+
+    def walkers_near(self, location, radius):
+        """Same as vehicles_near, for the walkers"""
+        return [self.walkers[i] for i in self._walker_grid.within(location.x, location.y, radius)]
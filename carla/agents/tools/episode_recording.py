@@ -0,0 +1,151 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Recording of the episodes of the scenario scripts, so they can be rescored and their
+features extracted again without the simulator.
+"""
+
+import json
+
+import numpy as np
+
+import carla
+
+ACTOR_STATE_DTYPE = np.dtype([
+    ('frame', '<i8'),
+    ('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+    ('pitch', '<f8'), ('yaw', '<f8'), ('roll', '<f8'),
+    ('vx', '<f8'), ('vy', '<f8'), ('vz', '<f8'),
+    ('throttle', '<f8'), ('steer', '<f8'), ('brake', '<f8')])
+
+
+class EpisodeRecorder(object):
+    """
+    EpisodeRecorder keeps, at every capture, the state of some actors of an episode: frame,
+    transform, velocity and control. The scripts can also keep the rows they compute at every
+    tick (the log) and the events of the sensors, which are saved with the states.
+    """
+
+    def __init__(self, actors):
+        """
+        :param actors: dict of the recorded actors by role, e.g. {'ego': ego, 'adversary': adversary}
+        """
+        self._actors = dict(actors)
+        self._states = {role: [] for role in self._actors}
+        self._log_header = None
+        self._log_int_columns = []
+        self._log = []
+        self._events = {}
+
+    def capture(self, snapshot):
+        """Keeps the state of every actor in a carla.WorldSnapshot, with its current control"""
+        frame = snapshot.frame
+        for role, actor in self._actors.items():
+            actor_snapshot = snapshot.find(actor.id)
+            transform = actor_snapshot.get_transform()
+            velocity = actor_snapshot.get_velocity()
+            control = actor.get_control()
+            self._states[role].append((
+                frame,
+                transform.location.x, transform.location.y, transform.location.z,
+                transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll,
+                velocity.x, velocity.y, velocity.z,
+                control.throttle, control.steer, control.brake))
+
+    def log(self, header, row):
+        """Keeps a row computed at a tick, all the rows have the same header and column types"""
+        if not self._log:
+            self._log_header = list(header)
+            self._log_int_columns = [i for i, v in enumerate(row) if isinstance(v, (int, np.integer))]
+        self._log.append(list(row))
+
+    def set_events(self, name, columns):
+        """Keeps the events of a sensor, as a dict of columns, e.g. ObstacleSensor.history"""
+        self._events[name] = {key: list(values) for key, values in columns.items()}
+
+    def save(self, file_name, metadata=None):
+        """Writes the recording to a .npz file, with a dict of JSON metadata"""
+        arrays = {'state_' + role: np.array(rows, dtype=ACTOR_STATE_DTYPE) for role, rows in self._states.items()}
+        arrays['log'] = np.array(self._log, dtype=np.float64).reshape(len(self._log), len(self._log_header or []))
+        for name, columns in self._events.items():
+            for key, values in columns.items():
+                arrays['event_{}__{}'.format(name, key)] = np.array(values)
+        arrays['metadata'] = np.array(json.dumps({
+            'roles': list(self._states), 'log_header': self._log_header or [],
+            'log_int_columns': self._log_int_columns,
+            'events': {name: list(columns) for name, columns in self._events.items()},
+            'metadata': metadata or {}}, default=_json_value))
+        with open(file_name, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+
+def _json_value(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class EpisodeRecording(object):
+    """
+    Recording written by EpisodeRecorder, loaded in memory:
+
+        states[role]: record array of ACTOR_STATE_DTYPE, one record per capture
+        log_header, log: rows kept at every tick, as a (ticks, columns) array
+        events[name]: dict of the columns of the events of a sensor
+        metadata: dict given to EpisodeRecorder.save
+    """
+
+    def __init__(self, file_name):
+        with np.load(file_name) as data:
+            header = json.loads(str(data['metadata']))
+            self.states = {role: data['state_' + role] for role in header['roles']}
+            self.log_header = header['log_header']
+            self._log_int_columns = header['log_int_columns']
+            self.log = data['log']
+            self.events = {name: {key: data['event_{}__{}'.format(name, key)].tolist() for key in keys}
+                           for name, keys in header['events'].items()}
+        self.metadata = header['metadata']
+        self.file_name = file_name
+
+    def __len__(self):
+        return len(next(iter(self.states.values()))) if self.states else 0
+
+    def log_rows(self):
+        """Rows of the log as lists, with the columns that were integers as integers"""
+        rows = self.log.tolist()
+        for row in rows:
+            for i in self._log_int_columns:
+                row[i] = int(row[i])
+        return rows
+
+    def speed(self, role):
+        """Speed of an actor at every capture, in m/s"""
+        s = self.states[role]
+        return np.sqrt(s['vx'] ** 2 + s['vy'] ** 2 + s['vz'] ** 2)
+
+    def distance(self, role1, role2):
+        """2D distance between two actors at every capture, in meters"""
+        a, b = self.states[role1], self.states[role2]
+        return np.sqrt((a['x'] - b['x']) ** 2 + (a['y'] - b['y']) ** 2)
+
+
+def replay_in_world(world, recording, actors, tick=None):
+    """
+    Plays a recording in the simulator for a visual replay: the physics of the actors is
+    disabled and they are moved to their recorded transform before every tick.
+
+        :param world: carla.World, in synchronous mode
+        :param actors: dict of the spawned actors by role
+        :param tick: function ticking the world (default: world.tick)
+    """
+    tick = tick or world.tick
+    for actor in actors.values():
+        actor.set_simulate_physics(False)
+    for k in range(len(recording)):
+        for role, actor in actors.items():
+            s = recording.states[role][k]
+            actor.set_transform(carla.Transform(
+                carla.Location(x=float(s['x']), y=float(s['y']), z=float(s['z'])),
+                carla.Rotation(pitch=float(s['pitch']), yaw=float(s['yaw']), roll=float(s['roll']))))
+        tick()
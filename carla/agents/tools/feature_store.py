@@ -0,0 +1,212 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" SQLite index of the feature files written by the scenario scripts. """
+
+import collections
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+
+TraceRecord = collections.namedtuple(
+    'TraceRecord', ['id', 'path_id', 'label', 'score', 'event_frame', 'seed', 'parameters', 'created', 'trace'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path_id TEXT,
+    label INTEGER,
+    score REAL,
+    event_frame INTEGER,
+    seed INTEGER,
+    parameters TEXT,
+    created REAL NOT NULL,
+    trace TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS traces_score ON traces (score);
+CREATE INDEX IF NOT EXISTS traces_label_score ON traces (label, score);
+CREATE INDEX IF NOT EXISTS traces_path_id ON traces (path_id);
+"""
+
+# features_path{num}_label{label}_score{score}_frame{frame}.csv, written by Execute_scenario.py
+_FEATURES_NAME = re.compile(r'^features_path(?P<path_id>[^_]+)_label(?P<label>-?\d+)_score\s*(?P<score>[^_]+)'
+                            r'_frame(?P<frame>-?\d+)\.csv$')
+# {time}_{score}_{label}.csv, written by CarlaScenario.write_features
+_LABEL_NAME = re.compile(r'^(?P<time>\d{8}-\d{6})_(?P<score>-?\d+)_(?P<label>\d+)\.csv$')
+
+
+def _cast(kind, value):
+    """Python number of a value, which can be a NumPy scalar"""
+    return None if value is None else kind(value)
+
+
+def _json_value(value):
+    """JSON value of the NumPy scalars and arrays in the parameters"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def parse_trace_name(file_name):
+    """
+    Returns the fields encoded in the name of a feature file, as keyword arguments of
+    FeatureStore.add, or None if the name has none of the known formats
+    """
+    match = _FEATURES_NAME.match(file_name)
+    if match is not None:
+        return {'path_id': match.group('path_id'), 'label': int(match.group('label')),
+                'score': float(match.group('score')), 'event_frame': int(match.group('frame'))}
+    match = _LABEL_NAME.match(file_name)
+    if match is not None:
+        created = time.mktime(time.strptime(match.group('time'), '%Y%m%d-%H%M%S'))
+        return {'label': int(match.group('label')), 'score': float(match.group('score')), 'created': created}
+    return None
+
+
+def read_path_parameters(trace):
+    """
+    Returns the parameters of the '_path.csv' file written next to a feature file by
+    CarlaScenario.write_features, or None if there is none
+    """
+    path_file = os.path.splitext(trace)[0] + '_path.csv'
+    if not os.path.isfile(path_file):
+        return None
+    with open(path_file, mode='r', newline='') as csv_file:
+        rows = [row for row in csv.reader(csv_file) if row]
+    if len(rows) < 2:
+        return None
+    return dict(zip(rows[0], rows[1]))
+
+
+class FeatureStore(object):
+    """
+    FeatureStore indexes the feature files of the scenarios in a SQLite table: path id,
+    label, score, event frame, seed, parameters, creation time and location of the file.
+    The index can be queried by label or score without opening the feature files.
+
+    The database is in WAL mode and every add is its own transaction, so several scenario
+    processes can append to the same store at the same time.
+    """
+
+    FILE_NAME = 'index.sqlite'
+
+    def __init__(self, directory, timeout=30.0):
+        """
+        :param directory: directory of the store, the index is 'index.sqlite' in it and the
+            locations of the files inside it are stored relative to it
+        :param timeout: seconds a writer waits for the others before failing
+        """
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(self.directory, FeatureStore.FILE_NAME), timeout=timeout,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM traces').fetchone()[0]
+
+    def _location(self, trace):
+        trace = os.path.abspath(trace)
+        if os.path.commonpath([trace, self.directory]) == self.directory:
+            return os.path.relpath(trace, self.directory)
+        return trace
+
+    def trace_path(self, record):
+        """Absolute path of the file of a record"""
+        return os.path.join(self.directory, record.trace)
+
+    def add(self, trace, label=None, score=None, path_id=None, event_frame=None, seed=None, parameters=None,
+            created=None):
+        """
+        Adds a feature file to the index, or updates its entry if it is already indexed.
+
+            :param trace: path of the feature file
+            :param parameters: dict of the parameters of the scenario, stored as JSON
+            :param created: creation time, in seconds since the epoch (default: now)
+            :return: id of the entry
+        """
+        row = (None if path_id is None else str(path_id), _cast(int, label), _cast(float, score),
+               _cast(int, event_frame), _cast(int, seed),
+               None if parameters is None else json.dumps(parameters, sort_keys=True, default=_json_value),
+               time.time() if created is None else float(created), self._location(trace))
+        self._connection.execute(
+            'INSERT INTO traces (path_id, label, score, event_frame, seed, parameters, created, trace) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (trace) DO UPDATE SET path_id=excluded.path_id, label=excluded.label, '
+            'score=excluded.score, event_frame=excluded.event_frame, seed=excluded.seed, '
+            'parameters=excluded.parameters, created=excluded.created', row)
+        return self._connection.execute('SELECT id FROM traces WHERE trace = ?', (row[-1],)).fetchone()[0]
+
+    def import_directory(self, directory=None):
+        """
+        Indexes the feature files of a directory (the store directory by default) whose
+        name encodes their fields, with the parameters of their '_path.csv' file if any.
+        Returns the number of files indexed.
+        """
+        directory = self.directory if directory is None else directory
+        count = 0
+        #a single transaction, instead of one per file
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            for dirName, subdirList, fileList in os.walk(directory):
+                for fileName in sorted(fileList):
+                    fields = parse_trace_name(fileName)
+                    if fields is None:
+                        continue
+                    trace = os.path.join(dirName, fileName)
+                    fields.setdefault('created', os.path.getmtime(trace))
+                    fields['parameters'] = read_path_parameters(trace)
+                    self.add(trace, **fields)
+                    count += 1
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+        return count
+
+    @staticmethod
+    def _record(row):
+        return TraceRecord(row[0], row[1], row[2], row[3], row[4], row[5],
+                           None if row[6] is None else json.loads(row[6]), row[7], row[8])
+
+    def get(self, record_id):
+        row = self._connection.execute('SELECT * FROM traces WHERE id = ?', (record_id,)).fetchone()
+        return None if row is None else FeatureStore._record(row)
+
+    def query(self, label=None, min_score=None, max_score=None, path_id=None, order_by='id', limit=None):
+        """
+        Returns the records matching every given condition, the scores are inclusive bounds.
+
+            :param order_by: column the records are sorted by
+            :return: list of TraceRecord
+        """
+        if order_by not in TraceRecord._fields:
+            raise ValueError('unknown column {}'.format(order_by))
+        conditions, values = [], []
+        for column, operator, value in (('label', '=', label), ('score', '>=', min_score),
+                                        ('score', '<=', max_score), ('path_id', '=', path_id)):
+            if value is not None:
+                conditions.append('{} {} ?'.format(column, operator))
+                values.append(str(value) if column == 'path_id' else value)
+        sql = 'SELECT * FROM traces'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY {}'.format(order_by)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            values.append(int(limit))
+        return [FeatureStore._record(row) for row in self._connection.execute(sql, values)]
@@ -0,0 +1,170 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Vectorized 2D geometry helpers for the collision checks of the agents. """
+
+import numpy as np
+
+
+def corridor_quads(centers, right_vectors, half_width):
+    """
+    Splits the corridor covered by a route in quadrilaterals, one between every pair of
+    consecutive route points.
+
+        :param centers: (N, 2) array with the XY locations of the route
+        :param right_vectors: (N, 2) array with the XY right vectors of the route
+        :param half_width: half of the width of the corridor, in meters
+        :return: (N - 1, 4, 2) array with the corners of the quadrilaterals
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    offsets = half_width * np.asarray(right_vectors, dtype=np.float64).reshape(-1, 2)
+    right = centers + offsets
+    left = centers - offsets
+    return np.stack((right[:-1], right[1:], left[1:], left[:-1]), axis=1)
+
+
+def oriented_boxes(centers, yaws, offsets, extents):
+    """
+    Corners of the XY footprints of oriented bounding boxes.
+
+        :param centers: (V, 2) array with the XY locations of the actors
+        :param yaws: (V,) array with the yaws of the actors, in degrees
+        :param offsets: (V, 2) array with the XY locations of the boxes relative to the actors
+        :param extents: (V, 2) array with the XY half sizes of the boxes
+        :return: (V, 4, 2) array with the corners of the boxes
+    """
+    yaws = np.radians(np.asarray(yaws, dtype=np.float64).reshape(-1))
+    forward = np.stack((np.cos(yaws), np.sin(yaws)), axis=1)
+    right = np.stack((-forward[:, 1], forward[:, 0]), axis=1)
+    offsets = np.asarray(offsets, dtype=np.float64).reshape(-1, 2)
+    extents = np.asarray(extents, dtype=np.float64).reshape(-1, 2)
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2) + \
+        offsets[:, :1] * forward + offsets[:, 1:] * right
+    along = extents[:, :1] * forward
+    across = extents[:, 1:] * right
+    return np.stack((centers + along + across, centers + along - across,
+                     centers - along - across, centers - along + across), axis=1)
+
+
+def _edge_normals(polygons):
+    """(..., K, 2) normals of the edges of (..., K, 2) polygons"""
+    edges = np.roll(polygons, -1, axis=-2) - polygons
+    return np.stack((-edges[..., 1], edges[..., 0]), axis=-1)
+
+
+def _separated(axes, first, second):
+    """
+    (P, Q) mask of the pairs of polygons separated along one of the axes of the first ones.
+
+        :param axes: (P, A, 2) axes of the 'first' polygons
+        :param first: (P, K, 2) polygons
+        :param second: (Q, M, 2) polygons
+    """
+    proj_first = np.einsum('pad,pkd->pak', axes, first)
+    proj_second = np.einsum('pad,qmd->pqam', axes, second)
+    first_min, first_max = proj_first.min(axis=-1), proj_first.max(axis=-1)
+    second_min, second_max = proj_second.min(axis=-1), proj_second.max(axis=-1)
+    gap = (first_max[:, None] < second_min) | (second_max < first_min[:, None])
+    return gap.any(axis=-1)
+
+
+def convex_polygons_intersect(first, second):
+    """
+    Separating axis test between every pair of convex polygons, touching polygons intersect.
+
+        :param first: (P, K, 2) array with the corners of P polygons
+        :param second: (Q, M, 2) array with the corners of Q polygons
+        :return: (P, Q) boolean array, True where the polygons intersect
+    """
+    first = np.asarray(first, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    if not len(first) or not len(second):
+        return np.zeros((len(first), len(second)), dtype=bool)
+    separated = _separated(_edge_normals(first), first, second)
+    separated |= _separated(_edge_normals(second), second, first).T
+    return ~separated
+
+
+def _matched_intersect(first, second):
+    """Separating axis test between first[i] and second[i], the leading dimensions broadcast"""
+    shape = np.broadcast(first[..., 0, 0], second[..., 0, 0]).shape
+    first = np.broadcast_to(first, shape + first.shape[-2:])
+    second = np.broadcast_to(second, shape + second.shape[-2:])
+    axes = np.concatenate((_edge_normals(first), _edge_normals(second)), axis=-2)
+    proj_first = np.einsum('...ad,...kd->...ak', axes, first)
+    proj_second = np.einsum('...ad,...md->...am', axes, second)
+    gap = (proj_first.max(axis=-1) < proj_second.min(axis=-1)) | (proj_second.max(axis=-1) < proj_first.min(axis=-1))
+    return ~gap.any(axis=-1)
+
+
+def _points_to_edges(points, polygons):
+    """Minimum distance between the (..., K, 2) points and the edges of the (..., M, 2) polygons"""
+    starts = polygons[..., None, :, :]
+    edges = np.roll(polygons, -1, axis=-2)[..., None, :, :] - starts
+    offsets = points[..., :, None, :] - starts
+    lengths = np.einsum('...d,...d->...', edges, edges)
+    t = np.clip(np.einsum('...d,...d->...', offsets, edges) / np.where(lengths > 0, lengths, 1.0), 0.0, 1.0)
+    gaps = offsets - t[..., None] * edges
+    return np.sqrt(np.einsum('...d,...d->...', gaps, gaps)).min(axis=(-2, -1))
+
+
+def _matched_distance(first, second):
+    distance = np.minimum(_points_to_edges(first, second), _points_to_edges(second, first))
+    return np.where(_matched_intersect(first, second), 0.0, distance)
+
+
+def matched_polygons_intersect(first, second):
+    """
+    Separating axis test between the convex polygons first[i] and second[i], e.g. the
+    footprints of two actors at every frame of a trace. Touching polygons intersect.
+
+        :param first: (N, K, 2) array with the corners of N polygons
+        :param second: (N, M, 2) array with the corners of N polygons
+        :return: (N,) boolean array
+    """
+    return _matched_intersect(np.asarray(first, dtype=np.float64), np.asarray(second, dtype=np.float64))
+
+
+def matched_polygons_distance(first, second):
+    """
+    Minimum distance between the convex polygons first[i] and second[i], 0 where they
+    intersect, as shapely's Polygon.distance.
+
+        :param first: (N, K, 2) array with the corners of N polygons
+        :param second: (N, M, 2) array with the corners of N polygons
+        :return: (N,) array of distances
+    """
+    return _matched_distance(np.asarray(first, dtype=np.float64), np.asarray(second, dtype=np.float64))
+
+
+def convex_polygons_distance(first, second):
+    """
+    Minimum distance between every pair of convex polygons, 0 where they intersect.
+
+        :param first: (P, K, 2) array with the corners of P polygons
+        :param second: (Q, M, 2) array with the corners of Q polygons
+        :return: (P, Q) array of distances
+    """
+    first = np.asarray(first, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    if not len(first) or not len(second):
+        return np.zeros((len(first), len(second)))
+    return _matched_distance(first[:, None], second[None])
+
+
+def bearing_angles(forward, offsets):
+    """
+    Signed angles from forward vectors to offset vectors, in degrees in [-180, 180], e.g.
+    from the forward vector of the ego to the location of another actor. NaN where one of
+    the vectors is null.
+
+        :param forward: (..., 2) array of XY vectors
+        :param offsets: (..., 2) array of XY vectors, broadcast with 'forward'
+    """
+    forward = np.asarray(forward, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.float64)
+    angles = np.degrees(np.arctan2(forward[..., 0], forward[..., 1]) - np.arctan2(offsets[..., 0], offsets[..., 1]))
+    angles = np.where(angles < -180.0, angles + 360.0, angles)
+    angles = np.where(angles > 180.0, angles - 360.0, angles)
+    null = ~(np.any(forward != 0.0, axis=-1) & np.any(offsets != 0.0, axis=-1))
+    return np.where(null, np.nan, angles)
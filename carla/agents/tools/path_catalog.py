@@ -0,0 +1,183 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Sorted catalog of the adversary path files of a directory. """
+
+import collections
+import concurrent.futures
+import json
+import os
+import re
+
+PathEntry = collections.namedtuple('PathEntry', ['path_id', 'name', 'path', 'mtime'])
+
+# the number after '#' (e.g. 'NormalDistrib#12'), as Execute_scenario.py reads it
+_HASH_ID = re.compile(r'#(\d+)')
+_DIGITS = re.compile(r'\d+')
+
+
+def parse_path_id(file_name):
+    """
+    Returns the path id of a path file name: the number after '#', else the last number
+    of the name without its extension, else None
+    """
+    match = _HASH_ID.search(file_name)
+    if match is not None:
+        return int(match.group(1))
+    numbers = _DIGITS.findall(os.path.splitext(file_name)[0])
+    return int(numbers[-1]) if numbers else None
+
+
+def _scan(directory):
+    """(mtime in ns, files as {name: mtime}, subdirectories) of a directory"""
+    #read first: a file added during the listing changes it again, so the next run lists it
+    mtime = os.stat(directory).st_mtime_ns
+    files, subdirs = {}, []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.is_file():
+                files[entry.name] = entry.stat().st_mtime
+    return mtime, files, sorted(subdirs)
+
+
+class PathCatalog(object):
+    """
+    PathCatalog lists the path files of a directory sorted by path id, the number parsed
+    from their name once by parse_path_id (the files without one come last, by name).
+
+    The listing is cached in a manifest in the directory, with the modification time of
+    every directory and file: on the next run, the directories whose modification time
+    didn't change aren't listed again, and the ids aren't parsed again. The directories
+    that changed are listed by a pool of threads.
+
+    The catalog is a sorted sequence of PathEntry(path_id, name, path, mtime):
+
+        catalog = PathCatalog(path)
+        for entry in catalog[100:200]:
+            ...
+    """
+
+    MANIFEST = '.path_catalog.json'
+    VERSION = 1
+
+    def __init__(self, directory, recursive=True, pattern=None, workers=8, use_manifest=True):
+        """
+        :param directory: directory of the path files
+        :param recursive: whether the files of the subdirectories are listed too
+        :param pattern: regular expression the file names have to match, e.g. 'Normal'
+        :param workers: threads listing the directories
+        :param use_manifest: whether the manifest is read and written
+        """
+        self.directory = os.path.abspath(directory)
+        self.recursive = recursive
+        self.pattern = None if pattern is None else re.compile(pattern)
+        self._workers = max(1, workers)
+        self._use_manifest = use_manifest
+        self._entries = None
+        self.refresh()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, PathCatalog.MANIFEST)
+
+    def _read_manifest(self):
+        if not self._use_manifest:
+            return {}
+        try:
+            with open(self._manifest_path(), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != PathCatalog.VERSION:
+            return {}
+        return manifest.get('directories', {})
+
+    def _write_manifest(self, directories):
+        if not self._use_manifest:
+            return
+        #written in place: creating the file changes the modification time of the directory,
+        #overwriting it doesn't, so it is recorded again after the creation, unless something
+        #else changed in the directory since it was listed, then the next run lists it again
+        created = not os.path.exists(self._manifest_path())
+        try:
+            self._dump_manifest(directories)
+            root = directories.get('.')
+            if created and root is not None:
+                mtime, files, subdirs = _scan(self.directory)
+                files.pop(PathCatalog.MANIFEST, None)
+                if set(files) == set(root['files']) - {PathCatalog.MANIFEST} and subdirs == root['subdirs']:
+                    root['mtime'] = mtime
+                    self._dump_manifest(directories)
+        except OSError:
+            #a read only directory can still be listed, only not cached
+            pass
+
+    def _dump_manifest(self, directories):
+        with open(self._manifest_path(), 'w') as f:
+            json.dump({'version': PathCatalog.VERSION, 'directories': directories}, f)
+
+    def refresh(self):
+        """Lists the directory again, only the directories that changed are scanned"""
+        cached = self._read_manifest()
+        directories = {}
+        pending = ['.']
+        with concurrent.futures.ThreadPoolExecutor(self._workers) as executor:
+            while pending:
+                #the modification time of a directory changes when a file is added, removed or renamed in it
+                stats = list(executor.map(lambda d: os.stat(os.path.join(self.directory, d)).st_mtime_ns, pending))
+                to_scan = [d for d, mtime in zip(pending, stats)
+                           if d not in cached or cached[d]['mtime'] != mtime]
+                scans = dict(zip(to_scan, executor.map(lambda d: _scan(os.path.join(self.directory, d)), to_scan)))
+                next_pending = []
+                for d in pending:
+                    if d in scans:
+                        mtime, files, subdirs = scans[d]
+                        old_files = cached.get(d, {}).get('files', {})
+                        entry = {'mtime': mtime, 'subdirs': subdirs, 'files': {}}
+                        for name, file_mtime in files.items():
+                            old = old_files.get(name)
+                            path_id = old[1] if old is not None else parse_path_id(name)
+                            entry['files'][name] = [file_mtime, path_id]
+                    else:
+                        entry = cached[d]
+                    directories[d] = entry
+                    if self.recursive:
+                        next_pending.extend(os.path.normpath(os.path.join(d, s)) for s in entry['subdirs'])
+                pending = next_pending
+
+        if directories != cached:
+            self._write_manifest(directories)
+
+        entries = []
+        for d, entry in directories.items():
+            for name, (mtime, path_id) in entry['files'].items():
+                if name.startswith(PathCatalog.MANIFEST):
+                    continue
+                if self.pattern is not None and not self.pattern.search(name):
+                    continue
+                entries.append(PathEntry(path_id, name, os.path.normpath(os.path.join(self.directory, d, name)), mtime))
+        entries.sort(key=lambda e: (e.path_id is None, e.path_id if e.path_id is not None else 0, e.name, e.path))
+        self._entries = entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def paths(self):
+        return [e.path for e in self._entries]
+
+    def split(self, n):
+        """Splits the entries in n contiguous parts of nearly equal sizes"""
+        size, extra = divmod(len(self._entries), n)
+        parts, start = [], 0
+        for i in range(n):
+            stop = start + size + (1 if i < extra else 0)
+            parts.append(self._entries[start:stop])
+            start = stop
+        return parts
@@ -0,0 +1,150 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Binary format of the adversary path files.
+
+A path file is a CSV with one 'index, grid point, speed, accel' row per point. The binary
+format stores the same rows as a record array of PATH_DTYPE after a 16 bytes header:
+
+    magic b'CPTH', version (uint16), reserved (uint16), number of records (uint32), reserved (uint32)
+
+A pack stores many paths in one file, for batch loading:
+
+    magic b'CPTK', version (uint16), reserved (uint16), number of paths (uint32),
+    length of the JSON index (uint32), JSON index {'names': [...], 'offsets': [...]},
+    padding to a multiple of 16 bytes, then the records of every path one after the other
+
+The records of both can be memory mapped, so thousands of paths can be loaded without
+reading them.
+"""
+
+import csv
+import json
+import struct
+
+import numpy as np
+
+PATH_DTYPE = np.dtype([('index', '<i4'), ('point', '<i4'), ('speed', '<f8'), ('accel', '<f8')])
+
+PATH_MAGIC = b'CPTH'
+PACK_MAGIC = b'CPTK'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHII')
+
+
+def read_path_csv(file_name):
+    """Reads a CSV path file, the accelerations of the files without them are NaN"""
+    rows = []
+    with open(file_name, mode='r', newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            if row:
+                rows.append((int(float(row[0])), int(float(row[1])), float(row[2]),
+                             float(row[3]) if len(row) > 3 else float('nan')))
+    return np.array(rows, dtype=PATH_DTYPE)
+
+
+def write_path(file_name, records):
+    """Writes the records of a path as a binary path file"""
+    records = np.asarray(records, dtype=PATH_DTYPE)
+    with open(file_name, 'wb') as f:
+        f.write(_HEADER.pack(PATH_MAGIC, VERSION, 0, len(records), 0))
+        f.write(records.tobytes())
+
+
+def _check_header(magic, version, expected, file_name):
+    if magic != expected:
+        raise ValueError('{} is not a binary path file'.format(file_name))
+    if version != VERSION:
+        raise ValueError('{} has version {}, expected {}'.format(file_name, version, VERSION))
+
+
+def read_path(file_name, mmap=False):
+    """
+    Reads a binary path file, or a CSV one, as a record array of PATH_DTYPE.
+
+        :param mmap: whether the records of a binary file are memory mapped instead of read
+    """
+    with open(file_name, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if header[:4] != PATH_MAGIC:
+            return read_path_csv(file_name)
+        magic, version, _, count, _ = _HEADER.unpack(header)
+        _check_header(magic, version, PATH_MAGIC, file_name)
+        if not mmap:
+            return np.frombuffer(f.read(count * PATH_DTYPE.itemsize), dtype=PATH_DTYPE, count=count)
+    if count == 0:
+        return np.zeros(0, dtype=PATH_DTYPE)
+    return np.memmap(file_name, dtype=PATH_DTYPE, mode='r', offset=_HEADER.size, shape=(count,))
+
+
+def write_pack(file_name, paths):
+    """
+    Writes many paths in one pack file.
+
+        :param paths: list of (name, records), in the order of the pack
+    """
+    names, offsets, arrays = [], [0], []
+    for name, records in paths:
+        records = np.asarray(records, dtype=PATH_DTYPE)
+        names.append(name)
+        arrays.append(records)
+        offsets.append(offsets[-1] + len(records))
+    index = json.dumps({'names': names, 'offsets': offsets}).encode('utf-8')
+    padding = -(_HEADER.size + len(index)) % 16
+    with open(file_name, 'wb') as f:
+        f.write(_HEADER.pack(PACK_MAGIC, VERSION, 0, len(names), len(index)))
+        f.write(index)
+        f.write(b'\0' * padding)
+        for records in arrays:
+            f.write(records.tobytes())
+
+
+class PathPack(object):
+    """
+    Paths of a pack file, by position or by name. The records of all the paths are one
+    record array, memory mapped by default, and every path is a view of it.
+    """
+
+    def __init__(self, file_name, mmap=True):
+        with open(file_name, 'rb') as f:
+            magic, version, _, count, index_size = _HEADER.unpack(f.read(_HEADER.size))
+            _check_header(magic, version, PACK_MAGIC, file_name)
+            index = json.loads(f.read(index_size).decode('utf-8'))
+            start = _HEADER.size + index_size + (-(_HEADER.size + index_size) % 16)
+            total = index['offsets'][-1]
+            if not mmap or total == 0:
+                f.seek(start)
+                self.records = np.frombuffer(f.read(total * PATH_DTYPE.itemsize), dtype=PATH_DTYPE, count=total)
+        if mmap and total > 0:
+            self.records = np.memmap(file_name, dtype=PATH_DTYPE, mode='r', offset=start, shape=(total,))
+        self.names = index['names']
+        self.offsets = np.asarray(index['offsets'], dtype=np.int64)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, key):
+        """Records of the path at a position, or of the path with a name"""
+        i = self._positions[key] if isinstance(key, str) else key
+        return self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self.names[i], self[i]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+def grid_locations(points, top, left, box_width, box_height, size=20):
+    """
+    (x, y) arrays of the centers of the grid cells of the points, computed as
+    Grid.return_location_from_grid does for a single point
+    """
+    points = np.asarray(points, dtype=np.int64)
+    i = points // size
+    j = points % size
+    return top - box_height * i - box_height / 2, left + box_width * j + box_width / 2
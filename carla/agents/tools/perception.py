@@ -0,0 +1,59 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Per tick view of the surroundings of an agent, shared by its behavior managers. """
+
+from agents.tools.actor_cache import ActorCache, ActorState
+from agents.tools.misc import get_speed
+
+
+class PerceptionContext(object):
+    """
+    Everything the behavior managers of an agent need to know about the world at one tick,
+    gathered once from the ActorCache of the world: the state of the ego vehicle, its waypoint
+    and speed limit, and the vehicles and walkers around it sorted by distance.
+    """
+
+    def __init__(self, world, vehicle, wmap, vehicle_radius=45.0, walker_radius=10.0):
+        """
+        :param world: carla.World object
+        :param vehicle: ego carla.Vehicle
+        :param wmap: carla.Map of the world
+        :param vehicle_radius: only the vehicles closer than this to the ego waypoint are kept
+        :param walker_radius: only the walkers closer than this to the ego waypoint are kept
+        """
+        self._world = world
+        self._cache = ActorCache.for_world(world)
+        self.frame = self._cache.frame
+
+        self.ego = self._cache.get(vehicle.id) or ActorState.from_actor(vehicle)
+        self.speed = self.ego.speed
+        self.speed_limit = vehicle.get_speed_limit()
+        self.waypoint = wmap.get_waypoint(self.ego.location)
+
+        center = self.waypoint.transform.location
+        self.vehicles = self._sorted_by_distance(
+            self._cache.vehicles_near(center, vehicle_radius), center, vehicle_radius, vehicle.id)
+        self.walkers = self._sorted_by_distance(
+            self._cache.walkers_near(center, walker_radius), center, walker_radius, vehicle.id)
+        self._fog_density = None
+
+    @staticmethod
+    def _sorted_by_distance(states, center, radius, ego_id):
+        """Actor states closer than 'radius' to 'center', the closest first"""
+        distances = [(center.distance(state.location), state) for state in states if state.id != ego_id]
+        distances = [pair for pair in distances if pair[0] < radius]
+        distances.sort(key=lambda pair: pair[0])
+        return [state for _, state in distances]
+
+    @property
+    def fog_density(self):
+        """Fog density of the weather, requested to the server at most once per tick"""
+        if self._fog_density is None:
+            self._fog_density = self._world.get_weather().fog_density
+        return self._fog_density
+
+    def speed_of(self, actor):
+        """Speed of an actor in Km/h, from the cache if the actor is part of it"""
+        state = self._cache.get(actor.id)
+        return state.speed if state is not None else get_speed(actor)
@@ -0,0 +1,239 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Opt-in timing of the sections of the scenario loops and of the agents. """
+
+import json
+import os
+import threading
+import time
+
+
+class SectionStats(object):
+    """
+    Timing histogram of a section, in microseconds. Bucket k counts the durations whose
+    bit length is k, i.e. in [2^(k-1), 2^k) microseconds, so percentiles are known within
+    a factor of two while count, total, min and max are exact.
+    """
+
+    BUCKETS = 40
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.buckets = [0] * SectionStats.BUCKETS
+
+    def add(self, duration):
+        """Adds a duration, in microseconds"""
+        self.count += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        self.buckets[min(duration.bit_length(), SectionStats.BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile(self, q):
+        """Upper bound, in microseconds, of the q-th percentile (0 < q <= 100)"""
+        rank = q / 100.0 * self.count
+        seen = 0
+        for k, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << k) - 1, self.max)
+        return self.max
+
+
+class _Frame(object):
+    """Open section of a thread, with the time already spent in its children"""
+
+    __slots__ = ('name', 'path', 'start', 'children')
+
+    def __init__(self, name, path, start):
+        self.name = name
+        self.path = path
+        self.start = start
+        self.children = 0
+
+
+class _Section(object):
+    """Context manager of an enabled profiler"""
+
+    __slots__ = ('_profiler', '_name')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler._push(self._name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler._pop()
+        return False
+
+
+class _NullSection(object):
+    """Context manager of a disabled profiler, does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class Profiler(object):
+    """
+    Profiler keeps a timing histogram of every named section of code. Sections nest, and
+    can be opened from several threads, e.g. from the sensor callbacks:
+
+        with profiler.section('tick'):
+            world.tick()
+
+    When the profiler is disabled, section() returns a shared context manager that does
+    nothing, so the instrumentation can stay in the hot loops.
+
+    The statistics are kept per episode and per round of episodes, see end_episode and
+    end_round. With trace=True every section is also recorded as an event, to be written
+    as a Chrome trace (chrome://tracing, Perfetto) or as folded stacks for flamegraph.pl.
+    """
+
+    def __init__(self, enabled=False, trace=False, max_events=1000000):
+        """
+        :param enabled: whether the sections are timed
+        :param trace: whether every section is also recorded as a trace event
+        :param max_events: events recorded at most, the later ones are dropped
+        """
+        self.enabled = enabled
+        self.trace = trace
+        self._max_events = max_events
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter_ns()
+        self._episode = {}
+        self._round = {}
+        self._total = {}
+        self._events = []
+        self._folded = {}
+
+    def enable(self, trace=False):
+        self.enabled = True
+        self.trace = trace
+
+    def disable(self):
+        self.enabled = False
+
+    def section(self, name):
+        """Context manager timing the code it wraps as the section 'name'"""
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def _push(self, name):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        path = stack[-1].path + ';' + name if stack else name
+        stack.append(_Frame(name, path, time.perf_counter_ns()))
+
+    def _pop(self):
+        end = time.perf_counter_ns()
+        stack = self._local.stack
+        frame = stack.pop()
+        duration = (end - frame.start) // 1000
+        if stack:
+            stack[-1].children += duration
+
+        with self._lock:
+            stats = self._episode.get(frame.name)
+            if stats is None:
+                stats = self._episode[frame.name] = SectionStats()
+            stats.add(duration)
+            if self.trace:
+                self._folded[frame.path] = self._folded.get(frame.path, 0) + duration - frame.children
+                if len(self._events) < self._max_events:
+                    self._events.append({
+                        'name': frame.name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                        'ts': (frame.start - self._origin) / 1000.0, 'dur': duration})
+
+    @staticmethod
+    def _merge(target, source):
+        for name, stats in source.items():
+            if name not in target:
+                target[name] = SectionStats()
+            target[name].merge(stats)
+
+    def end_episode(self):
+        """Closes the statistics of the current episode and returns their summary"""
+        with self._lock:
+            episode, self._episode = self._episode, {}
+            Profiler._merge(self._round, episode)
+        return Profiler.summary(episode)
+
+    def end_round(self):
+        """Closes the statistics of the current round of episodes and returns their summary"""
+        self.end_episode()
+        with self._lock:
+            round_stats, self._round = self._round, {}
+            Profiler._merge(self._total, round_stats)
+        return Profiler.summary(round_stats)
+
+    def stats(self):
+        """Statistics of every section since the profiler was created, by name"""
+        with self._lock:
+            total = {}
+            for source in (self._total, self._round, self._episode):
+                Profiler._merge(total, source)
+        return total
+
+    @staticmethod
+    def summary(stats):
+        """Table with the statistics of the sections, the most expensive first"""
+        lines = ['{:<28}{:>9}{:>12}{:>10}{:>10}{:>10}{:>10}'.format(
+            'section', 'count', 'total ms', 'mean us', 'p50 us', 'p99 us', 'max us')]
+        for name, s in sorted(stats.items(), key=lambda item: -item[1].total):
+            lines.append('{:<28}{:>9}{:>12.1f}{:>10.1f}{:>10}{:>10}{:>10}'.format(
+                name, s.count, s.total / 1000.0, s.total / s.count, s.percentile(50), s.percentile(99), s.max))
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, path):
+        """Writes the recorded events in the Chrome trace event format"""
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def write_folded(self, path):
+        """Writes the self time of every stack of sections, in microseconds, as folded stacks"""
+        with self._lock:
+            folded = dict(self._folded)
+        with open(path, 'w') as f:
+            for stack, duration in sorted(folded.items()):
+                f.write('{} {}\n'.format(stack, duration))
+
+
+_PROFILER = Profiler()
+
+
+def get_profiler():
+    """Profiler shared by the agents and the scenario scripts, disabled until enabled"""
+    return _PROFILER
@@ -0,0 +1,100 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Tables of the queries of the simulator recorder. carla.Client.show_recorder_collisions and
+show_recorder_actors_blocked return text made for the terminal:
+
+    Version: 1
+    Map: Town10HD
+    Date: 10/03/22 14:21:07
+
+        Time  Types     Id Actor 1                                 Id Actor 2
+          16   v v     122 vehicle.diamondback.century            118 vehicle.dodge.charger_police
+
+    Frames: 790
+    Duration: 46 seconds
+
+The functions of this module parse it into the header and a list of rows.
+"""
+
+import collections
+import csv
+import re
+
+Collision = collections.namedtuple('Collision', ['time', 'type1', 'type2', 'id1', 'actor1', 'id2', 'actor2'])
+BlockedActor = collections.namedtuple('BlockedActor', ['time', 'id', 'actor', 'duration'])
+
+# actor categories of show_recorder_collisions
+HERO, VEHICLE, WALKER, TRAFFIC_LIGHT, OTHER, ANY = 'h', 'v', 'w', 't', 'o', 'a'
+
+_NUMBER = r'(-?\d+(?:\.\d+)?)'
+_COLLISION_ROW = re.compile(r'^\s*' + _NUMBER + r'\s+(\w)\s+(\w)\s+(\d+)\s+(\S*)\s+(\d+)\s*(\S*)\s*$')
+_BLOCKED_ROW = re.compile(r'^\s*' + _NUMBER + r'\s+(\d+)\s+(\S*)\s+' + _NUMBER + r'\s*$')
+_HEADER_LINE = re.compile(r'^(\w[\w ]*):\s*(.*)$')
+
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and '.' not in text else value
+
+
+def _parse(text, row_pattern, make_row):
+    header, rows = {}, []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = row_pattern.match(line)
+        if match is not None:
+            rows.append(make_row(match.groups()))
+            continue
+        match = _HEADER_LINE.match(line.strip())
+        if match is not None:
+            header[match.group(1)] = match.group(2)
+    if 'Frames' in header:
+        header['Frames'] = int(header['Frames'])
+    if 'Duration' in header:
+        header['Duration'] = float(header['Duration'].split()[0])
+    return header, rows
+
+
+def parse_collisions(text):
+    """
+    Parses the output of show_recorder_collisions.
+
+        :return: (header, rows), the header is a dict ('Version', 'Map', 'Date', 'Frames',
+            'Duration' in seconds) and the rows are Collision, in the order of the output
+    """
+    return _parse(text, _COLLISION_ROW, lambda g: Collision(
+        _number(g[0]), g[1], g[2], int(g[3]), g[4], int(g[5]), g[6]))
+
+
+def parse_blocked(text):
+    """
+    Parses the output of show_recorder_actors_blocked.
+
+        :return: (header, rows), the rows are BlockedActor, with the time the actor got
+            blocked and how long it stayed blocked, in seconds
+    """
+    return _parse(text, _BLOCKED_ROW, lambda g: BlockedActor(_number(g[0]), int(g[1]), g[2], _number(g[3])))
+
+
+def query_collisions(client, file_name, category1=ANY, category2=ANY):
+    """Collisions of a recording between actors of two categories, see parse_collisions"""
+    return parse_collisions(client.show_recorder_collisions(file_name, category1, category2))
+
+
+def query_blocked(client, file_name, min_time=60.0, min_distance=100.0):
+    """
+    Actors of a recording that moved less than 'min_distance' centimeters in 'min_time'
+    seconds, see parse_blocked
+    """
+    return parse_blocked(client.show_recorder_actors_blocked(file_name, min_time, min_distance))
+
+
+def write_table(file_name, rows, fields):
+    """Writes rows of one of the tables as CSV, e.g. write_table(f, rows, Collision._fields)"""
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(rows)
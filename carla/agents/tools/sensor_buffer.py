@@ -0,0 +1,117 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Buffer of the events of an obstacle sensor, filled from the callback thread of the sensor
+and read from the simulation loop without a lock.
+"""
+
+import numpy as np
+
+
+class SensorEventBuffer(object):
+    """
+    SensorEventBuffer keeps the (frame, distance) of the events of an obstacle sensor in
+    preallocated arrays, and the running minimum distance and time to collision.
+
+    The sensor callback only calls add(), it doesn't ask the simulator for the speed of
+    the parent actor. The simulation loop gives the speed of the parent at every tick, from
+    its snapshot, with on_tick(): the events are then matched with the speed of their frame
+    and the minima updated, in O(1) per event.
+
+    add() is only called by the callback thread and on_tick() by the loop: the callback
+    writes an event before it increments the count, and the loop only reads the events
+    below the count, so no lock is needed.
+    """
+
+    def __init__(self, capacity=1024, ticks=256, still_ttc=100.0):
+        """
+        :param capacity: initial number of events, the arrays grow by doubling
+        :param ticks: number of ticks whose speed is kept for the events arriving late
+        :param still_ttc: time to collision of the events when the parent doesn't move
+        """
+        self._frames = np.zeros(capacity, dtype=np.int64)
+        self._distances = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+        #owned by the loop
+        self._speeds = np.zeros(capacity, dtype=np.float64)
+        self._resolved = 0
+        self._tick_frames = np.full(ticks, -1, dtype=np.int64)
+        self._tick_speeds = np.zeros(ticks, dtype=np.float64)
+        self._last_speed = 0.0
+        self._still_ttc = still_ttc
+        self.min_distance = None
+        self.min_ttc = None
+        self.min_ttc_frame = None
+
+    def __len__(self):
+        return self._resolved
+
+    def add(self, frame, distance):
+        """Keeps an event, called by the sensor callback"""
+        n = self._count
+        if n == len(self._frames):
+            #the copies are complete before they replace the arrays the loop reads
+            self._frames = np.concatenate((self._frames, np.zeros_like(self._frames)))
+            self._distances = np.concatenate((self._distances, np.zeros_like(self._distances)))
+        self._frames[n] = frame
+        self._distances[n] = distance
+        self._count = n + 1
+
+    def on_tick(self, frame, speed):
+        """Gives the speed of the parent at a frame, in m/s, and updates the minima with the new events"""
+        slot = frame % len(self._tick_frames)
+        self._tick_frames[slot] = frame
+        self._tick_speeds[slot] = speed
+        self._last_speed = float(speed)
+        if self._count > self._resolved:
+            self._resolve()
+
+    def flush(self):
+        """
+        Updates the minima with the events whose tick wasn't given yet, e.g. the ones of the
+        last frame arriving after the last tick, with the last speed of the parent
+        """
+        if self._count > self._resolved:
+            self._resolve(flush=True)
+
+    def _resolve(self, flush=False):
+        #the count is read before the arrays, they hold at least that many events
+        count = self._count
+        frames, distances = self._frames, self._distances
+        if count > len(self._speeds):
+            self._speeds = np.concatenate((self._speeds, np.zeros(len(frames) - len(self._speeds))))
+        ticks = len(self._tick_frames)
+        k = self._resolved
+        while k < count:
+            frame = int(frames[k])
+            tick_frame = self._tick_frames[frame % ticks]
+            if tick_frame < frame and not flush:
+                #the tick of the event is not known yet
+                break
+            #an event older than the kept ticks, or flushed before its tick, takes the last speed
+            speed = float(self._tick_speeds[frame % ticks]) if tick_frame == frame else self._last_speed
+            distance = float(distances[k])
+            self._speeds[k] = speed
+            if self.min_distance is None or distance < self.min_distance:
+                self.min_distance = distance
+            ttc = self._still_ttc if speed == 0 else distance / speed
+            if self.min_ttc is None or ttc < self.min_ttc:
+                self.min_ttc = ttc
+                self.min_ttc_frame = frame
+            k += 1
+        self._resolved = k
+
+    @property
+    def frames(self):
+        """Frames of the events matched with a speed"""
+        return self._frames[:self._resolved]
+
+    @property
+    def distances(self):
+        return self._distances[:self._resolved]
+
+    @property
+    def speeds(self):
+        """Speed of the parent at the frame of the events, in m/s"""
+        return self._speeds[:self._resolved]
@@ -0,0 +1,158 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Uniform grid index for nearest point queries on the client side. """
+
+import math
+import numpy as np
+
+
+class GridIndex(object):
+    """
+    Bins a set of 3D points in a uniform 2D grid of square cells so that nearest point
+    and radius queries only look at the cells around the query. The points are stored
+    sorted by cell, with a CSR-like table of the first point of every non empty cell.
+    """
+
+    # Number of cell rings visited by a nearest point query before falling back to a full scan
+    MAX_RING = 4
+
+    def __init__(self, points, cell_size=5.0):
+        """
+        :param points: (N, 3) array with the x, y, z of the points
+        :param cell_size: side of the grid cells, in meters. A good value is about
+            the distance between two consecutive points
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+
+        cells = np.floor(self.points[:, :2] / self.cell_size).astype(np.int64)
+        if len(cells):
+            self._origin = cells.min(axis=0)
+            self._shape = cells.max(axis=0) - self._origin + 1
+        else:
+            self._origin = np.zeros(2, dtype=np.int64)
+            self._shape = np.ones(2, dtype=np.int64)
+        keys = self._cell_keys(cells)
+
+        self._order = np.argsort(keys, kind='stable')
+        self._keys, self._starts, counts = np.unique(keys[self._order], return_index=True, return_counts=True)
+        self._ends = self._starts + counts
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_keys(self, cells):
+        """Flattens (i, j) cell coordinates, -1 for the cells outside of the grid"""
+        local = cells - self._origin
+        inside = np.all((local >= 0) & (local < self._shape), axis=-1)
+        return np.where(inside, local[..., 0] * self._shape[1] + local[..., 1], -1)
+
+    def _cell_range(self, i, j):
+        """Range of self._order holding the points of cell (i, j)"""
+        li, lj = i - self._origin[0], j - self._origin[1]
+        if li < 0 or lj < 0 or li >= self._shape[0] or lj >= self._shape[1]:
+            return 0, 0
+        key = li * self._shape[1] + lj
+        pos = np.searchsorted(self._keys, key)
+        if pos < len(self._keys) and self._keys[pos] == key:
+            return self._starts[pos], self._ends[pos]
+        return 0, 0
+
+    def nearest(self, x, y, z=0.0):
+        """
+        Returns (distance, index) of the point closest to (x, y, z), or (inf, -1) if the index is empty.
+        Cell rings are visited outwards until no closer point can be found.
+        """
+        if not len(self.points):
+            return float('inf'), -1
+        ci = int(math.floor(x / self.cell_size))
+        cj = int(math.floor(y / self.cell_size))
+        best_d2, best = float('inf'), -1
+        for ring in range(self.MAX_RING + 1):
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if ring and ci - ring < i < ci + ring and cj - ring < j < cj + ring:
+                        continue
+                    start, end = self._cell_range(i, j)
+                    if start == end:
+                        continue
+                    candidates = self._order[start:end]
+                    diff = self.points[candidates] - (x, y, z)
+                    d2 = np.einsum('ij,ij->i', diff, diff)
+                    k = int(np.argmin(d2))
+                    if d2[k] < best_d2 or (d2[k] == best_d2 and candidates[k] < best):
+                        best_d2, best = float(d2[k]), int(candidates[k])
+            # Points outside of the visited rings are at least ring * cell_size away
+            if best >= 0 and best_d2 <= (ring * self.cell_size) ** 2:
+                return math.sqrt(best_d2), best
+
+        # Far away from the points, a full scan is cheaper than more rings
+        diff = self.points - (x, y, z)
+        d2 = np.einsum('ij,ij->i', diff, diff)
+        best = int(np.argmin(d2))
+        best_d2 = float(d2[best])
+        return math.sqrt(best_d2), best
+
+    def nearest_many(self, xyz):
+        """
+        Batch version of nearest.
+
+            :param xyz: (Q, 3) array of query points
+            :return: (distances, indices) arrays of length Q
+        """
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        num_queries = len(xyz)
+        distances = np.full(num_queries, np.inf)
+        indices = np.full(num_queries, -1, dtype=np.int64)
+        if not num_queries or not len(self.points):
+            return distances, indices
+
+        # Gather the points of the 3x3 cells around every query
+        cells = np.floor(xyz[:, :2] / self.cell_size).astype(np.int64)
+        offsets = np.array([(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)], dtype=np.int64)
+        keys = self._cell_keys(cells[:, None, :] + offsets[None, :, :]).ravel()
+        pos = np.clip(np.searchsorted(self._keys, keys), 0, len(self._keys) - 1)
+        found = (keys >= 0) & (self._keys[pos] == keys)
+        starts = np.where(found, self._starts[pos], 0)
+        counts = np.where(found, self._ends[pos] - self._starts[pos], 0)
+
+        total = int(counts.sum())
+        if total:
+            owner = np.repeat(np.arange(len(keys)) // len(offsets), counts)
+            first = np.cumsum(counts) - counts
+            slots = np.arange(total) - np.repeat(first, counts) + np.repeat(starts, counts)
+            candidates = self._order[slots]
+            diff = self.points[candidates] - xyz[owner]
+            d2 = np.einsum('ij,ij->i', diff, diff)
+            # Closest candidate of every query (lowest index on ties)
+            best = np.lexsort((candidates, d2, owner))
+            group_start = np.ones(len(best), dtype=bool)
+            group_start[1:] = owner[best][1:] != owner[best][:-1]
+            best = best[group_start]
+            distances[owner[best]] = np.sqrt(d2[best])
+            indices[owner[best]] = candidates[best]
+
+        # Only the results closer than a cell size are guaranteed, redo the rest one by one
+        for q in np.nonzero(distances > self.cell_size)[0]:
+            distances[q], indices[q] = self.nearest(*xyz[q])
+        return distances, indices
+
+    def within(self, x, y, radius):
+        """Returns the indices of the points closer than 'radius' to (x, y) on the XY plane"""
+        ci0 = int(math.floor((x - radius) / self.cell_size))
+        ci1 = int(math.floor((x + radius) / self.cell_size))
+        cj0 = int(math.floor((y - radius) / self.cell_size))
+        cj1 = int(math.floor((y + radius) / self.cell_size))
+        result = []
+        for i in range(ci0, ci1 + 1):
+            for j in range(cj0, cj1 + 1):
+                start, end = self._cell_range(i, j)
+                if start == end:
+                    continue
+                candidates = self._order[start:end]
+                diff = self.points[candidates, :2] - (x, y)
+                inside = np.einsum('ij,ij->i', diff, diff) <= radius * radius
+                result.extend(int(c) for c in candidates[inside])
+        result.sort()
+        return result
@@ -0,0 +1,78 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Table of the trigger waypoints of the traffic lights of a world, computed once. """
+
+from agents.tools.misc import get_trafficlight_trigger_location
+
+
+class TrafficLightEntry(object):
+    """
+    Static data of a traffic light: the waypoint of its trigger volume and the direction
+    of its lane. Only the state of the light has to be read at every tick, from the actor.
+    """
+
+    __slots__ = ('actor', 'id', 'waypoint', 'transform', 'road_id', 'lane_id', 'direction')
+
+    def __init__(self, traffic_light, wmap):
+        self.actor = traffic_light
+        self.id = traffic_light.id
+        self.waypoint = wmap.get_waypoint(get_trafficlight_trigger_location(traffic_light))
+        self.transform = self.waypoint.transform
+        self.road_id = self.waypoint.road_id
+        self.lane_id = self.waypoint.lane_id
+        forward = self.transform.get_forward_vector()
+        self.direction = (forward.x, forward.y, forward.z)
+
+    @property
+    def state(self):
+        return self.actor.state
+
+
+class TrafficLightTable(object):
+    """
+    TrafficLightTable computes the trigger waypoint of every traffic light of a world once,
+    as traffic lights never move, and indexes them by the road_id of that waypoint.
+    Every agent of the same world shares the table, see TrafficLightTable.for_world.
+    """
+
+    _tables = {}
+
+    def __init__(self, world, wmap=None):
+        """
+        :param world: carla.World object
+        :param wmap: carla.Map of the world. If None, it is requested to the server
+        """
+        self._map = wmap if wmap is not None else world.get_map()
+        self._entries = {}
+        self._roads = {}
+        for traffic_light in world.get_actors().filter('*traffic_light*'):
+            self.entry(traffic_light)
+
+    @classmethod
+    def for_world(cls, world, wmap=None):
+        """Returns the table of a world, building it the first time"""
+        table = cls._tables.get(world.id)
+        if table is None:
+            table = cls(world, wmap)
+            cls._tables[world.id] = table
+        return table
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def entry(self, traffic_light):
+        """Returns the entry of a traffic light, adding it to the table if it is a new one"""
+        entry = self._entries.get(traffic_light.id)
+        if entry is None:
+            entry = TrafficLightEntry(traffic_light, self._map)
+            self._entries[entry.id] = entry
+            self._roads.setdefault(entry.road_id, []).append(entry)
+        return entry
+
+    def lights_on_road(self, road_id):
+        """Returns the entries of the traffic lights whose trigger waypoint is on a road"""
+        return self._roads.get(road_id, [])
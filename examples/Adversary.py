@@ -50,6 +50,9 @@ from carla import ColorConverter as cc
 from agents.navigation.basic_agent import BasicAgent
 from agents.navigation.simple_agent import SimpleAgent
 from agents.navigation.behavior_agent import BehaviorAgent
+from agents.tools.feature_store import FeatureStore
+from agents.tools.path_file import grid_locations, read_path
+from agents.tools.sensor_buffer import SensorEventBuffer
 
 from enum import Enum
 from shapely.geometry import Point
@@ -97,27 +100,33 @@ class World(object):
         self.obstacle_sensor_adv = None
         self.obstacle_sensor_ego = None
         self.feature_vector = []
+
+    def tick(self):
+        """Ticks the world and gives its snapshot to the obstacle sensors"""
+        frame = self.world.tick()
+        snapshot = self.world.get_snapshot()
+        for sensor in (self.obstacle_sensor_adv, self.obstacle_sensor_ego):
+            if sensor is not None:
+                sensor.on_tick(snapshot)
+        return frame
     
     def write_features(self, score, frame, args):
         file_path = "C:\\data\\Features\\"
         if(score < 0):
-            num = args.file.split('#')[1]
-            file_name = f"features_path{num}_label1_score{score:8.6f}_frame{frame}"
-            file = file_path + file_name + ".csv"
-            with open(file,"w",newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(["Frame","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"])
-                writer.writerows(self.feature_vector)
+            label = 1
         elif(score >= 0 and score < 500):
-            num = args.file.split('#')[1]
-            file_name = f"features_path{num}_label0_score{score:8.6f}_frame{frame}"
-            file = file_path + file_name + ".csv"
-            with open(file,"w",newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(["Frame","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"])
-                writer.writerows(self.feature_vector)
+            label = 0
         else: 
             return
+        num = args.file.split('#')[1]
+        file_name = f"features_path{num}_label{label}_score{score:8.6f}_frame{frame}"
+        file = file_path + file_name + ".csv"
+        with open(file,"w",newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Frame","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"])
+            writer.writerows(self.feature_vector)
+        with FeatureStore(file_path) as store:
+            store.add(file, label=label, score=score, path_id=num, event_frame=frame, parameters={'file': args.file})
     
     def get_features(self):
         snapshot = self.world.get_snapshot()
@@ -306,9 +315,7 @@ class ObstacleSensor(object):
     def __init__(self, parent_actor):
         """Constructor method"""
         self.sensor = None
-        self.history = []
-        self.speeds = []
-        self.frames = []
+        self.buffer = SensorEventBuffer()
         self._parent = parent_actor
         world = self._parent.get_world()
         blueprint = world.get_blueprint_library().find('sensor.other.obstacle')
@@ -320,24 +327,21 @@ class ObstacleSensor(object):
         weak_self = weakref.ref(self)
         self.sensor.listen(lambda event: ObstacleSensor._on_obstacle_detected(weak_self, event))
 
+    def on_tick(self, snapshot):
+        """Gives the speed of the parent at the frame of the snapshot to the events"""
+        vel = snapshot.find(self._parent.id).get_velocity()
+        self.buffer.on_tick(snapshot.frame, math.sqrt(vel.x ** 2 + vel.y ** 2 + vel.z ** 2)) #m/s
+
     def get_smallest_distance(self):
         """Gets the closest distance between Adversary and ego"""
-        if(len(self.history)>0): return sorted(self.history)[0]
+        self.buffer.flush()
+        if self.buffer.min_distance is not None: return self.buffer.min_distance
         else: return 999
     
     def get_shortest_ttc(self):
-        
-        if(len(self.history)>0):
-            ttcs = []
-            for i in range(0,len(self.history)):
-                if(self.speeds[i] == 0): ttc = 100
-                else: ttc = self.history[i] / self.speeds[i]
-                ttcs.append(ttc)
-            shortest_ttc = sorted(ttcs)[0]
-            index = ttcs.index(shortest_ttc)
-            shortest_ttc_frame = self.frames[index]
-            
-            return (shortest_ttc, shortest_ttc_frame)
+        self.buffer.flush()
+        if self.buffer.min_ttc is not None:
+            return (self.buffer.min_ttc, self.buffer.min_ttc_frame)
         else: return (100,100)
 
     @staticmethod
@@ -346,13 +350,8 @@ class ObstacleSensor(object):
         self = weak_self()
         if not self:
             return
-        self.history.append(event.distance)
-        
-        #if(self._parent):
-        vel = self._parent.get_velocity()
-        speed = math.sqrt(vel.x ** 2 + vel.y ** 2 + vel.z ** 2) #m/s
-        self.speeds.append(speed)
-        self.frames.append(event.frame)
+        #the speed of the parent comes from the snapshot of the frame, see on_tick
+        self.buffer.add(event.frame, event.distance)
         
         
 
@@ -464,21 +463,15 @@ def game_loop(args):
         
 
         #read the path the Adversary is supposed to take from the file
-        with open(args.file) as f:
-            lines = f.readlines()
-        point_array=[]
-        speed_array=[]
-        accel_array=[]
+        #CSV or binary path file, see agents/tools/path_file.py
+        records = read_path(args.file)
+        point_array = [str(p) for p in records['point'].tolist()]
+        speed_array = (records['speed'] * 3.6).tolist() #converts velocity in m/s to km/hr
+        accel_array = (records['accel'] * 3.6).tolist() #converts accel in m/(s * s) to km/(hr * s)
         destination_array=[]
-        for line in lines:
-            sp = line.split(',')
-            point_array.append(sp[1])
-            speed_array.append(float(sp[2]) * 3.6) #converts velocity in m/s to km/hr
-            accel_array.append(float(sp[3]) * 3.6) #converts accel in m/(s * s) to km/(hr * s)
-        for point in point_array:
-            i, j = grid.return_coords_from_point(point) 
-            dest = grid.return_location_from_grid(i,j)
-            destination_array.append(dest)
+        xs, ys = grid_locations(point_array, grid.top, grid.left, grid.box_width, grid.box_height)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            destination_array.append(carla.Location(x=x,y=y,z=1))
         
         SpeedorAccel = None
         if(len(speed_array) > 1):
@@ -527,7 +520,7 @@ def game_loop(args):
 
         #This is necessary to ensure vehicle "stabilizes" after "falling"
         for i in range (0,30):
-            world.world.tick()
+            world.tick()
 
         #No negative speed, no NaNs
         for spd in speed_array:
@@ -582,7 +575,7 @@ def simulate_categorical_distribution(world, adversary, args):
     adversary.cost += -1/len(adversary.dest_array)
     
     while True:
-        world.world.tick()        
+        world.tick()        
 
         Adversary_speed = world.get_vehicle_speed(world.Adversary)
         Adversary_loca = world.Adversary.get_location()
@@ -664,7 +657,7 @@ def simulate_normal_distribution(world, adversary, args, SpeedorAccel):
     in_crosswalk = False
     while True:
         world.get_features()
-        world.world.tick()
+        world.tick()
         stuck_counter += 1
         
         Adversary_speed = world.get_vehicle_speed(world.Adversary)
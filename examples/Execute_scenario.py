@@ -50,6 +50,10 @@ from carla import ColorConverter as cc
 from agents.navigation.basic_agent import BasicAgent
 from agents.navigation.simple_agent import SimpleAgent
 from agents.navigation.behavior_agent import BehaviorAgent
+from agents.tools.episode_recording import EpisodeRecorder, EpisodeRecording, replay_in_world
+from agents.tools.feature_store import FeatureStore
+from agents.tools.path_file import grid_locations, read_path
+from agents.tools.profiler import get_profiler
 
 from enum import Enum
 from shapely.geometry import Point
@@ -61,6 +65,9 @@ from rtamt.spec.stl.discrete_time.specification import Semantics
 # -- Helper Functions ----------------------------------------------------------
 # ==============================================================================
 
+#columns of the log of every tick, scored by score_scenario
+LOG_HEADER = ['time','distance','ego_speed','obstacle_detected']
+
 def get_2D_distance(loc1, loc2):
     return math.sqrt((loc1.x - loc2.x)**2+(loc1.y-loc2.y)**2)
 
@@ -87,6 +94,29 @@ def read_csv(filename):
 
 
 
+def write_feature_file(feature_vector, scenario, args, frame):
+    file_path = "C:\\data\\Features\\"
+    header = ["Frame","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake","seed"]
+    rows = [row + [scenario.seed] for row in feature_vector]
+    score = scenario.score
+    if(score < 0):
+        label = 1
+    elif(score >= 0):
+        label = 0
+    else: 
+        return
+    num = args.file.split('#')[1]
+    file_name = f"features_path{num}_label{label}_score{score:8.6f}_frame{frame}"
+    file = file_path + file_name + ".csv"
+    with open(file,"w",newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    #index of the files, so they can be found by label or score without parsing their names
+    with FeatureStore(file_path) as store:
+        store.add(file, label=label, score=score, path_id=num, event_frame=frame, seed=scenario.seed,
+                  parameters={'file': args.file, 'ego_start': int(scenario.ego_start), 'ego_end': int(scenario.ego_end)})
+
 # ==============================================================================
 # -- Scenario ------------------------------------------------------------------
 # ==============================================================================
@@ -104,11 +134,34 @@ class Scenario(object):
         self.frame = 0
         self.accident = False
         self.fault = "nobody"
-        self.ego_start, self.ego_end = Scenario.get_random_start_end_for_ego()
+        #every random choice of the run comes from this seed, so the same file and seed give the same run
+        self.seed = args.seed if args.seed is not None else int(random.randint(0, 2**31 - 1))
+        self.rng = random.RandomState(self.seed)
+        self.ego_start, self.ego_end = Scenario.get_random_start_end_for_ego(self.rng)
         self.read_file()
 
+    @classmethod
+    def from_recording(cls, args, metadata):
+        """Scenario of a recorded episode, before its scoring, without reading its path file"""
+        scenario = cls.__new__(cls)
+        scenario._args = args
+        scenario.file = metadata['file']
+        scenario.score = 0
+        scenario.point_array = []
+        scenario.speed_array = []
+        scenario.accel_array = []
+        scenario.destination_array = []
+        scenario.frame = 0
+        scenario.accident = metadata['accident']
+        scenario.fault = metadata['fault']
+        scenario.seed = metadata['seed']
+        scenario.rng = random.RandomState(scenario.seed)
+        scenario.ego_start = metadata['ego_start']
+        scenario.ego_end = metadata['ego_end']
+        return scenario
+
     @staticmethod
-    def get_random_start_end_for_ego():
+    def get_random_start_end_for_ego(rng=random):
         start_points_dict = {'start_points':[15,228,61,98]}
         end_points_dict = {}
         end_points_dict.update({15:[229,58,9,90,91]})
@@ -116,17 +169,16 @@ class Scenario(object):
         end_points_dict.update({61:[229,31,90,91,9]})
         end_points_dict.update({98:[58,229,31,90,91]})
             
-        start_point = random.choice(start_points_dict['start_points'])
-        end_point = random.choice(end_points_dict[start_point])
+        start_point = rng.choice(start_points_dict['start_points'])
+        end_point = rng.choice(end_points_dict[start_point])
         return start_point,end_point
 
     def read_file(self):
-        with open(self.file, mode='r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                self.point_array.append(row[1])
-                self.speed_array.append(float(row[2]) * 3.6)
-                self.accel_array.append(float(row[3]))
+        #CSV or binary path file, see agents/tools/path_file.py
+        records = read_path(self.file)
+        self.point_array = [str(p) for p in records['point'].tolist()]
+        self.speed_array = (records['speed'] * 3.6).tolist()
+        self.accel_array = records['accel'].tolist()
     
     def score_path(self):
         isBadPath = False
@@ -180,9 +232,10 @@ class ObstacleSensor(object):
         self = weak_self()
         if not self:
             return
-        #print(f"Obstacle detected by {event.actor.parent} at frame {event.frame}:\t{event.other_actor} at {event.distance}")
-        self.history['frame'].append(event.frame)
-        self.history['distance'].append(event.distance)
+        with get_profiler().section('sensor.obstacle'):
+            #print(f"Obstacle detected by {event.actor.parent} at frame {event.frame}:\t{event.other_actor} at {event.distance}")
+            self.history['frame'].append(event.frame)
+            self.history['distance'].append(event.distance)
 
 # ==============================================================================
 # -- World ---------------------------------------------------------------
@@ -207,6 +260,7 @@ class World(object):
         self.obstacle_sensor_ego = None
         self.adversary = None
         self.feature_vector = []
+        self.recorder = None
     
     def destroy(self):
         actors = [
@@ -234,10 +288,10 @@ class World(object):
             x+=self._grid.box_height
 
     def convert_points_to_locations(self, scenario: Scenario):
-        for point in scenario.point_array:
-            i, j = self._grid.return_coords_from_point(point) 
-            dest = self._grid.return_location_from_grid(i,j)
-            scenario.destination_array.append(dest)
+        #same locations as return_location_from_grid, computed for all the points at once
+        xs, ys = grid_locations(scenario.point_array, self._grid.top, self._grid.left, self._grid.box_width, self._grid.box_height)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            scenario.destination_array.append(carla.Location(x=x,y=y,z=1))
     
     def draw_points_and_locations(self, points):
         counter = 0
@@ -250,6 +304,8 @@ class World(object):
     def get_features(self):
         snapshot = self.world.get_snapshot()
         frame = snapshot.frame
+        if self.recorder is not None:
+            self.recorder.capture(snapshot)
         actors = []
         ActorSnapshot_ego = snapshot.find(self.ego.id)
         actors.append(ActorSnapshot_ego)
@@ -275,27 +331,7 @@ class World(object):
         self.feature_vector.append(frame_feature_vector)
 
     def write_features(self, scenario, args, frame):
-        file_path = "C:\\data\\Features\\"
-        header = ["Frame","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"]
-        score = scenario.score
-        if(score < 0):
-            num = args.file.split('#')[1]
-            file_name = f"features_path{num}_label1_score{score:8.6f}_frame{frame}"
-            file = file_path + file_name + ".csv"
-            with open(file,"w",newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-                writer.writerows(self.feature_vector)
-        elif(score >= 0):
-            num = args.file.split('#')[1]
-            file_name = f"features_path{num}_label0_score{score:8.6f}_frame{frame}"
-            file = file_path + file_name + ".csv"
-            with open(file,"w",newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-                writer.writerows(self.feature_vector)
-        else: 
-            return
+        write_feature_file(self.feature_vector, scenario, args, frame)
 
 # ==============================================================================
 # -- Grid ---------------------------------------------------------------
@@ -351,6 +387,8 @@ class Grid(object):
 def game_loop(args, scenario):
 
     world = None
+    client = None
+    recorder_file = None
     try:
         client = carla.Client(args.host, args.port)
         client.set_timeout(4.0)
@@ -374,6 +412,11 @@ def game_loop(args, scenario):
         spectator = world.world.get_spectator()
         spectator.set_transform(carla.Transform(carla.Location(x=-100,y=14,z=50),carla.Rotation(roll=0, pitch=-70,yaw=0)))
 
+        if args.recorder is not None:
+            #started before the actors are spawned, the simulator needs their creation to replay them
+            recorder_file = simulator_recording_file_name(args, scenario)
+            client.start_recorder(recorder_file)
+
         # Spawn the actors
         blueprints = world.world.get_blueprint_library()
 
@@ -405,15 +448,37 @@ def game_loop(args, scenario):
         for i in range (0,30):
             world.world.tick()
 
+        if args.record is not None:
+            world.recorder = EpisodeRecorder({'ego': world.ego, 'adversary': world.adversary})
+
         isScoreable = execute_scenario(world, scenario, spectator)#it's scoreable as long as the adversary didn't get stuck/into an accident
 
-        if isScoreable: score_scenario(world, scenario)        
+        if isScoreable:
+            with get_profiler().section('stl_scoring'):
+                score_scenario(world, scenario)
+
+        if world.recorder is not None:
+            #everything replay_scenario needs to score the episode again
+            world.recorder.save(recording_file_name(args, scenario), {
+                'file': scenario.file, 'seed': scenario.seed, 'ego_start': int(scenario.ego_start), 'ego_end': int(scenario.ego_end),
+                'scoreable': isScoreable, 'accident': scenario.accident, 'fault': scenario.fault, 'score': scenario.score})
 
     finally:
         if(scenario.score > 0 and scenario.fault == "ego"):
             scenario.score = -666666
         print(f"{scenario.score:8.6f}")
-        world.write_features(scenario, args, scenario.frame)
+        if not args.no_features:
+            world.write_features(scenario, args, scenario.frame)
+        if recorder_file is not None:
+            client.stop_recorder()
+
+        profiler = get_profiler()
+        if profiler.enabled:
+            #on stderr, the score has to stay the only output on stdout
+            print(profiler.end_episode(), file=sys.stderr)
+            if args.profile_trace is not None:
+                profiler.write_chrome_trace(args.profile_trace)
+                profiler.write_folded(os.path.splitext(args.profile_trace)[0] + '.folded')
 
         if world is not None:
             #tm.set_synchronous_mode(False)
@@ -439,14 +504,20 @@ def execute_scenario(world, scenario, spectator):
     distance = get_2D_distance(adversary_loca,destination)
     target_speed = 0 + scenario.accel_array[dest_index-1] * (distance/1 * 3.6)  
     adversary_agent = SimpleAgent(world.adversary, destination, target_speed=target_speed)
-    ego_agent = BasicAgent(world.ego, target_speed = 9,  opt_dict={'ignore_traffic_lights':'True','base_vehicle_threshold':10.0})
+    ego_agent = BasicAgent(world.ego, target_speed = 9,  opt_dict={'ignore_traffic_lights':'True','base_vehicle_threshold':10.0,'seed':scenario.seed})
     ego_agent.set_destination(world.map.get_spawn_points()[scenario.ego_end].location)
 
+    profiler = get_profiler()
     big_array = []
     stuck_counter = 0
+    #with --no_features, the per tick states are left to the recorders
+    collect_features = not world._args.no_features or world.recorder is not None
     while True:
-        world.get_features()
-        world.world.tick()
+        if collect_features:
+            with profiler.section('features'):
+                world.get_features()
+        with profiler.section('tick'):
+            world.world.tick()
         stuck_counter += 1
 
         adversary_loca = world.adversary.get_location()
@@ -462,6 +533,8 @@ def execute_scenario(world, scenario, spectator):
         small_array.append(ego_speed)
         small_array.append(world.obstacle_sensor_ego.history['frame'].count(int(frame)))
         big_array.append(small_array)
+        if world.recorder is not None:
+            world.recorder.log(LOG_HEADER, small_array)
 
 
         if(stuck_counter % 200 == 0):
@@ -541,29 +614,25 @@ def execute_scenario(world, scenario, spectator):
             if(world._args.debug_score): print(f"Ego is done, exiting")
             break
 
-        control = adversary_agent.run_step()
+        with profiler.section('adversary.run_step'):
+            control = adversary_agent.run_step()
         control.manual_gear_shift = False
         world.adversary.apply_control(control)
 
-        world.ego.apply_control(ego_agent.run_step())
+        with profiler.section('ego.run_step'):
+            control = ego_agent.run_step()
+        world.ego.apply_control(control)
     
+    if world.recorder is not None:
+        world.recorder.set_events('obstacle', world.obstacle_sensor_ego.history)
+
     if isScoreable:
         file = "c:\\data\\log_file.csv"
-        header = ['time','distance','ego_speed','obstacle_detected']
+        header = LOG_HEADER
         with open(file,'w',newline='') as csvfile:
             csvwriter = csv.writer(csvfile)
             csvwriter.writerow(header)           
-            counter = 0
-            for i in range(len(world.obstacle_sensor_ego.history['frame'])):
-                frame_to_change = world.obstacle_sensor_ego.history['frame'][i]
-                new_dist = world.obstacle_sensor_ego.history['distance'][i]
-                for small_array in big_array:
-                    if(small_array[0]==frame_to_change):
-                        small_array[1] = new_dist
-            for small_array in big_array:
-                if(small_array[-1] == 0 and small_array[1] < 5):
-                    small_array[1] = 5.000000
-                csvwriter.writerow(small_array)
+            csvwriter.writerows(correct_log_rows(big_array, world.obstacle_sensor_ego.history))
 
         
         if len(world.obstacle_sensor_ego.history)>0:
@@ -579,6 +648,22 @@ def execute_scenario(world, scenario, spectator):
     
     return isScoreable
 
+def correct_log_rows(big_array, history):
+    """
+    Overwrites the 'ground truth' distances of the log with the distances of the obstacle
+    detector, and the distances under 5 m without detection with 5 m. Returns the rows.
+    """
+    for i in range(len(history['frame'])):
+        frame_to_change = history['frame'][i]
+        new_dist = history['distance'][i]
+        for small_array in big_array:
+            if(small_array[0]==frame_to_change):
+                small_array[1] = new_dist
+    for small_array in big_array:
+        if(small_array[-1] == 0 and small_array[1] < 5):
+            small_array[1] = 5.000000
+    return big_array
+
         
 
 # ==============================================================================
@@ -590,8 +675,17 @@ def score_scenario(world, scenario):
     
     read_file = 'c:\\data\\log_file.csv'
     write_file = 'c:\\data\\log_file_with_rob.csv'
-    dataSet = read_csv(read_file)
-    
+    with open(read_file, mode='r') as inFile:
+        csv_reader = csv.reader(inFile)
+        headers = next(csv_reader, None)
+        rows = [row for row in csv_reader]
+    score_log(scenario, headers, rows, world._args.debug_score, write_file)
+
+def score_specification():
+    """
+    Parsed STL specification the logs are scored with, by score_log and by the tools that
+    have to give the same robustness (e.g. Cross_Entropy/surrogate.py)
+    """
     spec = rtamt.STLDiscreteTimeSpecification()
     spec.name = 'Test'
     spec.declare_var('distance', 'float')
@@ -603,9 +697,23 @@ def score_scenario(world, scenario):
     spec.spec = 'out = always((distance < 5.0)  implies (eventually[0:10](ego_speed < 0.1)))'
     #spec.semantics = Semantics.STANDARD
     spec.semantics = Semantics.OUTPUT_ROBUSTNESS
+    spec.parse()
+    return spec
+
+def score_log(scenario, headers, rows, debug_score=False, write_file=None):
+    """
+    Adds the minimum STL robustness of the rows of a log to the score of the scenario and sets
+    the frame of the event, writes the rows with their robustness to 'write_file' if given
+    """
+    dataSet = {}
+    for h in headers:
+        dataSet[h] = []
+    for row in rows:
+        for h, v in zip(headers, row):
+            dataSet[h].append(float(v))
     
     try:
-        spec.parse()
+        spec = score_specification()
     except rtamt.STLParseException as err:
         print('STL Parse Exception: {}'.format(err))
         sys.exit()
@@ -617,7 +725,7 @@ def score_scenario(world, scenario):
         if math.isinf(min_rob):
             #min_rob = sys.float_info.max/1000000
             min_rob = 2
-            if(world._args.debug_score):
+            if(debug_score):
                 print(f"Ego never came within 5 meters of adversary")
         else:
             for r in rob:
@@ -625,32 +733,111 @@ def score_scenario(world, scenario):
                     min_rob = rob[1]
         
         scenario.score += min_rob
-        if(world._args.debug_score):
+        if(debug_score):
             print(f"Minimum robustness: {str(min_rob)}")
             print(f"Done scoring STL, score is: {scenario.score}")
 
-    
-    with open(read_file, mode='r') as inFile, open(write_file, "w",newline='') as outFile:
-        csv_reader = csv.reader(inFile)
-        csv_writer = csv.writer(outFile)
-        headers = next(csv_reader, None)
-        headers.append('robustness')
-        csv_writer.writerow(headers)
-        line_count = 0
-        
+    line_count = 0
+    changed = False
+    for row in rows:
+        if(line_count == 0):
+            scenario.frame = row[0]
+        elif(line_count > 0 and not changed):
+            if(rob[line_count][1] != rob[line_count-1][1]): #if the robustness has changed, minimum will always be first
+                scenario.frame = int(row[0])-1
+                changed = True
+        line_count += 1
+
+    if write_file is not None:
+        with open(write_file, "w",newline='') as outFile:
+            csv_writer = csv.writer(outFile)
+            csv_writer.writerow(headers + ['robustness'])
+            for line_count, row in enumerate(rows):
+                csv_writer.writerow(list(row) + [rob[line_count][1]])
+
+# ==============================================================================
+# -- replay --------------------------------------------------------------------
+# ==============================================================================
+
+def recording_file_name(args, scenario):
+    stem = os.path.splitext(os.path.basename(scenario.file))[0]
+    return os.path.join(args.record, f"{stem}_seed{scenario.seed}.npz")
+
+def simulator_recording_file_name(args, scenario):
+    #absolute, otherwise the simulator writes it to its own directory
+    stem = os.path.splitext(os.path.basename(scenario.file))[0]
+    return os.path.abspath(os.path.join(args.recorder, f"{stem}_seed{scenario.seed}.log"))
+
+def features_from_recording(recording):
+    """Rows of World.get_features, computed from the recorded states of the ego and the adversary"""
+    rows = []
+    for ego, adv in zip(recording.states['ego'].tolist(), recording.states['adversary'].tolist()):
+        frame_feature_vector = [ego[0]]
+        for actor in (ego, adv):
+            frame_feature_vector.append(actor[1])
+            frame_feature_vector.append(actor[2])
+            frame_feature_vector.append(math.sqrt(actor[7] ** 2 + actor[8] ** 2 + actor[9] ** 2))
+        for actor in (ego, adv):
+            frame_feature_vector.extend(actor[10:13])
+        rows.append(frame_feature_vector)
+    return rows
+
+def replay_scenario(args):
+    """
+    Scores a recorded episode and writes its features as game_loop does, without the simulator.
+    Only the scoring is done again: the accident and its fault are the recorded ones.
+    """
+    recording = EpisodeRecording(args.replay)
+    metadata = recording.metadata
+    if args.file is None:
+        args.file = metadata['file']
+    scenario = Scenario.from_recording(args, metadata)
+    if metadata['scoreable']:
+        rows = correct_log_rows(recording.log_rows(), recording.events['obstacle'])
+        with get_profiler().section('stl_scoring'):
+            score_log(scenario, recording.log_header, rows, args.debug_score)
+    if(scenario.score > 0 and scenario.fault == "ego"):
+        scenario.score = -666666
+    print(f"{scenario.score:8.6f}")
+    if not args.no_features:
+        write_feature_file(features_from_recording(recording), scenario, args, scenario.frame)
+    if args.visual:
+        visual_replay(args, recording)
+
+def visual_replay(args, recording):
+    """Plays a recorded episode in the simulator, the vehicles follow their recorded transforms"""
+    world = None
+    actors = {}
+    try:
+        client = carla.Client(args.host, args.port)
+        client.set_timeout(4.0)
+        world = client.get_world()
+        settings = world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = 0.05
+        world.apply_settings(settings)
+
+        spectator = world.get_spectator()
+        spectator.set_transform(carla.Transform(carla.Location(x=-100,y=14,z=50),carla.Rotation(roll=0, pitch=-70,yaw=0)))
+
+        blueprints = world.get_blueprint_library()
+        for role, blueprint_id in (('adversary', "vehicle.diamondback.century"), ('ego', "vehicle.dodge.charger_police")):
+            blueprint = blueprints.filter(blueprint_id)[0]
+            blueprint.set_attribute('role_name', role)
+            s = recording.states[role][0]
+            transform = carla.Transform(carla.Location(x=float(s['x']), y=float(s['y']), z=float(s['z']) + 0.5),
+                                        carla.Rotation(pitch=float(s['pitch']), yaw=float(s['yaw']), roll=float(s['roll'])))
+            actors[role] = world.spawn_actor(blueprint, transform)
+        replay_in_world(world, recording, actors)
+    finally:
+        if world is not None:
+            settings = world.get_settings()
+            settings.synchronous_mode = False
+            settings.fixed_delta_seconds = None
+            world.apply_settings(settings)
+            for actor in actors.values():
+                actor.destroy()
 
-        changed = False
-        for row in csv_reader:
-            if(line_count == 0):
-                scenario.frame = row[0]
-            elif(line_count > 0 and not changed):
-                if(rob[line_count][1] != rob[line_count-1][1]): #if the robustness has changed, minimum will always be first
-                    scenario.frame = int(row[0])-1
-                    changed = True
-            new_row = row
-            new_row.append(rob[line_count][1])
-            csv_writer.writerow(new_row)
-            line_count += 1
 # ==============================================================================
 # -- main() --------------------------------------------------------------------
 # ==============================================================================
@@ -685,10 +872,54 @@ def main():
         '--debug_score',
         action = 'store_true',
         help='Debug score (default: False)')
+    argparser.add_argument(
+        '--seed',
+        help='seed of the random choices of the scenario and the agents, written to the features file (default: random)',
+        default=None,
+        type=int)
+
+    argparser.add_argument(
+        '--profile',
+        action = 'store_true',
+        help='Time the sections of the scenario loop and print a summary on stderr (default: False)')
+    argparser.add_argument(
+        '--profile_trace',
+        help='Also write a Chrome trace of the sections to this file, and folded stacks next to it (default: None)',
+        default=None,
+        type=str)
+
+    argparser.add_argument(
+        '--record',
+        help='Directory to record the episode to, so it can be scored again with --replay (default: None)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--replay',
+        help='Recording to score and to write the features of, without the simulator (default: None)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--recorder',
+        help='Directory to record the episode to with the recorder of the simulator, see recorder_tables.py (default: None)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--no_features',
+        action = 'store_true',
+        help='Don\'t collect the features at every tick nor write the features file, e.g. for bulk runs with --recorder (default: False)')
+    argparser.add_argument(
+        '--visual',
+        action = 'store_true',
+        help='With --replay, also play the recording in the simulator (default: False)')
 
     args = argparser.parse_args()
+    if args.profile or args.profile_trace is not None:
+        get_profiler().enable(trace=args.profile_trace is not None)
     
     try:
+        if args.replay is not None:
+            replay_scenario(args)
+            return
         #first read the path from the file
         scenario = Scenario(args)
         #ensure path is good - like AbstractScore.java
@@ -11,7 +11,6 @@ import glob
 import math
 import os
 import sys
-import csv
 
 # ==============================================================================
 # -- Find CARLA module ---------------------------------------------------------
@@ -37,6 +36,7 @@ from carla import ColorConverter as cc
 
 from agents.navigation.basic_agent import BasicAgent
 from agents.navigation.simple_agent import SimpleAgent
+from agents.tools.path_file import grid_locations, read_path
 
 # ==============================================================================
 # -- Helper Functions ----------------------------------------------------------
@@ -66,11 +66,10 @@ class Scenario(object):
         self.read_file()
 
     def read_file(self):
-        with open(self.file, mode='r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                self.point_array.append(row[1])
-                self.speed_array.append(float(row[2]) * 3.6 * 3)
+        #CSV or binary path file, see agents/tools/path_file.py
+        records = read_path(self.file)
+        self.point_array = [str(p) for p in records['point'].tolist()]
+        self.speed_array = (records['speed'] * 3.6 * 3).tolist()
 
 # ==============================================================================
 # -- World ---------------------------------------------------------------
@@ -120,10 +119,10 @@ class World(object):
             x+=self._grid.box_height
 
     def convert_points_to_locations(self, scenario: Scenario):
-        for point in scenario.point_array:
-            i, j = self._grid.return_coords_from_point(point) 
-            dest = self._grid.return_location_from_grid(i,j)
-            scenario.destination_array.append(dest)
+        #same locations as return_location_from_grid, computed for all the points at once
+        xs, ys = grid_locations(scenario.point_array, self._grid.top, self._grid.left, self._grid.box_width, self._grid.box_height)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            scenario.destination_array.append(carla.Location(x=x,y=y,z=self._grid.grid_height))
     
     def draw_points_and_locations(self, points):
         counter = 0
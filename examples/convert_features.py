@@ -5,41 +5,189 @@
 # Purpose:          
 
 import argparse
+import collections
+import functools
 import os
 import csv
+import multiprocessing
+import sys
+
+import numpy as np
+
+from modify_features_list import DT, FEATURES, MAX_TTC, derive_features
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+
+from agents.tools.feature_store import FeatureStore
+
+NUM_TIME_STEPS = 11
+TIME_STEP = 10
+STEP_HEADERS = ["ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"]
+
+def step_headers(derive=None):
+    """
+    Columns of a time step, after its time. With derived features, they take the place of the
+    location columns, as modify_features_list.py does.
+    """
+    if not derive:
+        return list(STEP_HEADERS)
+    headers = []
+    for h in STEP_HEADERS:
+        if h == "ego_loc_y": headers.extend(derive)
+        elif "_loc_" not in h: headers.append(h)
+    return headers
+
+def extract_window(file_path, derive=None, dt=DT, max_ttc=MAX_TTC, label=None, frame=None):
+    """
+    Reads a features file written by Execute_scenario.py and returns the line of features_list.csv
+    made from it: NUM_TIME_STEPS rows, TIME_STEP frames apart, ending at the event frame of the file
+    (or starting at the first row if the event is in the first 100 frames), followed by the label.
+    If 'derive' lists derived features, they replace the locations (see modify_features_list.py).
+    The label and the event frame are read from the name of the file unless they are given.
+    """
+    if label is None or frame is None:
+        fileName = os.path.basename(file_path)
+        filename_components = str(fileName).split("_",4)
+        label = filename_components[2].split("label")[1]
+        frame = filename_components[4].split("frame")[1].split(".")[0]
+    frame = str(frame)
+
+    #the window is in the first rows, or in the rows before the event frame: only those are kept,
+    #as raw lines, and only the lines of the window are parsed
+    window_rows = TIME_STEP * (NUM_TIME_STEPS - 1) + 1
+    head = []
+    tail = collections.deque(maxlen=window_rows)
+    window = None
+    prefix = frame + ","
+    with open(file_path, mode='r') as csv_file:
+        fields = next(csv.reader(csv_file))
+        #the seed of the run isn't a feature, leave it out
+        num_columns = fields.index("seed") if "seed" in fields else len(fields)
+        for line_count, text in enumerate(csv_file):
+            if line_count < window_rows:
+                head.append(text)
+            tail.append(text)
+            if text.startswith(prefix):
+                #the window ends at the event frame, unless it is in the first rows
+                window = list(tail) if line_count >= window_rows - 1 else None
+    if window is None:
+        window = head
+
+    #one row every TIME_STEP frames, as a strided slice of the window
+    rows = [row[1:num_columns] for row in csv.reader(window[::TIME_STEP])]
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), num_columns - 1)
+
+    columns = dict(zip(STEP_HEADERS, values.T.tolist()))
+    if derive:
+        derived = derive_features(*(values[:, STEP_HEADERS.index(h)] for h in
+                                    ("ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity")),
+                                  features=derive, dt=dt, max_ttc=max_ttc)
+        columns.update((name, array[0].tolist()) for name, array in derived.items())
+    headers = step_headers(derive)
 
-def record_five_minutes(index, rows, label):
-    data = []
-    line_count = 0
-    for row in rows:
-        if((line_count-index)%10==0 and line_count<=index + 100 and line_count>=index): 
-            data.append(row[1:])
-        line_count += 1
     line = []
-    time_index = 0
-    for d in data:
-        line.append(int(time_index))
-        for item in d:
-            line.append(float(item))
-        time_index += 1
+    for time_index in range(len(values)):
+        line.append(time_index)
+        line.extend(columns[h][time_index] for h in headers)
     line.append(int(label))
     return line
 
-def write_headers():
-    headers = ["time","ego_loc_x","ego_loc_y","ego_velocity","adv_loc_x","adv_loc_y","adv_velocity","ego_throttle","ego_steer","ego_brake","adv_throttle","adv_steer","adv_brake"]
+def extract_trace(trace, **kwargs):
+    """extract_window of a (file path, label, event frame) tuple"""
+    file_path, label, frame = trace
+    return extract_window(file_path, label=label, frame=frame, **kwargs)
+
+def list_traces(path, output_file, index=False, label=None, min_score=None, max_score=None):
+    """
+    (file path, label, event frame) of the features files under 'path'. With 'index', they come from
+    the FeatureStore of 'path', in the order they were written, filtered by label and score (the
+    existing files are indexed first if the store is empty); else every file in the order of os.walk,
+    with the label and frame of its name.
+    """
+    if index:
+        with FeatureStore(path) as store:
+            if len(store) == 0:
+                store.import_directory()
+            return [(store.trace_path(record), record.label, record.event_frame)
+                    for record in store.query(label=label, min_score=min_score, max_score=max_score)]
+    traces = []
+    for dirName, subdirList, fileList in os.walk(path):
+        for fileName in fileList:
+            file_path = os.path.join(dirName,fileName)
+            if fileName.startswith(FeatureStore.FILE_NAME):
+                continue
+            if os.path.abspath(file_path) != os.path.abspath(output_file):
+                traces.append((file_path, None, None))
+    return traces
+
+def write_headers(derive=None):
+    headers = ["time"] + step_headers(derive)
     header_line = []
-    num_time_steps = 11
-    num_features = len(headers)
+    num_time_steps = NUM_TIME_STEPS
     for i in range(num_time_steps):
         for h in headers:
             header_line.append(h+f"_{i}")
     header_line.append("label")
     return header_line
 
-def write_to_file(line, file):
-    with open(file,mode='a+',newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(line)
+class ConstantColumns(object):
+    """Tracks, line by line, which columns of the output have the same value in every line"""
+
+    def __init__(self):
+        self.first_line = None
+        self.constant = None
+
+    def update(self, line):
+        if self.first_line is None:
+            self.first_line = list(line)
+            self.constant = [True] * len(line)
+            return
+        for i in range(min(len(line), len(self.constant))):
+            if self.constant[i] and line[i] != self.first_line[i]:
+                self.constant[i] = False
+        #a column missing in some line isn't constant
+        for i in range(len(line), len(self.constant)):
+            self.constant[i] = False
+
+    def columns(self):
+        return [i for i, constant in enumerate(self.constant or []) if constant]
+
+def convert(path, output_file, workers=None, chunk_size=1000, derive=None, dt=DT, max_ttc=MAX_TTC, traces=None):
+    """
+    Converts every features file under 'path' (or the 'traces' of list_traces) into a line of
+    'output_file'. The files are read by a pool of 'workers' processes (all the cores if None, in
+    this process if 1) and the lines are written in chunks of 'chunk_size', in the order of the
+    files. Returns the ConstantColumns of the lines.
+    """
+    extract = functools.partial(extract_trace, derive=derive, dt=dt, max_ttc=max_ttc)
+    files = traces if traces is not None else list_traces(path, output_file)
+
+    constant_columns = ConstantColumns()
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers == 1 or len(files) < 2:
+        lines = map(extract, files)
+    else:
+        pool = multiprocessing.Pool(workers)
+        lines = pool.imap(extract, files, chunksize=max(1, len(files) // (4 * workers)))
+
+    try:
+        with open(output_file, mode='a+', newline='', buffering=1 << 20) as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(write_headers(derive))
+            chunk = []
+            for line in lines:
+                constant_columns.update(line)
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    csvwriter.writerows(chunk)
+                    chunk = []
+            csvwriter.writerows(chunk)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return constant_columns
 
 def main():
 
@@ -50,68 +198,68 @@ def main():
         help='directory to process',
         default=None,
         type=str)
+    argparser.add_argument(
+        '--workers',
+        help='processes reading the files (default: one per core)',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--chunk_size',
+        help='lines written to the output at once (default: 1000)',
+        default=1000,
+        type=int)
+    argparser.add_argument(
+        '--derive',
+        help=f'derived features replacing the locations, as modify_features_list.py does (choices: {" ".join(FEATURES)})',
+        nargs='*',
+        choices=FEATURES,
+        default=None)
+    argparser.add_argument(
+        '--dt',
+        help=f'time between two time steps for the derived features, in seconds (default: {DT})',
+        default=DT,
+        type=float)
+    argparser.add_argument(
+        '--max_ttc',
+        help=f'time to collision when the vehicles are not getting closer (default: {MAX_TTC})',
+        default=MAX_TTC,
+        type=float)
+    argparser.add_argument(
+        '--index',
+        action='store_true',
+        help=f'read the files, labels and event frames from the {FeatureStore.FILE_NAME} of the directory instead of the file names')
+    argparser.add_argument(
+        '--label',
+        help='with --index, only the files of this label',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--min_score',
+        help='with --index, only the files with at least this score',
+        default=None,
+        type=float)
+    argparser.add_argument(
+        '--max_score',
+        help='with --index, only the files with at most this score',
+        default=None,
+        type=float)
     args = argparser.parse_args()
+    if args.derive is not None and len(args.derive) == 0:
+        args.derive = FEATURES
 
-    header_line = write_headers()
-    write_to_file(header_line, os.path.join(os.path.dirname(args.path),"features_list.csv"))
-    
-    
-    illegal_files = []
-    for dirName, subdirList, fileList in os.walk(args.path):
-        for fileName in fileList:
-            file_feature_vector = []
-            filename_components = str(fileName).split("_",4)
-            label = filename_components[2].split("label")[1]
-            frame = filename_components[4].split("frame")[1].split(".")[0]
-            #print(f"File {str(fileName)} has label of {label} and event of interest is at frame {frame}")
-            row_of_interest = 0
-            index = 0
-            fields = []
-            rows = []
-            with open(os.path.join(dirName,fileName), mode='r') as csv_file:
-                csv_reader = csv.reader(csv_file)
-                fields = next(csv_reader)
-                line_count = 0
-                for row in csv_reader:
-                    rows.append(row)
-                    if(row[0]==frame):
-                        row_of_interest = line_count
-                    line_count+=1
-                if(row_of_interest >= 100): index = row_of_interest-100
-                elif((row_of_interest < 100 and row_of_interest >= 0) or frame == "100"): index = 0
-                else: 
-                    index = 'illegal'
-                    illegal_files.append((fileName, row_of_interest))
-                if(index != 'illegal'):
-                    line = record_five_minutes(index,rows,label)
-                    write_to_file(line, os.path.join(os.path.dirname(args.path),"features_list.csv"))
-    print(f"Done writing, there are {len(illegal_files)} illegal files")
-    if(len(illegal_files) > 0):
-        for file in illegal_files:
-            print(file)
-
-    #now see which columns have all the same numbers
     features_file = os.path.join(os.path.dirname(args.path),"features_list.csv")
-    with open(features_file,mode='r') as feature_csv_file:
-        csv_reader = csv.reader(feature_csv_file)
-        first_row = next(csv_reader)
-        all_rows_the_same = []
-        for i in range(0,len(first_row)): all_rows_the_same.append(True)
-        for row in csv_reader:
-            for i in range(0,len(all_rows_the_same)):
-                if(all_rows_the_same[i] == True):
-                    if(row[i] != first_row[i]):
-                        all_rows_the_same[i] = False
-
-    print(f"Columns with the same numbers (other than time) are: ")
-    num_features = 12
-    for i in range(0,len(all_rows_the_same)):
-        if all_rows_the_same[i] and i%(num_features+1) != 0:
-            print(i)
-            
-      
+    traces = list_traces(args.path, features_file, args.index, args.label, args.min_score, args.max_score)
+    constant_columns = convert(args.path, features_file, args.workers, args.chunk_size, args.derive, args.dt, args.max_ttc,
+                               traces)
+    print("Done writing")
 
+    #columns that have the same number in every line, computed while writing
+    print("Columns with the same numbers (other than time) are: ")
+    num_features = len(step_headers(args.derive))
+    for i in constant_columns.columns():
+        if i%(num_features+1) != 0:
+            print(i)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
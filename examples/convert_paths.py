@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Converts the CSV adversary path files of a directory to the binary path format of
+agents.tools.path_file, either one .path file per CSV file or a single pack of all of
+them, in the order of their path ids.
+
+    python convert_paths.py --path c:\\data\\Test --out c:\\data\\TestBinary
+    python convert_paths.py --path c:\\data\\Test --pack c:\\data\\Test.paths
+
+The scenario scripts read both formats, e.g. Execute_scenario.py --file c:\\data\\TestBinary\\<name>.path
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+
+from agents.tools.path_catalog import PathCatalog
+from agents.tools.path_file import read_path_csv, write_pack, write_path, PathPack
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--path',
+        help='directory of the CSV path files',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--pattern',
+        help='regular expression the names of the path files have to match (default: .csv)',
+        default=r'\.csv$',
+        type=str)
+    argparser.add_argument(
+        '--out',
+        help='directory to write one .path file per path file to',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--pack',
+        help='file to write all the paths to, as a pack',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--workers',
+        help='processes parsing the files (default: one per core)',
+        default=None,
+        type=int)
+    args = argparser.parse_args()
+    if args.out is None and args.pack is None:
+        argparser.error('--out or --pack is needed')
+
+    catalog = PathCatalog(args.path, pattern=args.pattern)
+    files = catalog.paths()
+    workers = args.workers or os.cpu_count() or 1
+    if workers == 1 or len(files) < 2:
+        paths = [read_path_csv(f) for f in files]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            paths = pool.map(read_path_csv, files, chunksize=max(1, len(files) // (4 * workers)))
+
+    if args.out is not None:
+        os.makedirs(args.out, exist_ok=True)
+        for entry, records in zip(catalog, paths):
+            write_path(os.path.join(args.out, os.path.splitext(entry.name)[0] + '.path'), records)
+        print(f"{len(paths)} path files written to {args.out}")
+    if args.pack is not None:
+        write_pack(args.pack, [(entry.name, records) for entry, records in zip(catalog, paths)])
+        pack = PathPack(args.pack)
+        print(f"{len(pack)} paths, {int(np.sum(pack.lengths()))} points written to {args.pack}")
+
+
+if __name__ == '__main__':
+    main()
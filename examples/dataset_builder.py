@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Out of core version of train_test_file_generation.py.
+
+The labelled CSV files under a directory (e.g. the features_list.csv files of
+convert_features.py) are read twice, line by line, so the memory only depends on the
+number of requested samples:
+
+    1) the lines of every label are counted, by a pool of processes, to check that the
+       requested numbers of zeros and ones are available
+    2) a reservoir per label keeps a uniform sample of the requested size while the
+       lines are streamed, then the sample is shuffled and split in train and test
+
+The train and test sets are written as shards of NumPy .npz files, one array per column,
+with a manifest.json describing them. The same seed gives the same sets.
+
+    python dataset_builder.py --path c:\\data\\features --num_samples 1000 --seed 0
+"""
+
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy as np
+
+
+# ==============================================================================
+# -- Scan ----------------------------------------------------------------------
+# ==============================================================================
+
+def list_data_files(path, exclude=None):
+    """CSV files under 'path', in a stable order, skipping the directory 'exclude'"""
+    data_files = []
+    for dirName, subdirList, fileList in os.walk(path):
+        if exclude is not None and os.path.commonpath([os.path.abspath(dirName), os.path.abspath(exclude)]) == \
+                os.path.abspath(exclude):
+            continue
+        for fileName in sorted(fileList):
+            if ".csv" in fileName:
+                data_files.append(os.path.join(dirName, fileName))
+        subdirList.sort()
+    return data_files
+
+
+def count_labels(file_path, label_column='label'):
+    """Returns the header of a file and the number of lines of every label"""
+    counts = {}
+    with open(file_path, mode='r', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        header = next(csv_reader)
+        index = header.index(label_column)
+        for row in csv_reader:
+            if row:
+                label = int(float(row[index]))
+                counts[label] = counts.get(label, 0) + 1
+    return header, counts
+
+
+# ==============================================================================
+# -- Sampling ------------------------------------------------------------------
+# ==============================================================================
+
+class Reservoir(object):
+    """Uniform sample without replacement of 'size' items of a stream (algorithm R)"""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self._rng = rng
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            k = self._rng.randrange(self.seen)
+            if k < self.size:
+                self.items[k] = item
+
+
+def sample_lines(data_files, sizes, seed, label_column='label'):
+    """
+    Streams the lines of the files and returns, for every label of 'sizes', a uniform
+    sample of sizes[label] lines as CSV rows
+    """
+    rng = random.Random(seed)
+    reservoirs = {label: Reservoir(size, rng) for label, size in sizes.items()}
+    for file_path in data_files:
+        with open(file_path, mode='r', newline='') as csv_file:
+            csv_reader = csv.reader(csv_file)
+            index = next(csv_reader).index(label_column)
+            for row in csv_reader:
+                if not row:
+                    continue
+                reservoir = reservoirs.get(int(float(row[index])))
+                if reservoir is not None:
+                    reservoir.add(row)
+    return {label: reservoir.items for label, reservoir in reservoirs.items()}
+
+
+# ==============================================================================
+# -- Shards --------------------------------------------------------------------
+# ==============================================================================
+
+def column_array(values):
+    """Array of a column: integers if every value is one, else floats, else strings"""
+    try:
+        return np.array([int(v) for v in values], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array([float(v) for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=np.str_)
+
+
+def write_shards(rows, header, directory, name, shard_size, compress=False):
+    """Writes the rows in .npz shards of at most 'shard_size' rows, returns their file names"""
+    save = np.savez_compressed if compress else np.savez
+    shards = []
+    for start in range(0, len(rows), shard_size):
+        chunk = rows[start:start + shard_size]
+        columns = {h: column_array([row[i] for row in chunk]) for i, h in enumerate(header)}
+        file_name = '{}-{:05d}.npz'.format(name, len(shards))
+        with open(os.path.join(directory, file_name), 'wb') as f:
+            save(f, **columns)
+        shards.append(file_name)
+    return shards
+
+
+def remove_shards(directory):
+    """
+    Removes the shards listed in the manifest.json of a previous run in 'directory', the
+    other files are left alone
+    """
+    manifest_file = os.path.join(directory, 'manifest.json')
+    if not os.path.isfile(manifest_file):
+        return
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    for set_info in manifest['sets'].values():
+        for file_name in set_info['shards']:
+            shard = os.path.join(directory, os.path.basename(file_name))
+            if os.path.isfile(shard):
+                os.remove(shard)
+
+
+def read_shards(directory, name):
+    """
+    Reads the shards of a set ('train' or 'test') written by this script, returns a
+    pandas DataFrame with the columns in their original order
+    """
+    import pandas as pd
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    frames = []
+    for file_name in manifest['sets'][name]['shards']:
+        with np.load(os.path.join(directory, file_name)) as shard:
+            frames.append(pd.DataFrame({h: shard[h] for h in manifest['columns']}))
+    if not frames:
+        return pd.DataFrame(columns=manifest['columns'])
+    return pd.concat(frames, ignore_index=True)
+
+
+# ==============================================================================
+# -- main() --------------------------------------------------------------------
+# ==============================================================================
+
+def main():
+
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--path',
+        help='directory to process',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--num_samples',
+        help='number of samples',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--zero_one_percentage',
+        help='percentage of 0s to 1s: default is .5',
+        default=.5,
+        type=float)
+    argparser.add_argument(
+        '--train_test_split',
+        help='percentage of data to train (1-percentage used to test)',
+        default=.67,
+        type=float)
+    argparser.add_argument(
+        '--seed',
+        help='seed of the sampling and of the split (default: 0)',
+        default=0,
+        type=int)
+    argparser.add_argument(
+        '--out',
+        help='directory of the shards (default: <path>/dataset)',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--shard_size',
+        help='rows per shard (default: 100000)',
+        default=100000,
+        type=int)
+    argparser.add_argument(
+        '--compress',
+        action='store_true',
+        help='compress the shards (default: False)')
+    argparser.add_argument(
+        '--workers',
+        help='processes counting the labels (default: one per core)',
+        default=None,
+        type=int)
+    args = argparser.parse_args()
+
+    out = args.out if args.out is not None else os.path.join(args.path, 'dataset')
+    number_of_samples = args.num_samples
+    num_zeros = math.ceil(args.num_samples*args.zero_one_percentage)
+    num_ones = number_of_samples - num_zeros
+
+    data_files = list_data_files(args.path, exclude=out)
+    print(f"{len(data_files)} data files found in {args.path}")
+    if not data_files:
+        return 1
+
+    # 1) count the lines of every label
+    workers = args.workers or os.cpu_count() or 1
+    if workers == 1 or len(data_files) < 2:
+        scans = [count_labels(f) for f in data_files]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            scans = pool.map(count_labels, data_files)
+    header = scans[0][0]
+    for file_path, (file_header, _) in zip(data_files, scans):
+        if file_header != header:
+            print(f"**Not possible: the columns of {file_path} differ from the ones of {data_files[0]}")
+            return 1
+    counts = {}
+    for _, file_counts in scans:
+        for label, count in file_counts.items():
+            counts[label] = counts.get(label, 0) + count
+    total = sum(counts.values())
+    print(f"Total Samples:\t{total}\n\tZeros:\t{counts.get(0, 0)}\n\tOnes:\t{counts.get(1, 0)}")
+
+    if(number_of_samples > total):
+        print(f"**Not possible: You requested {number_of_samples} total samples and there are only {total}")
+        return 1
+    if(num_zeros > counts.get(0, 0)):
+        print(f"**Not possible: You requested {num_zeros} ZEROS and there are only {counts.get(0, 0)}")
+        return 1
+    if(num_ones > counts.get(1, 0)):
+        print(f"**Not possible: You requested {num_ones} ONES and there are only {counts.get(1, 0)}")
+        return 1
+
+    # 2) sample the lines of every label, shuffle and split
+    samples = sample_lines(data_files, {0: num_zeros, 1: num_ones}, args.seed)
+    rows = samples[0] + samples[1]
+    random.Random(args.seed + 1).shuffle(rows)
+    test_size = math.ceil(len(rows) * (1 - args.train_test_split))
+    sets = {'train': rows[:len(rows) - test_size], 'test': rows[len(rows) - test_size:]}
+
+    os.makedirs(out, exist_ok=True)
+    remove_shards(out)
+    label_index = header.index('label')
+    manifest = {'columns': header, 'seed': args.seed, 'source': os.path.abspath(args.path),
+                'files': len(data_files), 'sets': {}}
+    for name, set_rows in sets.items():
+        zeros = sum(1 for row in set_rows if int(float(row[label_index])) == 0)
+        manifest['sets'][name] = {'rows': len(set_rows), 'zeros': zeros, 'ones': len(set_rows) - zeros,
+                                  'shards': write_shards(set_rows, header, out, name, args.shard_size, args.compress)}
+        print(f"{name} size:\t{len(set_rows)}, Zeros: {zeros}, Ones: {len(set_rows) - zeros}")
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Shards written to {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
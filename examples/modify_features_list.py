@@ -2,15 +2,72 @@
 
 # Author:           Matthew Litton
 # Last Modified:    8/15/2022
-# Purpose:          
+# Purpose:
 
 import argparse
-from email import header
-import os
-import math
+import numpy as np
 import pandas as pd
-from collections import Counter
 
+#features derived from the positions and speeds of the ego and the adversary, at every time step
+FEATURES = ['distance', 'relative_speed', 'closing_rate', 'ttc']
+#time between two time steps of features_list.csv: 10 frames of 0.05 s
+DT = 0.5
+#time to collision used when the vehicles aren't getting closer
+MAX_TTC = 100.0
+
+def derive_features(ego_x, ego_y, ego_speed, adv_x, adv_y, adv_speed, features=FEATURES, dt=DT, max_ttc=MAX_TTC):
+    """
+    Computes the derived features of every time step with whole array operations.
+    The inputs are (N, T) arrays, one row per sample and one column per time step.
+
+        :param features: names of the features to compute, from FEATURES
+        :param dt: time between two time steps, in seconds
+        :param max_ttc: time to collision when the distance isn't decreasing
+        :return: dict with a (N, T) array per feature, in the order of 'features'
+    """
+    dx = np.asarray(ego_x, dtype=np.float64) - adv_x
+    dy = np.asarray(ego_y, dtype=np.float64) - adv_y
+    distance = np.atleast_2d(np.sqrt(dx**2 + dy**2))
+    #rate at which the distance decreases, the first time step gets the rate of the second one
+    closing_rate = np.zeros_like(distance)
+    if distance.shape[1] > 1:
+        closing_rate[:, 1:] = -np.diff(distance, axis=1) / dt
+        closing_rate[:, 0] = closing_rate[:, 1]
+    ttc = np.full_like(distance, max_ttc)
+    closing = closing_rate > 0
+    ttc[closing] = np.minimum(distance[closing] / closing_rate[closing], max_ttc)
+    relative_speed = np.atleast_2d(np.asarray(ego_speed, dtype=np.float64) - adv_speed)
+
+    derived = {'distance': distance, 'relative_speed': relative_speed, 'closing_rate': closing_rate, 'ttc': ttc}
+    return {name: derived[name] for name in features}
+
+def modify_features(df, features=FEATURES, dt=DT, max_ttc=MAX_TTC):
+    """
+    Replaces the location columns of a features_list DataFrame with the derived features:
+    the derived features of time step N take the place of ego_loc_x_N ... adv_loc_y_N, right
+    after time_N. Returns the new DataFrame.
+    """
+    headers = df.columns
+    #figure out which columns you want to calculate from
+    position_columns = [h for h in headers if "_loc_" in h]
+    steps = [h.split("_",3)[3] for h in headers if h.startswith("ego_loc_y_")]
+
+    def block(prefix):
+        return df[[prefix + number for number in steps]].to_numpy(dtype=np.float64)
+
+    derived = derive_features(block("ego_loc_x_"), block("ego_loc_y_"), block("ego_velocity_"),
+                              block("adv_loc_x_"), block("adv_loc_y_"), block("adv_velocity_"),
+                              features, dt, max_ttc)
+
+    columns = {}
+    for h in headers:
+        if h.startswith("ego_loc_y_"):
+            k = steps.index(h.split("_",3)[3])
+            for name in features:
+                columns[f"{name}_{steps[k]}"] = derived[name][:, k]
+        elif h not in position_columns:
+            columns[h] = df[h].to_numpy()
+    return pd.DataFrame(columns, index=df.index)
 
 def main():
 
@@ -21,45 +78,34 @@ def main():
         help='file to process',
         default=None,
         type=str)
+    argparser.add_argument(
+        '--features',
+        help=f'derived features to add (default: {" ".join(FEATURES)})',
+        nargs='+',
+        choices=FEATURES,
+        default=FEATURES)
+    argparser.add_argument(
+        '--dt',
+        help=f'time between two time steps, in seconds (default: {DT})',
+        default=DT,
+        type=float)
+    argparser.add_argument(
+        '--max_ttc',
+        help=f'time to collision when the vehicles are not getting closer (default: {MAX_TTC})',
+        default=MAX_TTC,
+        type=float)
     args = argparser.parse_args()
 
     print(f"You are modifying file: {args.file}")
-    
+
     df = pd.read_csv(args.file, index_col=None, header=0)
-    headers = df.columns
+    print(f"Position columns are: {[h for h in df.columns if '_loc_' in h]}")
 
-    #figure out which columns you want to calculate from
-    position_columns = []
-    for h in headers:
-        if "_loc_" in h:
-            position_columns.append(h)
-    print(f"Position columns are: {position_columns}")
-    
-
-    #insert columns for distance
-    distance_columns = []
-    for pc in position_columns:
-        if "ego_loc_y" in pc:
-            insert_loca = df.columns.get_loc(pc)
-            number = pc.split("_",3)[3]
-            column_name = "distance_"+number
-            distance_columns.append(column_name)
-            df.insert(insert_loca+1,column_name,0.000000)
-
-    #update distance columns
-    for index_label, row_series in df.iterrows():
-        for dc in distance_columns:
-            num = dc.split("_")[1]
-            dist = math.sqrt((row_series[str('ego_loc_x_'+num)]-row_series[str('adv_loc_x_'+num)])**2 + (row_series[str('ego_loc_y_'+num)]-row_series[str('adv_loc_y_'+num)])**2)
-            df.at[index_label , str('distance_'+num)] = dist
-
-
-    #drop the location columns
-    df.drop(position_columns,axis=1, inplace=True)
+    df = modify_features(df, args.features, args.dt, args.max_ttc)
     df.to_csv(args.file.split(".")[0]+"_mod.csv",index=False)
 
-    
+
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Queries the recordings of the simulator recorder, e.g. the ones of Execute_scenario.py
+--recorder, for their collisions and blocked actors, and writes them as two tables with
+one row per collision and per blocked actor of every recording.
+
+    python Execute_scenario.py --file <path file> --recorder c:\\data\\recorder --no_features
+    python recorder_tables.py --path c:\\data\\recorder --out c:\\data\\recorder_tables
+
+writes c:\\data\\recorder_tables_collisions.csv and c:\\data\\recorder_tables_blocked.csv.
+The recordings are read by the simulator, so they have to be on the machine of the server.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+
+import carla
+
+from agents.tools.recorder_query import (BlockedActor, Collision, query_blocked, query_collisions,
+                                         write_table)
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--host',
+        metavar='H',
+        default='127.0.0.1',
+        help='IP of the host server (default: 127.0.0.1)')
+    argparser.add_argument(
+        '-p', '--port',
+        metavar='P',
+        default=2000,
+        type=int,
+        help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--path',
+        help='recording, or directory of the .log recordings',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--out',
+        help='prefix of the two tables (default: recorder_tables)',
+        default='recorder_tables',
+        type=str)
+    argparser.add_argument(
+        '-t', '--types',
+        metavar='T',
+        default="aa",
+        help='pair of types of the collisions (a=any, h=hero, v=vehicle, w=walkers, t=trafficLight, o=others)')
+    argparser.add_argument(
+        '--min_time',
+        help='minimum time an actor has to be stopped to be blocked, in seconds (default: 60)',
+        default=60.0,
+        type=float)
+    argparser.add_argument(
+        '--min_distance',
+        help='distance an actor has to move to not be blocked, in centimeters (default: 100)',
+        default=100.0,
+        type=float)
+    args = argparser.parse_args()
+    if args.path is None:
+        argparser.error('--path is needed')
+
+    if os.path.isdir(args.path):
+        files = sorted(glob.glob(os.path.join(args.path, '*.log')))
+    else:
+        files = [args.path]
+
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(60.0)
+
+    collisions, blocked = [], []
+    for f in files:
+        name = os.path.abspath(f)
+        _, rows = query_collisions(client, name, args.types[0], args.types[1])
+        collisions.extend((os.path.basename(f),) + row for row in rows)
+        _, rows = query_blocked(client, name, args.min_time, args.min_distance)
+        blocked.extend((os.path.basename(f),) + row for row in rows)
+
+    write_table(args.out + '_collisions.csv', collisions, ('file',) + Collision._fields)
+    write_table(args.out + '_blocked.csv', blocked, ('file',) + BlockedActor._fields)
+    print(f"{len(files)} recordings: {len(collisions)} collisions, {len(blocked)} blocked actors")
+
+
+if __name__ == '__main__':
+    main()
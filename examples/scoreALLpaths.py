@@ -9,8 +9,22 @@
 # ==============================================================================
 import subprocess
 import os
+import sys
 import argparse
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+
+from agents.tools.path_catalog import PathCatalog
+
+def prescreen(args, entries):
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/Cross_Entropy')
+    from agents.navigation.road_graph import RoadGraph
+    from surrogate import prescreen_path_files
+
+    kept = prescreen_path_files(entries, RoadGraph.load(args.road_graph), args.ego_start, args.ego_end, args.prescreen)
+    print(f"{len(kept)} of {len(entries)} path files kept by the surrogate (robustness < {args.prescreen})")
+    return kept
+
 def main():
 
     argparser = argparse.ArgumentParser()
@@ -30,41 +44,85 @@ def main():
         default=2000,
         type=int,
         help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--seed',
+        help='seed of every scenario run, written after each score (default: a random seed per run, not written)',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--start',
+        help='index of the first path file to run, in the order of the path ids (default: 0)',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--stop',
+        help='index after the last path file to run (default: all of them)',
+        default=None,
+        type=int)
+    argparser.add_argument(
+        '--prescreen',
+        help='only run the path files whose robustness in the surrogate of Cross_Entropy/surrogate.py is below this (default: run all)',
+        default=None,
+        type=float)
+    argparser.add_argument(
+        '--road_graph',
+        help='with --prescreen, directory of the saved RoadGraph of the map',
+        default=None,
+        type=str)
+    argparser.add_argument(
+        '--ego_start',
+        nargs=2,
+        type=float,
+        help='with --prescreen, x y of the ego spawn point used by the surrogate')
+    argparser.add_argument(
+        '--ego_end',
+        nargs=2,
+        type=float,
+        help='with --prescreen, x y of the ego destination used by the surrogate')
 
 
     args = argparser.parse_args()
+    if args.prescreen is not None and (args.road_graph is None or args.ego_start is None or args.ego_end is None):
+        argparser.error('--prescreen needs --road_graph, --ego_start and --ego_end')
     
     path = args.path
+    #without --seed, every run draws its own seed and the score lines keep the name:score format
+    seed_option = " --seed " + str(args.seed) if args.seed is not None else ""
+    seed_suffix = ":" + str(args.seed) if args.seed is not None else ""
     
     try:
-        for dirName, subdirList, fileList in os.walk(path):
-            fileList.sort(key=lambda f: int(''.join(filter(str.isdigit, f))))
-            for fileName in fileList:
-                call_string2 = "C:/Users/m.litton_local/anaconda3/envs/carla_windows/python.exe c:/Users/m.litton_local/CARLA_Java/examples/Execute_scenario.py --port " + str(args.port) + " --file " + path + fileName + " --no_render"
-                call_string3 = "C:/Users/m.litton_local/anaconda3/envs/carla_windows/python.exe c:/Users/m.litton_local/CARLA_Java/examples/Execute_scenario.py --port " + str(args.port) + " --file " + path + fileName
-                #call_string = "/home/littonml1/anaconda3/envs/carla/bin/python -W ignore /home/littonml1/CARLA_Java/examples/graphPart_5_24_22.py --sync --loop --port " + str(args.port) + " --file /home/littonml1/python_proj/Adversary1/" + fileName + " --no_render"
-                #get return value of subprocess call
-                result=subprocess.Popen(call_string2, shell = True, stdout=subprocess.PIPE).communicate()[0].decode('ascii').strip()       
-                #append it to a file
-                if('INFO' in result):
-                    result = result.split('INFO')[0].strip()
-                '''
-                if(not result): 
-                    print("nothing")
-                    break
-                else: 
-                    f = open(args.scores,"a")
-                    f.write(write_string)
-                    f.close()
-                '''
-                if(not result):
-                    write_string = fileName.split("_")[2]+":8888.888888"+"\n"
-                else:
-                    write_string = fileName.split("_")[2]+":"+result+"\n"
-                #print(write_string.strip())
+        #path files sorted by the id after '#', listed from the cached manifest of the directory
+        entries = PathCatalog(path)[args.start:args.stop]
+        if args.prescreen is not None:
+            #the path files the surrogate finds harmless are left out of the simulator runs and of the scores
+            entries = prescreen(args, entries)
+        for entry in entries:
+            fileName = entry.name
+            call_string2 = "C:/Users/m.litton_local/anaconda3/envs/carla_windows/python.exe c:/Users/m.litton_local/CARLA_Java/examples/Execute_scenario.py --port " + str(args.port) + " --file " + entry.path + " --no_render" + seed_option
+            call_string3 = "C:/Users/m.litton_local/anaconda3/envs/carla_windows/python.exe c:/Users/m.litton_local/CARLA_Java/examples/Execute_scenario.py --port " + str(args.port) + " --file " + entry.path
+            #call_string = "/home/littonml1/anaconda3/envs/carla/bin/python -W ignore /home/littonml1/CARLA_Java/examples/graphPart_5_24_22.py --sync --loop --port " + str(args.port) + " --file /home/littonml1/python_proj/Adversary1/" + fileName + " --no_render"
+            #get return value of subprocess call
+            result=subprocess.Popen(call_string2, shell = True, stdout=subprocess.PIPE).communicate()[0].decode('ascii').strip()       
+            #append it to a file
+            if('INFO' in result):
+                result = result.split('INFO')[0].strip()
+            '''
+            if(not result): 
+                print("nothing")
+                break
+            else: 
                 f = open(args.scores,"a")
                 f.write(write_string)
                 f.close()
+            '''
+            if(not result):
+                write_string = fileName.split("_")[2]+":8888.888888"+seed_suffix+"\n"
+            else:
+                write_string = fileName.split("_")[2]+":"+result+seed_suffix+"\n"
+            #print(write_string.strip())
+            f = open(args.scores,"a")
+            f.write(write_string)
+            f.close()
           
 
     except KeyboardInterrupt:
@@ -10,23 +10,24 @@
 from re import sub
 import subprocess
 import os
+import sys
 import argparse
 import shutil
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+
+from agents.tools.path_catalog import PathCatalog
+
 def move_files(args):
-    files = [os.path.join(args.path, f) for f in os.listdir(args.path)]
-    N=len(files) / args.num_servers
-    i=0
-    curr_subdir = None
-    files.sort(key=lambda f: int(''.join(filter(str.isdigit, f))))
-    for f in files:
-        if i%N == 0:
-                subdir_name = os.path.join(args.path, f'{int(i // N + 1)}')
-                os.mkdir(subdir_name)
-                curr_subdir = subdir_name
-        f_base = os.path.basename(f)
-        shutil.move(f,os.path.join(subdir_name,f_base))
-        i +=1
+    #contiguous ranges of path ids, one subdirectory per server
+    catalog = PathCatalog(args.path, recursive=False)
+    for i, part in enumerate(catalog.split(args.num_servers)):
+        if not part:
+            continue
+        subdir_name = os.path.join(args.path, f'{i + 1}')
+        os.mkdir(subdir_name)
+        for entry in part:
+            shutil.move(entry.path,os.path.join(subdir_name,entry.name))
 
 def main():
 
@@ -91,7 +92,7 @@ def main():
         scores_list = []
         for dir in os.listdir(args.path):
             d = os.path.join(args.path,dir)
-            if os.path.isfile(d):
+            if os.path.isfile(d) and dir != PathCatalog.MANIFEST:
                 scores_list.append(d)
         
         with open(args.scores,"w") as combined_file:
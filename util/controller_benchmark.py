@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmark of the client side PID controllers of the agents.
+
+The controllers drive simple kinematic vehicles, so that no simulator is needed and
+only the cost of the controllers is measured. For every fleet size, the script reports
+how many ticks per second can be computed when every vehicle is controlled each tick.
+
+    python controller_benchmark.py --vehicles 1 500 --ticks 200
+"""
+
+import argparse
+import glob
+import math
+import os
+import sys
+import time
+
+try:
+    sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
+        sys.version_info.major,
+        sys.version_info.minor,
+        'win-amd64' if os.name == 'nt' else 'linux-x86_64'))[0])
+except IndexError:
+    pass
+
+try:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+except IndexError:
+    pass
+
+import carla
+
+from agents.navigation.controller import VehiclePIDController
+from agents.navigation.simple_agent import SimpleAgent
+
+
+class BenchmarkWorld(object):
+    """The controllers only keep a reference to the world, no map is needed"""
+
+    def get_map(self):
+        return None
+
+
+class BenchmarkVehicle(object):
+    """Kinematic stand-in of a carla.Vehicle, with the methods used by the controllers"""
+
+    def __init__(self, x, y, yaw, dt=0.05, wheelbase=2.9, max_accel=4.0, max_steer_angle=70.0):
+        self._world = BenchmarkWorld()
+        self._transform = carla.Transform(carla.Location(x=x, y=y), carla.Rotation(yaw=yaw))
+        self._speed = 0.0
+        self._control = carla.VehicleControl()
+        self._dt = dt
+        self._wheelbase = wheelbase
+        self._max_accel = max_accel
+        self._max_steer_angle = max_steer_angle
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        return self._transform
+
+    def get_location(self):
+        return self._transform.location
+
+    def get_velocity(self):
+        yaw = math.radians(self._transform.rotation.yaw)
+        return carla.Vector3D(self._speed * math.cos(yaw), self._speed * math.sin(yaw), 0.0)
+
+    def get_control(self):
+        return self._control
+
+    def apply_control(self, control):
+        self._control = control
+
+    def tick(self):
+        control = self._control
+        accel = self._max_accel * (control.throttle - control.brake)
+        self._speed = max(0.0, self._speed + accel * self._dt)
+        steer_angle = math.radians(control.steer * self._max_steer_angle)
+        rotation = self._transform.rotation
+        yaw = math.radians(rotation.yaw)
+        location = self._transform.location
+        location.x += self._speed * math.cos(yaw) * self._dt
+        location.y += self._speed * math.sin(yaw) * self._dt
+        rotation.yaw = math.degrees(yaw + self._speed / self._wheelbase * math.tan(steer_angle) * self._dt)
+        self._transform = carla.Transform(location, rotation)
+
+
+class BenchmarkWaypoint(object):
+    """Minimal carla.Waypoint stand-in, the lateral controller only reads its transform"""
+
+    def __init__(self, x, y):
+        self.transform = carla.Transform(carla.Location(x=x, y=y), carla.Rotation())
+
+
+def benchmark_pid_controllers(num_vehicles, ticks, dt):
+    vehicles = [BenchmarkVehicle(0.0, 10.0 * i, 0.0, dt) for i in range(num_vehicles)]
+    args_lateral = {'K_P': 1.95, 'K_I': 0.05, 'K_D': 0.2, 'dt': dt}
+    args_longitudinal = {'K_P': 1.0, 'K_I': 0.05, 'K_D': 0, 'dt': dt}
+    controllers = [VehiclePIDController(v, args_lateral, args_longitudinal) for v in vehicles]
+    targets = [BenchmarkWaypoint(50.0, 10.0 * i + 3.0) for i in range(num_vehicles)]
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for vehicle, controller, target in zip(vehicles, controllers, targets):
+            vehicle.apply_control(controller.run_step(30.0, target))
+            vehicle.tick()
+    return ticks / (time.perf_counter() - start)
+
+
+def benchmark_simple_agents(num_vehicles, ticks, dt):
+    vehicles = [BenchmarkVehicle(0.0, 10.0 * i, 0.0, dt) for i in range(num_vehicles)]
+    agents = [SimpleAgent(v, carla.Location(x=50.0, y=10.0 * i + 3.0), target_speed=30.0)
+              for i, v in enumerate(vehicles)]
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for vehicle, agent in zip(vehicles, agents):
+            vehicle.apply_control(agent.run_step())
+            vehicle.tick()
+    return ticks / (time.perf_counter() - start)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        '--vehicles',
+        type=int,
+        nargs='+',
+        default=[1, 500],
+        help='fleet sizes to benchmark (default: 1 500)')
+    argparser.add_argument(
+        '--ticks',
+        type=int,
+        default=200,
+        help='number of ticks of every run (default: 200)')
+    argparser.add_argument(
+        '--dt',
+        type=float,
+        default=0.05,
+        help='time step of the controllers and the vehicles (default: 0.05)')
+    args = argparser.parse_args()
+
+    print('{:<24}{:>10}{:>14}{:>18}'.format('controller', 'vehicles', 'ticks/s', 'vehicle steps/s'))
+    for name, benchmark in (('VehiclePIDController', benchmark_pid_controllers),
+                            ('SimpleAgent', benchmark_simple_agents)):
+        for num_vehicles in args.vehicles:
+            ticks_per_second = benchmark(num_vehicles, args.ticks, args.dt)
+            print('{:<24}{:>10}{:>14.1f}{:>18.1f}'.format(
+                name, num_vehicles, ticks_per_second, ticks_per_second * num_vehicles))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Offline stand-in for the carla module, for benchmarks and checks on machines without a
+CARLA server. It implements, in pure Python, the part of the carla API used by the agents,
+the scenarios and the monitors of this repository: the geometry types, a synthetic Map with
+a grid of junctions, a World whose vehicles follow a kinematic bicycle model, traffic lights,
+obstacle and collision sensors, snapshots and a Client.
+
+Put its directory first in the path to use it instead of the real module:
+
+    PYTHONPATH=util/fake_carla:carla:. python Cross_Entropy/ce_CARLA.py --no_render
+
+util/pipeline_benchmark.py puts it in the path by itself.
+
+Rendering, physics and the traffic manager are not simulated.
+"""
+
+from ._geometry import *
+from ._road import *
+from ._world import *
+from . import command
@@ -0,0 +1,246 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Geometry types of the offline carla module. """
+
+import math
+
+
+class Vector3D(object):
+    """3D vector, same semantics as carla.Vector3D"""
+
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        if isinstance(x, Vector3D):
+            x, y, z = x.x, x.y, x.z
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def _new(self, x, y, z):
+        return type(self)(x, y, z)
+
+    def __add__(self, other):
+        return self._new(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return self._new(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __mul__(self, value):
+        return self._new(self.x * value, self.y * value, self.z * value)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, value):
+        return self._new(self.x / value, self.y / value, self.z / value)
+
+    def __neg__(self):
+        return self._new(-self.x, -self.y, -self.z)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector3D) and \
+            self.x == other.x and self.y == other.y and self.z == other.z
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}(x={:.6f}, y={:.6f}, z={:.6f})'.format(type(self).__name__, self.x, self.y, self.z)
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def squared_length(self):
+        return self.x * self.x + self.y * self.y + self.z * self.z
+
+    def make_unit_vector(self):
+        norm = self.length()
+        if norm == 0.0:
+            return Vector3D()
+        return Vector3D(self.x / norm, self.y / norm, self.z / norm)
+
+    def dot(self, other):
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def dot_2d(self, other):
+        return self.x * other.x + self.y * other.y
+
+    def cross(self, other):
+        return Vector3D(self.y * other.z - self.z * other.y,
+                        self.z * other.x - self.x * other.z,
+                        self.x * other.y - self.y * other.x)
+
+    def distance(self, other):
+        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2)
+
+    def distance_2d(self, other):
+        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2)
+
+    def distance_squared(self, other):
+        return (self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2
+
+
+class Location(Vector3D):
+    """Location in the world, same semantics as carla.Location"""
+
+    __slots__ = ()
+
+
+class Vector2D(object):
+    """2D vector, same semantics as carla.Vector2D"""
+
+    def __init__(self, x=0.0, y=0.0):
+        self.x = float(x)
+        self.y = float(y)
+
+    def length(self):
+        return math.hypot(self.x, self.y)
+
+    def __repr__(self):
+        return 'Vector2D(x={:.6f}, y={:.6f})'.format(self.x, self.y)
+
+
+class Rotation(object):
+    """Rotation in degrees, same semantics as carla.Rotation"""
+
+    __slots__ = ('pitch', 'yaw', 'roll')
+
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def __eq__(self, other):
+        return isinstance(other, Rotation) and \
+            self.pitch == other.pitch and self.yaw == other.yaw and self.roll == other.roll
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Rotation(pitch={:.6f}, yaw={:.6f}, roll={:.6f})'.format(self.pitch, self.yaw, self.roll)
+
+    def _matrix(self):
+        cy, sy = math.cos(math.radians(self.yaw)), math.sin(math.radians(self.yaw))
+        cr, sr = math.cos(math.radians(self.roll)), math.sin(math.radians(self.roll))
+        cp, sp = math.cos(math.radians(self.pitch)), math.sin(math.radians(self.pitch))
+        return ((cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr),
+                (cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr),
+                (sp, -cp * sr, cp * cr))
+
+    def get_forward_vector(self):
+        m = self._matrix()
+        return Vector3D(m[0][0], m[1][0], m[2][0])
+
+    def get_right_vector(self):
+        m = self._matrix()
+        return Vector3D(m[0][1], m[1][1], m[2][1])
+
+    def get_up_vector(self):
+        m = self._matrix()
+        return Vector3D(m[0][2], m[1][2], m[2][2])
+
+
+class Transform(object):
+    """Location and rotation, same semantics as carla.Transform"""
+
+    __slots__ = ('location', 'rotation')
+
+    def __init__(self, location=None, rotation=None):
+        self.location = Location(location) if location is not None else Location()
+        self.rotation = Rotation(rotation.pitch, rotation.yaw, rotation.roll) if rotation is not None else Rotation()
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and \
+            self.location == other.location and self.rotation == other.rotation
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Transform({}, {})'.format(self.location, self.rotation)
+
+    def transform(self, point):
+        """Transforms a point from the local frame to the world frame"""
+        m = self.rotation._matrix()
+        x = m[0][0] * point.x + m[0][1] * point.y + m[0][2] * point.z + self.location.x
+        y = m[1][0] * point.x + m[1][1] * point.y + m[1][2] * point.z + self.location.y
+        z = m[2][0] * point.x + m[2][1] * point.y + m[2][2] * point.z + self.location.z
+        return type(point)(x, y, z)
+
+    def inverse_transform(self, point):
+        """Transforms a point from the world frame to the local frame"""
+        m = self.rotation._matrix()
+        dx, dy, dz = point.x - self.location.x, point.y - self.location.y, point.z - self.location.z
+        return type(point)(m[0][0] * dx + m[1][0] * dy + m[2][0] * dz,
+                           m[0][1] * dx + m[1][1] * dy + m[2][1] * dz,
+                           m[0][2] * dx + m[1][2] * dy + m[2][2] * dz)
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def get_right_vector(self):
+        return self.rotation.get_right_vector()
+
+    def get_up_vector(self):
+        return self.rotation.get_up_vector()
+
+
+class BoundingBox(object):
+    """Box defined by its center and half extent, same semantics as carla.BoundingBox"""
+
+    def __init__(self, location=None, extent=None):
+        self.location = Location(location) if location is not None else Location()
+        self.extent = Vector3D(extent) if extent is not None else Vector3D()
+        self.rotation = Rotation()
+
+    def __repr__(self):
+        return 'BoundingBox({}, Extent(x={:.6f}, y={:.6f}, z={:.6f}), {})'.format(
+            self.location, self.extent.x, self.extent.y, self.extent.z, self.rotation)
+
+    def _local_corners(self):
+        e = self.extent
+        return [Location(sx * e.x, sy * e.y, sz * e.z)
+                for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)]
+
+    def get_local_vertices(self):
+        box = Transform(self.location, self.rotation)
+        return [box.transform(corner) for corner in self._local_corners()]
+
+    def get_world_vertices(self, transform):
+        box = Transform(self.location, self.rotation)
+        return [transform.transform(box.transform(corner)) for corner in self._local_corners()]
+
+    def contains(self, world_point, transform):
+        local = Transform(self.location, self.rotation).inverse_transform(
+            transform.inverse_transform(Location(world_point)))
+        return abs(local.x) <= self.extent.x and abs(local.y) <= self.extent.y and abs(local.z) <= self.extent.z
+
+
+class Color(object):
+    """RGBA color"""
+
+    def __init__(self, r=0, g=0, b=0, a=255):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+    def __repr__(self):
+        return 'Color({}, {}, {}, {})'.format(self.r, self.g, self.b, self.a)
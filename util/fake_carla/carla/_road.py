@@ -0,0 +1,412 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Synthetic road network of the offline carla module. """
+
+import math
+from enum import IntEnum, IntFlag
+
+import numpy as np
+
+from ._geometry import Location, Rotation, Transform
+
+
+class LaneType(IntFlag):
+    NONE = 0x1
+    Driving = 0x1 << 1
+    Stop = 0x1 << 2
+    Shoulder = 0x1 << 3
+    Biking = 0x1 << 4
+    Sidewalk = 0x1 << 5
+    Border = 0x1 << 6
+    Restricted = 0x1 << 7
+    Parking = 0x1 << 8
+    Bidirectional = 0x1 << 9
+    Median = 0x1 << 10
+    Special1 = 0x1 << 11
+    Special2 = 0x1 << 12
+    Special3 = 0x1 << 13
+    RoadWorks = 0x1 << 14
+    Tram = 0x1 << 15
+    Rail = 0x1 << 16
+    Entry = 0x1 << 17
+    Exit = 0x1 << 18
+    OffRamp = 0x1 << 19
+    OnRamp = 0x1 << 20
+    Any = 0xFFFFFFFE
+
+
+class LaneChange(IntFlag):
+    NONE = 0
+    Right = 1
+    Left = 2
+    Both = 3
+
+
+class LaneMarkingType(IntEnum):
+    NONE = 0
+    Other = 1
+    Broken = 2
+    Solid = 3
+    SolidSolid = 4
+    SolidBroken = 5
+    BrokenSolid = 6
+    BrokenBroken = 7
+    BottsDots = 8
+    Grass = 9
+    Curb = 10
+
+
+class LaneMarkingColor(IntEnum):
+    Standard = 0
+    Blue = 1
+    Green = 2
+    Red = 3
+    White = 4
+    Yellow = 5
+    Other = 6
+
+
+class LaneMarking(object):
+    """Lane marking, same semantics as carla.LaneMarking"""
+
+    def __init__(self, marking_type=LaneMarkingType.NONE, color=LaneMarkingColor.Standard,
+                 lane_change=LaneChange.NONE, width=0.15):
+        self.type = marking_type
+        self.color = color
+        self.lane_change = lane_change
+        self.width = width
+
+
+_SOLID = LaneMarking(LaneMarkingType.Solid, LaneMarkingColor.White)
+_CENTER = LaneMarking(LaneMarkingType.Solid, LaneMarkingColor.Yellow)
+_BROKEN = LaneMarking(LaneMarkingType.Broken, LaneMarkingColor.White, LaneChange.Both)
+_NO_MARKING = LaneMarking()
+
+
+class _Lane(object):
+    """Polyline lane, driven from its first to its last point"""
+
+    def __init__(self, index, road_id, lane_id, points, is_junction=False, junction_id=-1, reverse_s=False):
+        self.index = index
+        self.road_id = road_id
+        self.section_id = 0
+        self.lane_id = lane_id
+        self.points = np.asarray(points, dtype=np.float64)
+        seg = np.diff(self.points, axis=0)
+        self.seg_length = np.hypot(seg[:, 0], seg[:, 1])
+        self.seg_yaw = np.degrees(np.arctan2(seg[:, 1], seg[:, 0]))
+        self.cum = np.concatenate(([0.0], np.cumsum(self.seg_length)))
+        self.length = float(self.cum[-1])
+        self.is_junction = is_junction
+        self.junction_id = junction_id
+        self.reverse_s = reverse_s
+        self.successors = []
+        self.predecessors = []
+        self.left = None
+        self.right = None
+        self.left_marking = _NO_MARKING
+        self.right_marking = _NO_MARKING
+        self.lane_change = LaneChange.NONE
+
+    def pose(self, t):
+        t = min(max(t, 0.0), self.length)
+        i = int(np.searchsorted(self.cum, t, side='right')) - 1
+        i = min(max(i, 0), len(self.seg_length) - 1)
+        frac = (t - self.cum[i]) / self.seg_length[i]
+        xy = self.points[i] + frac * (self.points[i + 1] - self.points[i])
+        return float(xy[0]), float(xy[1]), float(self.seg_yaw[i])
+
+
+class Waypoint(object):
+    """Point on the center of a lane, same semantics as carla.Waypoint"""
+
+    def __init__(self, lane, t, lane_width):
+        self._lane = lane
+        self._t = min(max(t, 0.0), lane.length)
+        x, y, yaw = lane.pose(self._t)
+        self.transform = Transform(Location(x, y, 0.0), Rotation(yaw=yaw))
+        self.road_id = lane.road_id
+        self.section_id = lane.section_id
+        self.lane_id = lane.lane_id
+        self.s = lane.length - self._t if lane.reverse_s else self._t
+        self.is_junction = lane.is_junction
+        self.is_intersection = lane.is_junction
+        self.junction_id = lane.junction_id
+        self.lane_width = lane_width
+        self.lane_type = LaneType.Driving
+        self.lane_change = lane.lane_change
+        self.left_lane_marking = lane.left_marking
+        self.right_lane_marking = lane.right_marking
+        self.is_rht = True
+        self.id = hash((lane.index, int(round(self._t * 100))))
+
+    def __repr__(self):
+        return 'Waypoint(road_id={}, section_id={}, lane_id={}, s={:.6f})'.format(
+            self.road_id, self.section_id, self.lane_id, self.s)
+
+    def _at(self, lane, t):
+        return Waypoint(lane, t, self.lane_width)
+
+    def next(self, distance):
+        t = self._t + distance
+        lane = self._lane
+        if t <= lane.length + 1e-6:
+            return [self._at(lane, t)]
+        remaining = t - lane.length
+        waypoints = []
+        for successor in lane.successors:
+            waypoints.extend(self._at(successor, 0.0).next(remaining))
+        return waypoints
+
+    def previous(self, distance):
+        t = self._t - distance
+        lane = self._lane
+        if t >= -1e-6:
+            return [self._at(lane, t)]
+        remaining = -t
+        waypoints = []
+        for predecessor in lane.predecessors:
+            waypoints.extend(self._at(predecessor, predecessor.length).previous(remaining))
+        return waypoints
+
+    def next_until_lane_end(self, distance):
+        waypoints = []
+        t = self._t + distance
+        while t < self._lane.length:
+            waypoints.append(self._at(self._lane, t))
+            t += distance
+        waypoints.append(self._at(self._lane, self._lane.length))
+        return waypoints
+
+    def previous_until_lane_start(self, distance):
+        waypoints = []
+        t = self._t - distance
+        while t > 0.0:
+            waypoints.append(self._at(self._lane, t))
+            t -= distance
+        waypoints.append(self._at(self._lane, 0.0))
+        return waypoints
+
+    def _neighbor(self, lane):
+        if lane is None:
+            return None
+        if (lane.lane_id < 0) == (self._lane.lane_id < 0):
+            return self._at(lane, self._t)
+        return self._at(lane, lane.length - self._t)
+
+    def get_left_lane(self):
+        return self._neighbor(self._lane.left)
+
+    def get_right_lane(self):
+        return self._neighbor(self._lane.right)
+
+    def get_landmarks(self, distance, stop_at_junction=False):
+        return []
+
+    def get_junction(self):
+        return None
+
+
+class Map(object):
+    """
+    Synthetic map: a square grid of two-way roads joined by junctions with
+    straight, left and right connectors. Lane ids and markings follow OpenDRIVE
+    conventions (right-hand traffic, negative lanes follow the road direction).
+    """
+
+    def __init__(self, name='FakeTown', xodr_content=None, grid_size=4, block_length=100.0,
+                 lanes_per_direction=2, lane_width=3.5, junction_size=10.0, speed_limit=30.0):
+        """
+        :param name: name of the map
+        :param xodr_content: accepted for compatibility with carla.Map, but ignored
+        :param grid_size: number of junctions along each side of the grid
+        :param block_length: distance between two consecutive junctions
+        :param lanes_per_direction: driving lanes in each direction of a road
+        :param lane_width: width of the lanes, in meters
+        :param junction_size: distance from the center of a junction to the start of the roads
+        :param speed_limit: speed limit of every road, in Km/h
+        """
+        self.name = name
+        self.grid_size = grid_size
+        self.block_length = block_length
+        self.lanes_per_direction = lanes_per_direction
+        self.lane_width = lane_width
+        self.junction_size = junction_size
+        self.speed_limit = speed_limit
+        self._lanes = []
+        self._lane_by_key = {}
+        self._junction_arms = {}
+        self._build_roads()
+        self._build_junctions()
+        self._build_segment_table()
+
+    # -- construction ---------------------------------------------------------
+
+    def _junction_center(self, i, j):
+        return np.array([i * self.block_length, j * self.block_length])
+
+    def _add_lane(self, road_id, lane_id, points, **kwargs):
+        lane = _Lane(len(self._lanes), road_id, lane_id, points, **kwargs)
+        self._lanes.append(lane)
+        self._lane_by_key[(road_id, lane_id)] = lane
+        return lane
+
+    def _build_roads(self):
+        n = self.lanes_per_direction
+        w = self.lane_width
+        road_id = 0
+        for i in range(self.grid_size):
+            for j in range(self.grid_size):
+                for di, dj in ((1, 0), (0, 1)):
+                    if i + di >= self.grid_size or j + dj >= self.grid_size:
+                        continue
+                    a, b = self._junction_center(i, j), self._junction_center(i + di, j + dj)
+                    d = (b - a) / np.linalg.norm(b - a)
+                    r = np.array([-d[1], d[0]])
+                    start, end = a + self.junction_size * d, b - self.junction_size * d
+                    lanes = {}
+                    for k in range(1, n + 1):
+                        offset = (k - 0.5) * w
+                        lanes[-k] = self._add_lane(road_id, -k, [start + offset * r, end + offset * r])
+                        lanes[k] = self._add_lane(road_id, k, [end - offset * r, start - offset * r], reverse_s=True)
+                    for k in range(1, n + 1):
+                        for sign in (-1, 1):
+                            lane = lanes[sign * k]
+                            lane.right = lanes.get(sign * (k + 1))
+                            lane.left = lanes.get(sign * (k - 1)) if k > 1 else lanes[-sign]
+                            lane.left_marking = _BROKEN if k > 1 else _CENTER
+                            lane.right_marking = _BROKEN if k < n else _SOLID
+                            change = LaneChange.NONE
+                            if k > 1:
+                                change |= LaneChange.Left
+                            if k < n:
+                                change |= LaneChange.Right
+                            lane.lane_change = change
+                    # Incoming and outgoing lanes of each junction
+                    self._junction_arms.setdefault((i, j), []).append(
+                        ([lanes[k] for k in range(1, n + 1)], [lanes[-k] for k in range(1, n + 1)]))
+                    self._junction_arms.setdefault((i + di, j + dj), []).append(
+                        ([lanes[-k] for k in range(1, n + 1)], [lanes[k] for k in range(1, n + 1)]))
+                    road_id += 1
+        self._num_roads = road_id
+
+    def _build_junctions(self):
+        n = self.lanes_per_direction
+        road_id = self._num_roads
+        for junction_id, (node, arms) in enumerate(sorted(self._junction_arms.items())):
+            for incoming, _ in arms:
+                for k, lane_in in enumerate(incoming, 1):
+                    options = []
+                    for _, outgoing in arms:
+                        lane_out = outgoing[k - 1]
+                        p_in, p_out = lane_in.points[-1], lane_out.points[0]
+                        d_in = lane_in.points[-1] - lane_in.points[-2]
+                        d_in = d_in / np.linalg.norm(d_in)
+                        d_out = lane_out.points[1] - lane_out.points[0]
+                        d_out = d_out / np.linalg.norm(d_out)
+                        if np.dot(d_in, d_out) < -0.5:
+                            continue  # no U-turns
+                        cross = d_in[0] * d_out[1] - d_in[1] * d_out[0]
+                        if abs(cross) < 0.5:
+                            points = [p_in, p_out]
+                            preferred = True
+                        else:
+                            control = p_in + d_in * np.dot(p_out - p_in, d_in)
+                            u = np.linspace(0.0, 1.0, 16)[:, None]
+                            points = (1 - u) ** 2 * p_in + 2 * (1 - u) * u * control + u ** 2 * p_out
+                            preferred = (cross > 0 and k == n) or (cross < 0 and k == 1)
+                        options.append((preferred, points, lane_out))
+                    if not any(preferred for preferred, _, _ in options):
+                        options = [(True, points, lane_out) for _, points, lane_out in options]
+                    for preferred, points, lane_out in options:
+                        if not preferred:
+                            continue
+                        connector = self._add_lane(road_id, -1, points, is_junction=True, junction_id=junction_id)
+                        connector.successors.append(lane_out)
+                        connector.predecessors.append(lane_in)
+                        lane_in.successors.append(connector)
+                        lane_out.predecessors.append(connector)
+                        road_id += 1
+
+    def _build_segment_table(self):
+        starts, ends, lanes, offsets = [], [], [], []
+        for lane in self._lanes:
+            starts.append(lane.points[:-1])
+            ends.append(lane.points[1:])
+            lanes.append(np.full(len(lane.seg_length), lane.index))
+            offsets.append(lane.cum[:-1])
+        self._seg_a = np.concatenate(starts)
+        self._seg_b = np.concatenate(ends)
+        self._seg_lane = np.concatenate(lanes)
+        self._seg_t0 = np.concatenate(offsets)
+        seg = self._seg_b - self._seg_a
+        self._seg_dir = seg
+        self._seg_len2 = np.maximum(np.einsum('ij,ij->i', seg, seg), 1e-12)
+
+    # -- carla.Map API ----------------------------------------------------------
+
+    def _waypoint(self, lane, t):
+        return Waypoint(lane, t, self.lane_width)
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=LaneType.Driving):
+        p = np.array([location.x, location.y])
+        u = np.einsum('ij,ij->i', p - self._seg_a, self._seg_dir) / self._seg_len2
+        u = np.clip(u, 0.0, 1.0)
+        q = self._seg_a + u[:, None] * self._seg_dir
+        d2 = np.einsum('ij,ij->i', p - q, p - q)
+        best = int(np.argmin(d2))
+        if not project_to_road and math.sqrt(d2[best]) > self.lane_width / 2.0:
+            return None
+        lane = self._lanes[self._seg_lane[best]]
+        return self._waypoint(lane, self._seg_t0[best] + u[best] * math.sqrt(self._seg_len2[best]))
+
+    def get_waypoint_xodr(self, road_id, lane_id, s):
+        lane = self._lane_by_key.get((road_id, lane_id))
+        if lane is None or s < -1e-6 or s > lane.length + 1e-6:
+            return None
+        return self._waypoint(lane, lane.length - s if lane.reverse_s else s)
+
+    def get_topology(self):
+        return [(self._waypoint(lane, 0.0), self._waypoint(lane, lane.length)) for lane in self._lanes]
+
+    def generate_waypoints(self, distance):
+        waypoints = []
+        for lane in self._lanes:
+            t = 0.0
+            while t <= lane.length:
+                waypoints.append(self._waypoint(lane, t))
+                t += distance
+        return waypoints
+
+    def get_spawn_points(self):
+        spawn_points = []
+        for lane in self._lanes:
+            if lane.is_junction:
+                continue
+            t = 10.0
+            while t < lane.length - 10.0:
+                x, y, yaw = lane.pose(t)
+                spawn_points.append(Transform(Location(x, y, 0.5), Rotation(yaw=yaw)))
+                t += 20.0
+        return spawn_points
+
+    def get_crosswalks(self):
+        return []
+
+    def get_all_landmarks(self):
+        return []
+
+    def to_opendrive(self):
+        return ''
+
+    def junction_approaches(self):
+        """
+        Returns, for every junction, the lanes entering it grouped by road.
+        Not part of the carla.Map API, used to place the traffic lights.
+        """
+        approaches = []
+        for node, arms in sorted(self._junction_arms.items()):
+            for incoming, _ in arms:
+                approaches.append((node, incoming))
+        return approaches
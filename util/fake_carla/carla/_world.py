@@ -0,0 +1,1088 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" World, actors, sensors and client of the offline carla module. """
+
+import fnmatch
+import itertools
+import json
+import math
+import time
+from enum import IntEnum
+
+from ._geometry import BoundingBox, Location, Rotation, Transform, Vector3D
+from ._road import Map
+
+
+# ==============================================================================
+# -- Controls and settings -----------------------------------------------------
+# ==============================================================================
+
+class VehicleControl(object):
+    """Same fields and defaults as carla.VehicleControl"""
+
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = float(throttle)
+        self.steer = float(steer)
+        self.brake = float(brake)
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+    def __repr__(self):
+        return 'VehicleControl(throttle={:.6f}, steer={:.6f}, brake={:.6f}, hand_brake={}, reverse={})'.format(
+            self.throttle, self.steer, self.brake, self.hand_brake, self.reverse)
+
+
+class WalkerControl(object):
+    """Same fields and defaults as carla.WalkerControl"""
+
+    def __init__(self, direction=None, speed=0.0, jump=False):
+        self.direction = Vector3D(direction) if direction is not None else Vector3D(1.0, 0.0, 0.0)
+        self.speed = float(speed)
+        self.jump = jump
+
+
+class WorldSettings(object):
+    """Same fields and defaults as carla.WorldSettings"""
+
+    def __init__(self, synchronous_mode=False, no_rendering_mode=False, fixed_delta_seconds=None,
+                 substepping=True, max_substep_delta_time=0.01, max_substeps=10):
+        self.synchronous_mode = synchronous_mode
+        self.no_rendering_mode = no_rendering_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.substepping = substepping
+        self.max_substep_delta_time = max_substep_delta_time
+        self.max_substeps = max_substeps
+        self.max_culling_distance = 0.0
+        self.deterministic_ragdolls = False
+
+    def _copy(self):
+        settings = WorldSettings()
+        settings.__dict__.update(self.__dict__)
+        return settings
+
+
+class WeatherParameters(object):
+    """Same fields as carla.WeatherParameters, a few of the presets are defined below"""
+
+    def __init__(self, cloudiness=0.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=0.0,
+                 sun_azimuth_angle=0.0, sun_altitude_angle=0.0, fog_density=0.0, fog_distance=0.0,
+                 wetness=0.0, fog_falloff=0.0):
+        self.cloudiness = cloudiness
+        self.precipitation = precipitation
+        self.precipitation_deposits = precipitation_deposits
+        self.wind_intensity = wind_intensity
+        self.sun_azimuth_angle = sun_azimuth_angle
+        self.sun_altitude_angle = sun_altitude_angle
+        self.fog_density = fog_density
+        self.fog_distance = fog_distance
+        self.wetness = wetness
+        self.fog_falloff = fog_falloff
+
+    def _copy(self):
+        return WeatherParameters(**self.__dict__)
+
+
+WeatherParameters.Default = WeatherParameters(cloudiness=5.0, sun_altitude_angle=45.0, fog_distance=0.75)
+WeatherParameters.ClearNoon = WeatherParameters(cloudiness=5.0, sun_altitude_angle=45.0)
+WeatherParameters.CloudyNoon = WeatherParameters(cloudiness=60.0, sun_altitude_angle=45.0)
+WeatherParameters.WetNoon = WeatherParameters(cloudiness=5.0, precipitation_deposits=50.0, sun_altitude_angle=45.0, wetness=50.0)
+WeatherParameters.HardRainNoon = WeatherParameters(cloudiness=100.0, precipitation=100.0, precipitation_deposits=90.0,
+                                                   wind_intensity=100.0, sun_altitude_angle=45.0, wetness=100.0)
+WeatherParameters.ClearSunset = WeatherParameters(cloudiness=5.0, sun_altitude_angle=15.0)
+
+
+class TrafficLightState(IntEnum):
+    Red = 0
+    Yellow = 1
+    Green = 2
+    Off = 3
+    Unknown = 4
+
+
+class ColorConverter(IntEnum):
+    Raw = 0
+    Depth = 1
+    LogarithmicDepth = 2
+    CityScapesPalette = 3
+
+
+class AttachmentType(IntEnum):
+    Rigid = 0
+    SpringArm = 1
+    SpringArmGhost = 2
+
+
+class Timestamp(object):
+    """Same fields as carla.Timestamp"""
+
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.frame_count = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = time.time()
+
+
+# ==============================================================================
+# -- Blueprints ----------------------------------------------------------------
+# ==============================================================================
+
+class ActorAttribute(object):
+    """Attribute of a blueprint, same accessors as carla.ActorAttribute"""
+
+    def __init__(self, attribute_id, value, recommended_values=None):
+        self.id = attribute_id
+        self._value = str(value)
+        self.recommended_values = list(recommended_values or [])
+        self.is_modifiable = True
+
+    def as_str(self):
+        return self._value
+
+    def as_int(self):
+        return int(self._value)
+
+    def as_float(self):
+        return float(self._value)
+
+    def as_bool(self):
+        return self._value.lower() in ('true', '1')
+
+    def __str__(self):
+        return self._value
+
+
+class ActorBlueprint(object):
+    """Same API as carla.ActorBlueprint"""
+
+    def __init__(self, blueprint_id, attributes=None, extent=(2.4, 1.0, 0.8)):
+        self.id = blueprint_id
+        self.tags = blueprint_id.split('.')
+        self.extent = extent
+        self._attributes = {'role_name': ActorAttribute('role_name', '')}
+        for key, value in (attributes or {}).items():
+            self._attributes[key] = ActorAttribute(key, value)
+
+    def __repr__(self):
+        return 'ActorBlueprint(id={}, tags={})'.format(self.id, self.tags)
+
+    def has_attribute(self, attribute_id):
+        return attribute_id in self._attributes
+
+    def get_attribute(self, attribute_id):
+        return self._attributes[attribute_id]
+
+    def set_attribute(self, attribute_id, value):
+        if attribute_id in self._attributes:
+            self._attributes[attribute_id]._value = str(value)
+        else:
+            self._attributes[attribute_id] = ActorAttribute(attribute_id, value)
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def match_tags(self, pattern):
+        return any(fnmatch.fnmatch(tag, pattern) for tag in self.tags)
+
+    def __iter__(self):
+        return iter(self._attributes.values())
+
+    def _attribute_values(self):
+        return {key: attribute.as_str() for key, attribute in self._attributes.items()}
+
+
+_CAR = (2.4, 1.0, 0.8)
+_BIKE = (0.9, 0.4, 0.8)
+_WALKER = (0.2, 0.2, 0.9)
+
+_VEHICLES = (
+    ('vehicle.dodge.charger_police', _CAR, 4),
+    ('vehicle.dodge.charger_2020', _CAR, 4),
+    ('vehicle.citroen.c3', (1.95, 0.9, 0.8), 4),
+    ('vehicle.tesla.model3', _CAR, 4),
+    ('vehicle.lincoln.mkz_2017', _CAR, 4),
+    ('vehicle.audi.tt', (2.1, 1.0, 0.7), 4),
+    ('vehicle.mercedes.coupe', _CAR, 4),
+    ('vehicle.diamondback.century', _BIKE, 2),
+    ('vehicle.bh.crossbike', _BIKE, 2),
+    ('vehicle.gazelle.omafiets', _BIKE, 2),
+    ('vehicle.harley-davidson.low_rider', (1.2, 0.4, 0.8), 2),
+)
+
+_SENSORS = (
+    ('sensor.other.obstacle', {'distance': 5, 'hit_radius': 0.5, 'only_dynamics': False,
+                               'debug_linetrace': False, 'sensor_tick': 0.0}),
+    ('sensor.other.collision', {}),
+    ('sensor.other.lane_invasion', {}),
+    ('sensor.other.gnss', {'sensor_tick': 0.0}),
+    ('sensor.other.imu', {'sensor_tick': 0.0}),
+    ('sensor.camera.rgb', {'image_size_x': 800, 'image_size_y': 600, 'fov': 90, 'sensor_tick': 0.0}),
+    ('sensor.camera.depth', {'image_size_x': 800, 'image_size_y': 600, 'fov': 90, 'sensor_tick': 0.0}),
+    ('sensor.camera.semantic_segmentation', {'image_size_x': 800, 'image_size_y': 600, 'fov': 90,
+                                             'sensor_tick': 0.0}),
+    ('sensor.lidar.ray_cast', {'range': 50, 'channels': 32, 'sensor_tick': 0.0}),
+)
+
+
+class BlueprintLibrary(object):
+    """Same API as carla.BlueprintLibrary"""
+
+    def __init__(self, blueprints=None):
+        if blueprints is None:
+            blueprints = []
+            for blueprint_id, extent, wheels in _VEHICLES:
+                blueprints.append(ActorBlueprint(
+                    blueprint_id, {'number_of_wheels': wheels, 'color': '0,0,0', 'generation': 2}, extent))
+            for k in range(1, 5):
+                blueprints.append(ActorBlueprint('walker.pedestrian.{:04d}'.format(k),
+                                                 {'is_invincible': False, 'speed': '1.4'}, _WALKER))
+            for blueprint_id, attributes in _SENSORS:
+                blueprints.append(ActorBlueprint(blueprint_id, attributes, (0.0, 0.0, 0.0)))
+        self._blueprints = blueprints
+
+    def __len__(self):
+        return len(self._blueprints)
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+    def __getitem__(self, index):
+        return self._blueprints[index]
+
+    def filter(self, wildcard_pattern):
+        return BlueprintLibrary([bp for bp in self._blueprints if fnmatch.fnmatch(bp.id, wildcard_pattern)])
+
+    def find(self, blueprint_id):
+        for blueprint in self._blueprints:
+            if blueprint.id == blueprint_id:
+                return blueprint
+        raise IndexError('blueprint {} not found'.format(blueprint_id))
+
+
+# ==============================================================================
+# -- Actors --------------------------------------------------------------------
+# ==============================================================================
+
+class Actor(object):
+    """Base of the actors, same API as carla.Actor"""
+
+    def __init__(self, world, actor_id, type_id, transform, attributes=None, extent=(0.0, 0.0, 0.0), parent=None):
+        self._world = world
+        self.id = actor_id
+        self.type_id = type_id
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.is_alive = True
+        self.semantic_tags = []
+        self.bounding_box = BoundingBox(Location(0.0, 0.0, extent[2]), Vector3D(*extent))
+        self._transform = Transform(transform.location, transform.rotation)
+        self._velocity = Vector3D()
+        self._angular_velocity = Vector3D()
+        self._acceleration = Vector3D()
+
+    def __repr__(self):
+        return 'Actor(id={}, type={})'.format(self.id, self.type_id)
+
+    def __eq__(self, other):
+        return isinstance(other, Actor) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        if self.parent is not None:
+            parent = self.parent.get_transform()
+            return Transform(parent.transform(self._transform.location),
+                             Rotation(self._transform.rotation.pitch + parent.rotation.pitch,
+                                      self._transform.rotation.yaw + parent.rotation.yaw,
+                                      self._transform.rotation.roll + parent.rotation.roll))
+        return Transform(self._transform.location, self._transform.rotation)
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return Vector3D(self._velocity)
+
+    def get_angular_velocity(self):
+        return Vector3D(self._angular_velocity)
+
+    def get_acceleration(self):
+        return Vector3D(self._acceleration)
+
+    def set_transform(self, transform):
+        self._transform = Transform(transform.location, transform.rotation)
+
+    def set_location(self, location):
+        self._transform.location = Location(location)
+
+    def set_target_velocity(self, velocity):
+        self._velocity = Vector3D(velocity)
+
+    def set_simulate_physics(self, enabled=True):
+        pass
+
+    def destroy(self):
+        if not self.is_alive:
+            return False
+        self.is_alive = False
+        self._world._remove_actor(self)
+        return True
+
+    def _step(self, dt):
+        pass
+
+
+class Vehicle(Actor):
+    """
+    Vehicle moved by a kinematic bicycle model. Throttle and brake are mapped linearly to
+    an acceleration and the steer to the angle of the front wheels.
+    """
+
+    def __init__(self, world, actor_id, type_id, transform, attributes=None, extent=_CAR,
+                 max_accel=4.0, max_decel=8.0, max_steer_angle=70.0):
+        super(Vehicle, self).__init__(world, actor_id, type_id, transform, attributes, extent)
+        self._control = VehicleControl()
+        self._speed = 0.0
+        self._wheelbase = 1.2 * extent[0]
+        self._max_accel = max_accel
+        self._max_decel = max_decel
+        self._max_steer_angle = math.radians(max_steer_angle)
+        self._autopilot = False
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def set_autopilot(self, enabled=True, port=8000):
+        self._autopilot = enabled
+
+    def get_speed_limit(self):
+        return self._world._map.speed_limit
+
+    def get_traffic_light_state(self):
+        return TrafficLightState.Green
+
+    def is_at_traffic_light(self):
+        return False
+
+    def get_traffic_light(self):
+        return None
+
+    def set_target_velocity(self, velocity):
+        super(Vehicle, self).set_target_velocity(velocity)
+        self._speed = math.hypot(velocity.x, velocity.y)
+
+    def _step(self, dt):
+        control = self._control
+        brake = 1.0 if control.hand_brake else control.brake
+        accel = self._max_accel * control.throttle - self._max_decel * brake
+        speed = max(0.0, self._speed + accel * dt)
+        yaw = math.radians(self._transform.rotation.yaw)
+        steer = max(-1.0, min(1.0, control.steer)) * self._max_steer_angle
+        yaw_rate = speed / self._wheelbase * math.tan(steer)
+        direction = -1.0 if control.reverse else 1.0
+
+        location = self._transform.location
+        location.x += direction * speed * math.cos(yaw) * dt
+        location.y += direction * speed * math.sin(yaw) * dt
+        self._transform.rotation.yaw = math.degrees(yaw + direction * yaw_rate * dt)
+        self._acceleration = Vector3D((speed - self._speed) / dt * math.cos(yaw), (speed - self._speed) / dt * math.sin(yaw), 0.0)
+        self._angular_velocity = Vector3D(0.0, 0.0, math.degrees(yaw_rate))
+        yaw = math.radians(self._transform.rotation.yaw)
+        self._velocity = Vector3D(direction * speed * math.cos(yaw), direction * speed * math.sin(yaw), 0.0)
+        self._speed = speed
+
+
+class Walker(Actor):
+    """Walker moving in a straight line with its last WalkerControl"""
+
+    def __init__(self, world, actor_id, type_id, transform, attributes=None, extent=_WALKER):
+        super(Walker, self).__init__(world, actor_id, type_id, transform, attributes, extent)
+        self._control = WalkerControl()
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def _step(self, dt):
+        direction = self._control.direction.make_unit_vector()
+        self._velocity = direction * self._control.speed
+        self._transform.location += self._velocity * dt
+        if self._control.speed > 0.0:
+            self._transform.rotation.yaw = math.degrees(math.atan2(direction.y, direction.x))
+
+
+class TrafficLight(Actor):
+    """Traffic light cycling through green, yellow and red, same API as carla.TrafficLight"""
+
+    def __init__(self, world, actor_id, transform, trigger_extent, group, pole_index,
+                 green_time=10.0, yellow_time=2.0, red_time=None):
+        super(TrafficLight, self).__init__(world, actor_id, 'traffic.traffic_light', transform)
+        self.trigger_volume = BoundingBox(Location(), Vector3D(*trigger_extent))
+        self._group = group
+        self._pole_index = pole_index
+        self._green_time = green_time
+        self._yellow_time = yellow_time
+        self._red_time = red_time
+        self._frozen = False
+        self._elapsed = 0.0
+        self.state = TrafficLightState.Red
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, state):
+        self.state = state
+        self._elapsed = 0.0
+
+    def freeze(self, freeze):
+        self._frozen = freeze
+
+    def is_frozen(self):
+        return self._frozen
+
+    def get_elapsed_time(self):
+        return self._elapsed
+
+    def get_green_time(self):
+        return self._green_time
+
+    def get_yellow_time(self):
+        return self._yellow_time
+
+    def get_red_time(self):
+        return (self._green_time + self._yellow_time) * (len(self._group) - 1)
+
+    def set_green_time(self, green_time):
+        self._green_time = green_time
+
+    def set_yellow_time(self, yellow_time):
+        self._yellow_time = yellow_time
+
+    def get_pole_index(self):
+        return self._pole_index
+
+    def get_group_traffic_lights(self):
+        return list(self._group)
+
+    def reset_group(self):
+        for light in self._group:
+            light._elapsed = 0.0
+
+    def _phase_state(self, time_in_cycle):
+        phase = self._green_time + self._yellow_time
+        start = self._pole_index * phase
+        if start <= time_in_cycle < start + self._green_time:
+            return TrafficLightState.Green
+        if start + self._green_time <= time_in_cycle < start + phase:
+            return TrafficLightState.Yellow
+        return TrafficLightState.Red
+
+    def _update(self, elapsed_seconds):
+        if self._frozen:
+            return
+        cycle = (self._green_time + self._yellow_time) * len(self._group)
+        state = self._phase_state(elapsed_seconds % cycle)
+        if state != self.state:
+            self.state = state
+            self._elapsed = 0.0
+
+
+class Spectator(Actor):
+    def __init__(self, world, actor_id):
+        super(Spectator, self).__init__(world, actor_id, 'spectator', Transform())
+
+
+# ==============================================================================
+# -- Sensors -------------------------------------------------------------------
+# ==============================================================================
+
+class SensorData(object):
+    def __init__(self, frame, timestamp, transform):
+        self.frame = frame
+        self.frame_number = frame
+        self.timestamp = timestamp
+        self.transform = transform
+
+
+class ObstacleDetectionEvent(SensorData):
+    def __init__(self, frame, timestamp, transform, actor, other_actor, distance):
+        super(ObstacleDetectionEvent, self).__init__(frame, timestamp, transform)
+        self.actor = actor
+        self.other_actor = other_actor
+        self.distance = distance
+
+
+class CollisionEvent(SensorData):
+    def __init__(self, frame, timestamp, transform, actor, other_actor, normal_impulse):
+        super(CollisionEvent, self).__init__(frame, timestamp, transform)
+        self.actor = actor
+        self.other_actor = other_actor
+        self.normal_impulse = normal_impulse
+
+
+class Sensor(Actor):
+    """
+    Sensor attached to an actor. The obstacle and collision sensors produce events, the other
+    sensors accept callbacks but never produce data.
+    """
+
+    def __init__(self, world, actor_id, blueprint, transform, parent):
+        super(Sensor, self).__init__(world, actor_id, blueprint.id, transform,
+                                     blueprint._attribute_values(), parent=parent)
+        self._callback = None
+        self._last_time = None
+        self._colliding = set()
+        self.is_listening = False
+
+    def listen(self, callback):
+        self._callback = callback
+        self.is_listening = True
+
+    def stop(self):
+        self._callback = None
+        self.is_listening = False
+
+    def _attribute(self, name, default):
+        return type(default)(self.attributes.get(name, default))
+
+    def _measure(self, timestamp):
+        if self._callback is None or self.parent is None or not self.parent.is_alive:
+            return
+        sensor_tick = float(self.attributes.get('sensor_tick', 0.0))
+        if self._last_time is not None and timestamp.elapsed_seconds - self._last_time < sensor_tick - 1e-9:
+            return
+        self._last_time = timestamp.elapsed_seconds
+
+        if self.type_id == 'sensor.other.obstacle':
+            event = self._detect_obstacle(timestamp)
+        elif self.type_id == 'sensor.other.collision':
+            event = self._detect_collision(timestamp)
+        else:
+            event = None
+        if event is not None:
+            self._callback(event)
+
+    def _detect_obstacle(self, timestamp):
+        """Closest actor in a corridor of width 2*hit_radius in front of the parent"""
+        distance = float(self.attributes.get('distance', 5))
+        hit_radius = float(self.attributes.get('hit_radius', 0.5))
+        origin = self.get_transform()
+        best = None
+        for other in self._world._physical_actors():
+            if other is self.parent:
+                continue
+            local = origin.inverse_transform(other.get_location())
+            extent = other.bounding_box.extent
+            hit = local.x - extent.x
+            if abs(local.y) <= hit_radius + extent.y and 0.0 <= hit <= distance:
+                if best is None or hit < best[0]:
+                    best = (hit, other)
+        if best is None:
+            return None
+        return ObstacleDetectionEvent(timestamp.frame, timestamp.elapsed_seconds, origin,
+                                      self.parent, best[1], best[0])
+
+    def _detect_collision(self, timestamp):
+        """First actor whose footprint starts overlapping the one of the parent"""
+        colliding = set()
+        event = None
+        for other in self._world._physical_actors():
+            if other is self.parent or not _footprints_overlap(self.parent, other):
+                continue
+            colliding.add(other.id)
+            if other.id not in self._colliding and event is None:
+                impulse = self.parent.get_velocity() - other.get_velocity()
+                event = CollisionEvent(timestamp.frame, timestamp.elapsed_seconds, self.get_transform(),
+                                       self.parent, other, impulse * 1000.0)
+        self._colliding = colliding
+        return event
+
+
+def _footprint(actor):
+    transform = actor.get_transform()
+    extent = actor.bounding_box.extent
+    return [transform.transform(Location(sx * extent.x, sy * extent.y, 0.0))
+            for sx, sy in ((1, 1), (1, -1), (-1, -1), (-1, 1))]
+
+
+def _footprints_overlap(first, second):
+    """Separating axis test between the XY footprints of two actors"""
+    a, b = _footprint(first), _footprint(second)
+    for polygon in (a, b):
+        for k in range(4):
+            p, q = polygon[k], polygon[(k + 1) % 4]
+            nx, ny = q.y - p.y, p.x - q.x
+            proj_a = [nx * v.x + ny * v.y for v in a]
+            proj_b = [nx * v.x + ny * v.y for v in b]
+            if max(proj_a) < min(proj_b) or max(proj_b) < min(proj_a):
+                return False
+    return True
+
+
+# ==============================================================================
+# -- Snapshots -----------------------------------------------------------------
+# ==============================================================================
+
+class ActorSnapshot(object):
+    """State of an actor at a frame, same API as carla.ActorSnapshot"""
+
+    def __init__(self, actor):
+        self.id = actor.id
+        self._transform = actor.get_transform()
+        self._velocity = actor.get_velocity()
+        self._angular_velocity = actor.get_angular_velocity()
+        self._acceleration = actor.get_acceleration()
+
+    def get_transform(self):
+        return Transform(self._transform.location, self._transform.rotation)
+
+    def get_velocity(self):
+        return Vector3D(self._velocity)
+
+    def get_angular_velocity(self):
+        return Vector3D(self._angular_velocity)
+
+    def get_acceleration(self):
+        return Vector3D(self._acceleration)
+
+
+class WorldSnapshot(object):
+    """State of every actor at a frame, same API as carla.WorldSnapshot"""
+
+    def __init__(self, world_id, timestamp, actors):
+        self.id = world_id
+        self.timestamp = timestamp
+        self.frame = timestamp.frame
+        self._snapshots = {actor.id: ActorSnapshot(actor) for actor in actors}
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def __iter__(self):
+        return iter(self._snapshots.values())
+
+    def has_actor(self, actor_id):
+        return actor_id in self._snapshots
+
+    def find(self, actor_id):
+        return self._snapshots.get(actor_id)
+
+
+class ActorList(object):
+    """Same API as carla.ActorList"""
+
+    def __init__(self, actors):
+        self._actors = list(actors)
+
+    def __len__(self):
+        return len(self._actors)
+
+    def __iter__(self):
+        return iter(self._actors)
+
+    def __getitem__(self, index):
+        return self._actors[index]
+
+    def filter(self, wildcard_pattern):
+        return ActorList([a for a in self._actors if fnmatch.fnmatch(a.type_id, wildcard_pattern)])
+
+    def find(self, actor_id):
+        for actor in self._actors:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+
+class DebugHelper(object):
+    """Drawing is not supported offline, every call is ignored"""
+
+    def draw_point(self, *args, **kwargs):
+        pass
+
+    def draw_line(self, *args, **kwargs):
+        pass
+
+    def draw_arrow(self, *args, **kwargs):
+        pass
+
+    def draw_box(self, *args, **kwargs):
+        pass
+
+    def draw_string(self, *args, **kwargs):
+        pass
+
+
+# ==============================================================================
+# -- World ---------------------------------------------------------------------
+# ==============================================================================
+
+class World(object):
+    """
+    Offline carla.World on a synthetic Map. Each tick moves the vehicles and walkers with
+    their last control, updates the traffic lights and runs the sensors.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, wmap=None, default_delta_seconds=0.05):
+        """
+        :param wmap: carla.Map of the world, a default synthetic Map if None
+        :param default_delta_seconds: time step when the settings don't fix one
+        """
+        self.id = next(World._ids)
+        self._map = wmap if wmap is not None else Map()
+        self._settings = WorldSettings()
+        self._weather = WeatherParameters.Default._copy()
+        self._blueprints = BlueprintLibrary()
+        self._default_delta_seconds = default_delta_seconds
+        self._actor_ids = itertools.count(1)
+        self._actors = {}
+        self._frame = 0
+        self._elapsed = 0.0
+        self.debug = DebugHelper()
+        self._recorder = None
+        self._spectator = self._add_actor(Spectator(self, next(self._actor_ids)))
+        self._build_traffic_lights()
+        self._snapshot = self._take_snapshot(0.0)
+
+    def _build_traffic_lights(self):
+        n = self._map.lanes_per_direction
+        width = self._map.lane_width
+        groups = {}
+        for node, incoming in self._map.junction_approaches():
+            group = groups.setdefault(node, [])
+            # Light in the middle of the incoming lanes, a few meters before the junction
+            first, last = incoming[0], incoming[-1]
+            x0, y0, yaw = first.pose(first.length - 3.0)
+            x1, y1, _ = last.pose(last.length - 3.0)
+            transform = Transform(Location((x0 + x1) / 2.0, (y0 + y1) / 2.0, 0.0), Rotation(yaw=yaw))
+            light = TrafficLight(self, next(self._actor_ids), transform, (1.5, n * width / 2.0, 1.0),
+                                 group, len(group))
+            group.append(light)
+            self._add_actor(light)
+        for light in self._traffic_lights():
+            light._update(0.0)
+
+    def _add_actor(self, actor):
+        self._actors[actor.id] = actor
+        return actor
+
+    def _remove_actor(self, actor):
+        self._actors.pop(actor.id, None)
+
+    def _traffic_lights(self):
+        return [a for a in self._actors.values() if isinstance(a, TrafficLight)]
+
+    def _physical_actors(self):
+        return [a for a in self._actors.values() if isinstance(a, (Vehicle, Walker))]
+
+    def _take_snapshot(self, delta_seconds):
+        timestamp = Timestamp(self._frame, self._elapsed, delta_seconds)
+        return WorldSnapshot(self.id, timestamp, self._actors.values())
+
+    # -- carla.World API --------------------------------------------------------
+
+    def get_map(self):
+        return self._map
+
+    def get_settings(self):
+        return self._settings._copy()
+
+    def apply_settings(self, settings):
+        self._settings = settings._copy()
+        return self._frame
+
+    def get_weather(self):
+        return self._weather._copy()
+
+    def set_weather(self, weather):
+        self._weather = weather._copy()
+
+    def get_blueprint_library(self):
+        return self._blueprints
+
+    def get_spectator(self):
+        return self._spectator
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    def get_actors(self, actor_ids=None):
+        actors = self._actors.values()
+        if actor_ids is not None:
+            actors = [self._actors[i] for i in actor_ids if i in self._actors]
+        return ActorList(actors)
+
+    def get_actor(self, actor_id):
+        return self._actors.get(actor_id)
+
+    def get_random_location_from_navigation(self):
+        spawn_points = self._map.get_spawn_points()
+        return spawn_points[self._frame % len(spawn_points)].location
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        attributes = blueprint._attribute_values()
+        actor_id = next(self._actor_ids)
+        if blueprint.id.startswith('sensor.'):
+            actor = Sensor(self, actor_id, blueprint, transform, attach_to)
+        elif blueprint.id.startswith('vehicle.'):
+            actor = Vehicle(self, actor_id, blueprint.id, transform, attributes, blueprint.extent)
+        elif blueprint.id.startswith('walker.'):
+            actor = Walker(self, actor_id, blueprint.id, transform, attributes, blueprint.extent)
+        else:
+            actor = Actor(self, actor_id, blueprint.id, transform, attributes, blueprint.extent, attach_to)
+
+        if isinstance(actor, (Vehicle, Walker)):
+            for other in self._physical_actors():
+                if _footprints_overlap(actor, other):
+                    return None
+        return self._add_actor(actor)
+
+    def spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=AttachmentType.Rigid):
+        actor = self.try_spawn_actor(blueprint, transform, attach_to, attachment_type)
+        if actor is None:
+            raise RuntimeError('Spawn failed because of collision at spawn position')
+        return actor
+
+    def tick(self, seconds=10.0):
+        """Advances the simulation one step, returns the id of the new frame"""
+        dt = self._settings.fixed_delta_seconds or self._default_delta_seconds
+        for actor in list(self._actors.values()):
+            actor._step(dt)
+        self._frame += 1
+        self._elapsed += dt
+        for light in self._traffic_lights():
+            light._update(self._elapsed)
+        self._snapshot = self._take_snapshot(dt)
+        for actor in list(self._actors.values()):
+            if isinstance(actor, Sensor):
+                actor._measure(self._snapshot.timestamp)
+        if self._recorder is not None:
+            self._recorder._record(self)
+        return self._frame
+
+    def wait_for_tick(self, seconds=10.0):
+        if not self._settings.synchronous_mode:
+            self.tick()
+        return self._snapshot
+
+    def on_tick(self, callback):
+        return 0
+
+    def remove_on_tick(self, callback_id):
+        pass
+
+
+# ==============================================================================
+# -- Recorder ------------------------------------------------------------------
+# ==============================================================================
+
+def _recorder_category(actor):
+    """Category of an actor in the queries of the recorder: hero, vehicle, walker, other"""
+    if isinstance(actor, Vehicle):
+        return 'h' if actor.attributes.get('role_name') == 'hero' else 'v'
+    if isinstance(actor, Walker):
+        return 'w'
+    if isinstance(actor, TrafficLight):
+        return 't'
+    return 'o'
+
+
+class _Recorder(object):
+    """
+    Recording of Client.start_recorder: the position of the vehicles and walkers at every
+    frame and the collisions between them, written as JSON by stop, so the queries of the
+    client can read it back. It is not the binary format of the simulator.
+    """
+
+    def __init__(self, world, file_name):
+        self._file_name = file_name
+        self._start = world._elapsed
+        self._frames = 0
+        self._duration = 0.0
+        self._actors = {}
+        self._positions = {}
+        self._collisions = []
+        self._colliding = set()
+        self._date = time.strftime('%m/%d/%y %H:%M:%S')
+        self._map = world.get_map().name
+
+    def _record(self, world):
+        elapsed = world._elapsed - self._start
+        self._frames += 1
+        self._duration = elapsed
+        actors = world._physical_actors()
+        for actor in actors:
+            self._actors.setdefault(actor.id, (_recorder_category(actor), actor.type_id))
+            location = actor.get_location()
+            self._positions.setdefault(actor.id, []).append((elapsed, location.x, location.y))
+        colliding = set()
+        for k, first in enumerate(actors):
+            for second in actors[k + 1:]:
+                if _footprints_overlap(first, second):
+                    pair = (first.id, second.id)
+                    colliding.add(pair)
+                    if pair not in self._colliding:
+                        self._collisions.append((elapsed,) + pair)
+        self._colliding = colliding
+
+    def stop(self):
+        with open(self._file_name, 'w') as f:
+            json.dump({'map': self._map, 'date': self._date, 'frames': self._frames,
+                       'duration': self._duration,
+                       'actors': {str(k): v for k, v in self._actors.items()},
+                       'positions': {str(k): v for k, v in self._positions.items()},
+                       'collisions': self._collisions}, f)
+
+
+def _read_recording(file_name):
+    with open(file_name, 'r') as f:
+        recording = json.load(f)
+    recording['actors'] = {int(k): v for k, v in recording['actors'].items()}
+    recording['positions'] = {int(k): v for k, v in recording['positions'].items()}
+    return recording
+
+
+def _recorder_text(recording, title, rows):
+    lines = ['Version: 1', 'Map: {}'.format(recording['map']), 'Date: {}'.format(recording['date']), '',
+             title] + rows + ['', 'Frames: {}'.format(recording['frames']),
+                              'Duration: {:g} seconds'.format(recording['duration']), '']
+    return '\n'.join(lines)
+
+
+# ==============================================================================
+# -- Client --------------------------------------------------------------------
+# ==============================================================================
+
+class Client(object):
+    """
+    Offline carla.Client. The clients of the same host and port share their world, as they
+    would share a server.
+    """
+
+    _servers = {}
+
+    def __init__(self, host='127.0.0.1', port=2000, worker_threads=0):
+        self._key = (host, port)
+        if self._key not in Client._servers:
+            Client._servers[self._key] = World()
+
+    def set_timeout(self, seconds):
+        pass
+
+    def get_client_version(self):
+        return '0.9.13-offline'
+
+    def get_server_version(self):
+        return '0.9.13-offline'
+
+    def get_world(self):
+        return Client._servers[self._key]
+
+    def get_available_maps(self):
+        return ['/Game/Offline/Maps/' + self.get_world().get_map().name]
+
+    def load_world(self, map_name='FakeTown', reset_settings=True):
+        Client._servers[self._key] = World(Map(map_name.split('/')[-1]))
+        return Client._servers[self._key]
+
+    def reload_world(self, reset_settings=True):
+        return self.load_world(self.get_world().get_map().name, reset_settings)
+
+    def generate_opendrive_world(self, opendrive, parameters=None, reset_settings=True):
+        return self.load_world()
+
+    def apply_batch(self, commands):
+        self.apply_batch_sync(commands)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        world = self.get_world()
+        responses = [command._run(world) for command in commands]
+        if do_tick:
+            world.tick()
+        return responses
+
+    def get_trafficmanager(self, port=8000):
+        return TrafficManager(port)
+
+    def start_recorder(self, filename, additional_data=False):
+        world = self.get_world()
+        if world._recorder is not None:
+            world._recorder.stop()
+        world._recorder = _Recorder(world, filename)
+        return filename
+
+    def stop_recorder(self):
+        world = self.get_world()
+        if world._recorder is not None:
+            world._recorder.stop()
+            world._recorder = None
+
+    def show_recorder_file_info(self, filename, show_all=False):
+        recording = _read_recording(filename)
+        rows = ['{:>6} {} {}'.format(actor_id, category, type_id)
+                for actor_id, (category, type_id) in sorted(recording['actors'].items())]
+        return _recorder_text(recording, 'Actors:', rows)
+
+    def show_recorder_collisions(self, filename, category1, category2):
+        recording = _read_recording(filename)
+        actors = recording['actors']
+
+        def matches(category, wanted):
+            return wanted == 'a' or category == wanted or (wanted == 'v' and category == 'h')
+
+        rows = []
+        for elapsed, id1, id2 in recording['collisions']:
+            (c1, t1), (c2, t2) = actors[id1], actors[id2]
+            if not (matches(c1, category1) and matches(c2, category2)):
+                if not (matches(c2, category1) and matches(c1, category2)):
+                    continue
+                (id1, c1, t1), (id2, c2, t2) = (id2, c2, t2), (id1, c1, t1)
+            rows.append('{:>8g}   {} {} {:>6} {:<35} {:>6} {}'.format(round(elapsed, 2), c1, c2, id1, t1, id2, t2))
+        return _recorder_text(recording, '    Time  Types     Id Actor 1                                 Id Actor 2', rows)
+
+    def show_recorder_actors_blocked(self, filename, min_time=60.0, min_distance=100.0):
+        """The actors that moved less than min_distance (cm) in at least min_time (s)"""
+        recording = _read_recording(filename)
+        rows = []
+        for actor_id, positions in sorted(recording['positions'].items()):
+            start = 0
+            for k in range(1, len(positions) + 1):
+                moved = k < len(positions) and math.hypot(
+                    positions[k][1] - positions[start][1], positions[k][2] - positions[start][2]) * 100.0 >= min_distance
+                if k == len(positions) or moved:
+                    duration = positions[k - 1][0] - positions[start][0]
+                    if duration >= min_time:
+                        rows.append('{:>8g} {:>6} {:<35} {:>8g}'.format(
+                            round(positions[start][0], 2), actor_id, recording['actors'][actor_id][1], round(duration, 2)))
+                    start = k
+        return _recorder_text(recording, '    Time     Id Actor                                 Duration', rows)
+
+
+class TrafficManager(object):
+    """The vehicles set to autopilot aren't driven offline, every setting is ignored"""
+
+    def __init__(self, port=8000):
+        self._port = port
+
+    def get_port(self):
+        return self._port
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
@@ -0,0 +1,131 @@
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+""" Batch commands of the offline carla module, applied with Client.apply_batch(_sync). """
+
+
+class Response(object):
+    """Result of a command, same API as carla.command.Response"""
+
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
+
+
+class FutureActor(object):
+    """Placeholder for the actor spawned by the parent SpawnActor command"""
+    pass
+
+
+class _Command(object):
+    def _run(self, world, parent_id=0):
+        raise NotImplementedError
+
+    @staticmethod
+    def _actor(world, actor):
+        actor_id = actor if isinstance(actor, int) else actor.id
+        return world.get_actor(actor_id)
+
+
+class SpawnActor(_Command):
+    def __init__(self, blueprint, transform, parent=None):
+        self.blueprint = blueprint
+        self.transform = transform
+        self.parent_id = parent if parent is None or isinstance(parent, int) else parent.id
+        self._then = []
+
+    def then(self, command):
+        self._then.append(command)
+        return self
+
+    def _run(self, world, parent_id=0):
+        parent = world.get_actor(self.parent_id) if self.parent_id is not None else None
+        actor = world.try_spawn_actor(self.blueprint, self.transform, parent)
+        if actor is None:
+            return Response(error='Spawn failed because of collision at spawn position')
+        for command in self._then:
+            command._run(world, actor.id)
+        return Response(actor.id)
+
+
+class DestroyActor(_Command):
+    def __init__(self, actor):
+        self.actor_id = actor if isinstance(actor, int) else actor.id
+
+    def _run(self, world, parent_id=0):
+        actor = world.get_actor(self.actor_id)
+        if actor is None:
+            return Response(self.actor_id, 'actor {} not found'.format(self.actor_id))
+        actor.destroy()
+        return Response(self.actor_id)
+
+
+class _ActorCommand(_Command):
+    def __init__(self, actor):
+        self.actor_id = actor if actor is FutureActor or isinstance(actor, int) else actor.id
+
+    def _target(self, world, parent_id):
+        actor_id = parent_id if self.actor_id is FutureActor else self.actor_id
+        return actor_id, world.get_actor(actor_id)
+
+    def _run(self, world, parent_id=0):
+        actor_id, actor = self._target(world, parent_id)
+        if actor is None:
+            return Response(actor_id, 'actor {} not found'.format(actor_id))
+        self._apply(actor)
+        return Response(actor_id)
+
+    def _apply(self, actor):
+        raise NotImplementedError
+
+
+class ApplyVehicleControl(_ActorCommand):
+    def __init__(self, actor, control):
+        super(ApplyVehicleControl, self).__init__(actor)
+        self.control = control
+
+    def _apply(self, actor):
+        actor.apply_control(self.control)
+
+
+class ApplyWalkerControl(ApplyVehicleControl):
+    pass
+
+
+class ApplyTransform(_ActorCommand):
+    def __init__(self, actor, transform):
+        super(ApplyTransform, self).__init__(actor)
+        self.transform = transform
+
+    def _apply(self, actor):
+        actor.set_transform(self.transform)
+
+
+class ApplyTargetVelocity(_ActorCommand):
+    def __init__(self, actor, velocity):
+        super(ApplyTargetVelocity, self).__init__(actor)
+        self.velocity = velocity
+
+    def _apply(self, actor):
+        actor.set_target_velocity(self.velocity)
+
+
+class SetAutopilot(_ActorCommand):
+    def __init__(self, actor, enabled, port=8000):
+        super(SetAutopilot, self).__init__(actor)
+        self.enabled = enabled
+
+    def _apply(self, actor):
+        actor.set_autopilot(self.enabled)
+
+
+class SetSimulatePhysics(_ActorCommand):
+    def __init__(self, actor, enabled):
+        super(SetSimulatePhysics, self).__init__(actor)
+        self.enabled = enabled
+
+    def _apply(self, actor):
+        actor.set_simulate_physics(self.enabled)
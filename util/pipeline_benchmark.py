@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+End to end benchmark of the client side pipeline, on the offline world of util/fake_carla.
+
+Every stage runs in its own process and reports its wall time, CPU time, peak RSS and
+throughput:
+
+    scenario            ticks of Execute_scenario.execute_scenario (agents, sensor, features)
+    cross_entropy       samples of a CrossEntropy round, each run and scored by Execute_scenario
+    stl_scoring         recorded episode logs scored again with Execute_scenario.score_log
+    feature_conversion  feature files converted by convert_features.py
+
+The results are written as JSON. When a baseline file is given, the stages whose throughput
+dropped, or whose peak RSS grew, by more than the threshold are reported and the script
+exits with status 1. A missing baseline file is created from the results.
+
+    python pipeline_benchmark.py --out results.json --baseline baseline.json --threshold 0.1
+"""
+
+import argparse
+import contextlib
+import csv
+import datetime
+import glob
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
+        sys.version_info.major,
+        sys.version_info.minor,
+        'win-amd64' if os.name == 'nt' else 'linux-x86_64'))[0])
+except IndexError:
+    pass
+
+try:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/carla')
+except IndexError:
+    pass
+
+# The benchmark never needs a server, the offline module is used even if carla is installed
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'util', 'fake_carla'))
+
+import carla
+
+import numpy as np
+
+from agents.tools.episode_recording import EpisodeRecorder, EpisodeRecording
+from agents.tools.path_file import write_path
+
+
+# ==============================================================================
+# -- Episodes ------------------------------------------------------------------
+# ==============================================================================
+
+def closest_spawn_point(spawn_points, x, y, yaw):
+    """Index of the spawn point closest to (x, y) whose yaw is within 45 degrees of 'yaw'"""
+    def cost(index):
+        transform = spawn_points[index]
+        yaw_diff = abs((transform.rotation.yaw - yaw + 180.0) % 360.0 - 180.0)
+        return math.hypot(transform.location.x - x, transform.location.y - y) + (1e6 if yaw_diff > 45.0 else 0.0)
+    return min(range(len(spawn_points)), key=cost)
+
+
+def write_crossing_path(file_name, accel):
+    """Path file of an adversary crossing the middle row of the grid, with the same acceleration on every leg"""
+    points = [200, 204, 208, 212, 216, 219]
+    write_path(file_name, [(k, point, 0.0, accel) for k, point in enumerate(points)])
+
+
+def run_execute_scenario(client, path_file, seed, timer=None, score=False, record=False):
+    """
+    Runs a path file as Execute_scenario.game_loop does, on the offline world: the actors are
+    spawned, then Execute_scenario.execute_scenario runs the episode, and score_scenario scores
+    it if 'score'. With 'record', the episode is recorded as with --record. The 20x20 grid of
+    the path points is placed on a junction of the synthetic map, and the ego goes through it.
+    Only execute_scenario is timed by 'timer', when given.
+
+    execute_scenario writes its log to 'c:\\data\\log_file.csv', which is a file of the working
+    directory outside of Windows: the stages run in their work directory.
+
+        :return: (Scenario, EpisodeRecorder of the episode or None, number of ticks)
+    """
+    import Execute_scenario
+
+    args = argparse.Namespace(file=path_file, seed=seed, debug_score=False, no_features=False, record=None)
+    scenario = Execute_scenario.Scenario(args)
+    sim_world = client.get_world()
+    settings = sim_world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 0.05
+    sim_world.apply_settings(settings)
+
+    wmap = sim_world.get_map()
+    center = wmap.block_length
+    grid = Execute_scenario.Grid(center + 17.5, center - 17.5, center - 20.0, center + 20.0)
+    world = Execute_scenario.World(sim_world, args, grid)
+    try:
+        world.convert_points_to_locations(scenario)
+        spawn_points = wmap.get_spawn_points()
+        scenario.ego_start = closest_spawn_point(spawn_points, center - 30.0, center, 0.0)
+        scenario.ego_end = closest_spawn_point(spawn_points, center + 60.0, center, 0.0)
+
+        blueprints = sim_world.get_blueprint_library()
+        world.adversary = sim_world.try_spawn_actor(blueprints.filter('vehicle.diamondback.century')[0],
+                                                    carla.Transform(scenario.destination_array[0], carla.Rotation()))
+        world.ego = sim_world.try_spawn_actor(blueprints.filter('vehicle.dodge.charger_police')[0],
+                                              spawn_points[scenario.ego_start])
+        world.obstacle_sensor_ego = Execute_scenario.ObstacleSensor(world.ego)
+        # As in game_loop, the new actors are only part of the snapshots after a tick
+        for _ in range(30):
+            sim_world.tick()
+        if record:
+            world.recorder = EpisodeRecorder({'ego': world.ego, 'adversary': world.adversary})
+
+        with timer if timer is not None else contextlib.nullcontext():
+            Execute_scenario.execute_scenario(world, scenario, sim_world.get_spectator())
+        if score:
+            Execute_scenario.score_scenario(world, scenario)
+        return scenario, world.recorder, len(world.feature_vector)
+    finally:
+        world.destroy()
+
+
+def load_execute_scenario(workdir):
+    """Makes Execute_scenario.py importable, and the work directory the working directory"""
+    sys.path.append(os.path.join(REPO_ROOT, 'examples'))
+    os.chdir(workdir)
+
+
+# ==============================================================================
+# -- Stages --------------------------------------------------------------------
+# ==============================================================================
+
+class StageTimer(object):
+    """Context manager measuring the wall and CPU time of the timed part of a stage"""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall += time.perf_counter() - self._wall
+        self.cpu += time.process_time() - self._cpu
+        return False
+
+
+def stage_scenario(args, timer, workdir):
+    load_execute_scenario(workdir)
+    client = carla.Client('localhost', 2000)
+    rng = np.random.RandomState(args.seed)
+    ticks = 0
+    for k in range(args.episodes):
+        path_file = os.path.join(workdir, 'path{}.bin'.format(k))
+        write_crossing_path(path_file, rng.uniform(0.1, 0.3))
+        ticks += run_execute_scenario(client, path_file, args.seed + k, timer)[2]
+    return ticks, 'ticks'
+
+
+def stage_cross_entropy(args, timer, workdir):
+    load_execute_scenario(workdir)
+    sys.path.append(os.path.join(REPO_ROOT, 'Cross_Entropy'))
+    sys.path.append(REPO_ROOT)
+    from cross_entropy import CrossEntropy
+    from normal_distrib import NormalDistrib
+
+    client = carla.Client('localhost', 2000)
+    distribution = NormalDistrib(2, 1)
+    distribution.rng = np.random.default_rng(args.seed)
+    ce = CrossEntropy(args.samples, .1, 5, [distribution])
+    with timer, contextlib.redirect_stdout(io.StringIO()):
+        y = ce.draw_random_samples()
+        scores = np.empty(y.shape)
+        for i in range(np.shape(y)[0]):
+            path_file = os.path.join(workdir, 'sample{}.bin'.format(i))
+            write_crossing_path(path_file, max(float(y[i, 0]) / 10.0, 0.02))
+            scenario, _, _ = run_execute_scenario(client, path_file, args.seed + i, score=True)
+            scores[i, 0] = scenario.score
+        gamma, elites = ce.calculate_elite_bad(y, scores)
+        ce.update_parameters(elites)
+    return len(y), 'samples'
+
+
+def stage_stl_scoring(args, timer, workdir):
+    load_execute_scenario(workdir)
+    import Execute_scenario
+
+    client = carla.Client('localhost', 2000)
+    episodes = []
+    for k in range(args.episodes):
+        path_file = os.path.join(workdir, 'path{}.bin'.format(k))
+        write_crossing_path(path_file, 0.1 + 0.05 * (k % 3))
+        scenario, recorder, _ = run_execute_scenario(client, path_file, args.seed + k, record=True)
+        recording_file = os.path.join(workdir, 'episode{}.npz'.format(k))
+        recorder.save(recording_file, {'file': path_file, 'seed': scenario.seed, 'ego_start': int(scenario.ego_start),
+                                       'ego_end': int(scenario.ego_end), 'accident': scenario.accident,
+                                       'fault': scenario.fault})
+        episodes.append(EpisodeRecording(recording_file))
+
+    # The scoring of Execute_scenario.replay_scenario, on the loaded recordings
+    rows = 0
+    score_args = argparse.Namespace(file=None, debug_score=False)
+    with timer:
+        for recording in episodes:
+            scenario = Execute_scenario.Scenario.from_recording(score_args, recording.metadata)
+            log_rows = Execute_scenario.correct_log_rows(recording.log_rows(), recording.events['obstacle'])
+            Execute_scenario.score_log(scenario, recording.log_header, log_rows)
+            rows += len(log_rows)
+    return rows, 'rows'
+
+
+def write_feature_files(path, num_files, num_rows, seed):
+    """Feature files with the name and the columns written by Execute_scenario.py"""
+    header = ["Frame", "ego_loc_x", "ego_loc_y", "ego_velocity", "adv_loc_x", "adv_loc_y", "adv_velocity",
+              "ego_throttle", "ego_steer", "ego_brake", "adv_throttle", "adv_steer", "adv_brake", "seed"]
+    rng = np.random.RandomState(seed)
+    os.makedirs(path)
+    for k in range(num_files):
+        frame = int(rng.randint(min(100, num_rows - 1), num_rows))
+        file_name = f"features_path{k}_label{k % 2}_score{rng.uniform(-1, 2):8.6f}_frame{frame}.csv"
+        values = rng.uniform(-100.0, 100.0, (num_rows, len(header) - 2))
+        with open(os.path.join(path, file_name), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for i in range(num_rows):
+                writer.writerow([i] + list(values[i]) + [seed])
+
+
+def stage_feature_conversion(args, timer, workdir):
+    sys.path.append(os.path.join(REPO_ROOT, 'examples'))
+    import convert_features
+
+    path = os.path.join(workdir, 'features')
+    write_feature_files(path, args.files, args.rows, args.seed)
+    argv = sys.argv
+    sys.argv = ['convert_features.py', '--path', path]
+    try:
+        with timer, contextlib.redirect_stdout(io.StringIO()):
+            convert_features.main()
+    finally:
+        sys.argv = argv
+    return args.files, 'files'
+
+
+STAGES = {
+    'scenario': stage_scenario,
+    'cross_entropy': stage_cross_entropy,
+    'stl_scoring': stage_stl_scoring,
+    'feature_conversion': stage_feature_conversion,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process, None where the resource module is missing"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def run_stage(name, args, queue):
+    """Body of the process of a stage, puts its measurements in the queue"""
+    workdir = tempfile.mkdtemp(prefix='pipeline_benchmark_')
+    timer = StageTimer()
+    try:
+        count, unit = STAGES[name](args, timer, workdir)
+        result = {'status': 'ok', 'wall_s': timer.wall, 'cpu_s': timer.cpu, 'peak_rss_mb': peak_rss_mb(),
+                  'count': count, 'unit': unit}
+    except ImportError as error:
+        result = {'status': 'skipped', 'reason': str(error)}
+    except Exception as error:
+        result = {'status': 'error', 'reason': '{}: {}'.format(type(error).__name__, error)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    queue.put(result)
+
+
+def measure_stage(name, args):
+    """Runs a stage 'args.repeat' times, each in a new process, and keeps the median times"""
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(args.repeat):
+        queue = context.Queue()
+        process = context.Process(target=run_stage, args=(name, args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if result['status'] != 'ok':
+            return result
+        runs.append(result)
+
+    result = dict(runs[0])
+    result['wall_s'] = statistics.median(run['wall_s'] for run in runs)
+    result['cpu_s'] = statistics.median(run['cpu_s'] for run in runs)
+    if result['peak_rss_mb'] is not None:
+        result['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+    result['throughput_per_s'] = result['count'] / result['wall_s'] if result['wall_s'] > 0 else float('inf')
+    result['throughput_per_hour'] = 3600.0 * result['throughput_per_s']
+    result['repeat'] = args.repeat
+    return result
+
+
+# ==============================================================================
+# -- Baseline ------------------------------------------------------------------
+# ==============================================================================
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Returns the regressions of the results with respect to the baseline, as strings.
+    A stage regresses when its throughput is lower, or its peak RSS is higher, than the
+    baseline by more than 'threshold' (a fraction).
+    """
+    regressions = []
+    for name, result in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if result['status'] != 'ok' or reference is None or reference.get('status') != 'ok':
+            continue
+        if result['throughput_per_s'] < (1.0 - threshold) * reference['throughput_per_s']:
+            regressions.append('{}: throughput {:.2f} {}/s, baseline {:.2f} {}/s'.format(
+                name, result['throughput_per_s'], result['unit'], reference['throughput_per_s'], reference['unit']))
+        if result['peak_rss_mb'] is not None and reference.get('peak_rss_mb') is not None and \
+                result['peak_rss_mb'] > (1.0 + threshold) * reference['peak_rss_mb']:
+            regressions.append('{}: peak RSS {:.1f} MB, baseline {:.1f} MB'.format(
+                name, result['peak_rss_mb'], reference['peak_rss_mb']))
+    return regressions
+
+
+# ==============================================================================
+# -- main() --------------------------------------------------------------------
+# ==============================================================================
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=list(STAGES),
+        default=list(STAGES),
+        help='stages to run (default: all)')
+    argparser.add_argument(
+        '--episodes',
+        type=int,
+        default=5,
+        help='episodes of the scenario and STL stages (default: 5)')
+    argparser.add_argument(
+        '--samples',
+        type=int,
+        default=10,
+        help='samples of the cross entropy round (default: 10)')
+    argparser.add_argument(
+        '--files',
+        type=int,
+        default=100,
+        help='feature files to convert (default: 100)')
+    argparser.add_argument(
+        '--rows',
+        type=int,
+        default=400,
+        help='rows of every feature file (default: 400)')
+    argparser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='runs of every stage, the median times are kept (default: 3)')
+    argparser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='seed of the episodes and of the generated files (default: 0)')
+    argparser.add_argument(
+        '--out',
+        default='pipeline_benchmark.json',
+        help='file the results are written to (default: pipeline_benchmark.json)')
+    argparser.add_argument(
+        '--baseline',
+        default=None,
+        help='results to compare with, created from these results if it does not exist')
+    argparser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='relative change of a stage reported as a regression (default: 0.1)')
+    args = argparser.parse_args()
+
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'args': {key: value for key, value in vars(args).items() if key not in ('out', 'baseline')},
+        'stages': {},
+    }
+
+    print('{:<20}{:>10}{:>10}{:>10}{:>14}{:>16}'.format('stage', 'wall s', 'cpu s', 'rss MB', 'count', 'per hour'))
+    for name in args.stages:
+        result = measure_stage(name, args)
+        results['stages'][name] = result
+        if result['status'] != 'ok':
+            print('{:<20}{}: {}'.format(name, result['status'], result['reason']))
+            continue
+        rss = '{:10.1f}'.format(result['peak_rss_mb']) if result['peak_rss_mb'] is not None else '{:>10}'.format('-')
+        print('{:<20}{:10.2f}{:10.2f}{}{:>14}{:16.0f}'.format(
+            name, result['wall_s'], result['cpu_s'], rss, '{} {}'.format(result['count'], result['unit']),
+            result['throughput_per_hour']))
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to {}'.format(args.out))
+
+    if args.baseline is None:
+        return 0
+    if not os.path.exists(args.baseline):
+        shutil.copyfile(args.out, args.baseline)
+        print('No baseline found, {} created from these results'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    if not regressions:
+        print('No regression above {:.0%} with respect to {}'.format(args.threshold, args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())